@@ -0,0 +1,98 @@
+import logging
+from decimal import Decimal
+
+from sqlalchemy import func, case
+from sqlalchemy.orm.exc import StaleDataError
+
+from models import db, Portfolio, Holding, Transaction
+
+logger = logging.getLogger(__name__)
+
+AGGREGATES = ('realized_pnl_total', 'total_cost_basis', 'trade_count')
+
+# Holding.cost_basis and Transaction.realized_pnl are stored with 4 decimals, running totals follow the stored values
+COST_BASIS_SCALE = Decimal('0.0001')
+
+
+def holding_value(holding):
+    """Cost basis value of a holding as the database stores it (0 for a holding that is being deleted)"""
+    if holding is None:
+        return Decimal(0)
+    return Decimal(holding.quantity) * Decimal(holding.cost_basis).quantize(COST_BASIS_SCALE)
+
+
+def record_trade(portfolio, realized_pnl, cost_basis_change):
+    """Move a portfolio's running totals by one trade, inside the caller's DB transaction. The portfolio row is
+    already locked and versioned by the trade, so the totals are updated atomically with its cash balance."""
+    portfolio.realized_pnl_total = (portfolio.realized_pnl_total or 0) + Decimal(realized_pnl).quantize(COST_BASIS_SCALE)
+    portfolio.total_cost_basis = (portfolio.total_cost_basis or 0) + cost_basis_change
+    portfolio.trade_count = (portfolio.trade_count or 0) + 1
+
+
+def actual_aggregates(portfolio_id=None):
+    """portfolio id -> {realized_pnl_total, total_cost_basis, trade_count} recomputed from the transaction log
+    and the holdings, one grouped query each"""
+    trades = db.session.query(
+        Transaction.portfolio_id,
+        func.sum(case((Transaction.transaction_type == 'sell', Transaction.realized_pnl), else_=0)),
+        func.count(Transaction.id)
+    ).group_by(Transaction.portfolio_id)
+    costs = db.session.query(
+        Holding.portfolio_id, func.sum(Holding.quantity * Holding.cost_basis)
+    ).group_by(Holding.portfolio_id)
+    portfolios = db.session.query(Portfolio.id)
+    if portfolio_id is not None:
+        trades = trades.filter(Transaction.portfolio_id == portfolio_id)
+        costs = costs.filter(Holding.portfolio_id == portfolio_id)
+        portfolios = portfolios.filter(Portfolio.id == portfolio_id)
+
+    actual = {id: {'realized_pnl_total': Decimal(0), 'total_cost_basis': Decimal(0), 'trade_count': 0}
+              for (id,) in portfolios}
+    for id, realized, count in trades:
+        if id in actual:
+            actual[id]['realized_pnl_total'] = Decimal(str(realized or 0))
+            actual[id]['trade_count'] = count
+    for id, cost in costs:
+        if id in actual:
+            actual[id]['total_cost_basis'] = Decimal(str(cost or 0))
+    return actual
+
+
+def _drifts(portfolio, actual, tolerance):
+    drifts = []
+    for field in AGGREGATES:
+        stored = getattr(portfolio, field) or 0
+        if abs(Decimal(stored) - actual[field]) > (0 if field == 'trade_count' else tolerance):
+            drifts.append({'portfolio_id': portfolio.id, 'field': field, 'stored': stored, 'actual': actual[field]})
+    return drifts
+
+
+def reconcile_aggregates(portfolio_id=None, fix=True, tolerance=Decimal('0.01')):
+    """Compare every portfolio's running totals with the recomputed ones, returns the drifts found as
+    [{portfolio_id, field, stored, actual}]. With fix, each drifted portfolio is locked, recomputed again
+    (a trade may have landed in between) and written back in its own transaction."""
+    actual = actual_aggregates(portfolio_id)
+    drifts = []
+    for portfolio in Portfolio.query.filter(Portfolio.id.in_(list(actual))).order_by(Portfolio.id):
+        drifts.extend(_drifts(portfolio, actual[portfolio.id], tolerance))
+    db.session.rollback()
+
+    for drift in drifts:
+        logger.warning("Portfolio %s %s drifted: stored %s, recomputed %s",
+                       drift['portfolio_id'], drift['field'], drift['stored'], drift['actual'])
+    if not fix:
+        return drifts
+
+    for id in sorted({drift['portfolio_id'] for drift in drifts}):
+        portfolio = Portfolio.query.filter_by(id=id).with_for_update().populate_existing().first()
+        current = actual_aggregates(id).get(id)
+        if portfolio is None or current is None:
+            continue
+        for field in AGGREGATES:
+            setattr(portfolio, field, current[field])
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            logger.warning("Portfolio %s changed while it was reconciled, left for the next run", id)
+    return drifts
@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from models import Transaction
+from history import replay_daily_history, value_daily_history
+from price_store import load_price_series
+from snapshots import has_snapshots, snapshot_changes, opening_cash
+
+BENCHMARK = '^GSPC'
+TRADING_DAYS = 252
+
+
+def daily_history(portfolio, start_date, end_date, days, initial_cash=None):
+    """End-of-day valuation rows for the window, returns (rows, transactions processed).
+    Uses the precomputed snapshots when the portfolio has them, the transaction log otherwise. Both paths count
+    every trade up to the end of end_date and start from the same cash (opening_cash() unless initial_cash is given)."""
+    if initial_cash is None:
+        initial_cash = opening_cash(portfolio)
+    if has_snapshots(portfolio.id):
+        # Range scan over the precomputed end-of-day snapshots, then mark to market
+        changes, all_tickers, transaction_count = snapshot_changes(portfolio.id, start_date, end_date)
+        historical_data = load_price_series(all_tickers, start_date, end_date)
+        return value_daily_history(start_date, days, changes, historical_data, initial_cash), transaction_count
+
+    # Not backfilled yet, rebuild from the transaction log
+    # Get all transactions up to the end of end date (same cutoff as the snapshots), ordered by date
+    transactions = Transaction.query.filter(
+        Transaction.portfolio_id == portfolio.id,
+        Transaction.transaction_date < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    ).order_by(Transaction.transaction_date.asc(), Transaction.id.asc()).all()
+
+    # Closes come from the local price store, only missing date ranges are downloaded
+    all_tickers = list(set([t.ticker for t in transactions]))
+    historical_data = load_price_series(all_tickers, start_date, end_date)
+
+    # One streaming pass over the sorted transactions and the requested dates, valued in one vectorized step
+    return replay_daily_history(transactions, start_date, days, historical_data, initial_cash), len(transactions)
+
+
+def _finite(value, digits=6):
+    return round(float(value), digits) if np.isfinite(value) else None
+
+
+def performance_metrics(values, benchmark_closes=None, risk_free_rate=0.0):
+    """Risk / return figures for a daily series of portfolio values (trading days only), all computed on arrays.
+
+    The portfolio has no external deposits or withdrawals, so the time-weighted return is the product of the daily
+    returns. benchmark_closes (same days, NaN where missing) adds beta and correlation against the benchmark."""
+    values = np.asarray(values, dtype=np.float64)
+    result = {
+        'observations': int(len(values)),
+        'time_weighted_return': None,
+        'annualized_return': None,
+        'annualized_volatility': None,
+        'sharpe_ratio': None,
+        'max_drawdown': None,
+        'max_drawdown_start': None,
+        'max_drawdown_end': None,
+        'beta': None,
+        'correlation': None,
+        'benchmark_return': None
+    }
+    if len(values) < 2 or not np.all(values[:-1] > 0):
+        return result
+
+    returns = values[1:] / values[:-1] - 1
+    growth = np.prod(1 + returns)
+    years = len(returns) / TRADING_DAYS
+    result['time_weighted_return'] = _finite(growth - 1)
+    result['annualized_return'] = _finite(growth ** (1 / years) - 1) if growth > 0 else None
+
+    if len(returns) > 1:
+        volatility = returns.std(ddof=1) * np.sqrt(TRADING_DAYS)
+        excess = returns - risk_free_rate / TRADING_DAYS
+        result['annualized_volatility'] = _finite(volatility)
+        result['sharpe_ratio'] = _finite(excess.mean() / returns.std(ddof=1) * np.sqrt(TRADING_DAYS)) if volatility > 0 else None
+
+    # Drawdown against the running peak, the start is the peak before the deepest trough
+    peaks = np.maximum.accumulate(values)
+    drawdowns = values / peaks - 1
+    trough = int(np.argmin(drawdowns))
+    result['max_drawdown'] = _finite(drawdowns[trough])
+    result['max_drawdown_end'] = trough
+    result['max_drawdown_start'] = int(np.argmax(values[:trough + 1])) if trough else 0
+
+    if benchmark_closes is not None:
+        closes = np.asarray(benchmark_closes, dtype=np.float64)
+        benchmark_returns = closes[1:] / closes[:-1] - 1
+        both = np.isfinite(benchmark_returns) & np.isfinite(returns)
+        if both.sum() > 2:
+            portfolio_returns, benchmark_returns = returns[both], benchmark_returns[both]
+            variance = benchmark_returns.var(ddof=1)
+            if variance > 0:
+                result['beta'] = _finite(np.cov(portfolio_returns, benchmark_returns)[0, 1] / variance)
+            if portfolio_returns.std() > 0 and benchmark_returns.std() > 0:
+                result['correlation'] = _finite(np.corrcoef(portfolio_returns, benchmark_returns)[0, 1])
+            valid = closes[np.isfinite(closes)]
+            result['benchmark_return'] = _finite(valid[-1] / valid[0] - 1)
+
+    return result
+
+
+def portfolio_analytics(portfolio, days, risk_free_rate=0.0, benchmark=BENCHMARK):
+    """Analytics over the daily valuation series of the last days calendar days"""
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=days - 1)
+    rows, transaction_count = daily_history(portfolio, start_date, end_date, days)
+
+    # Returns are measured over trading days, weekends only repeat Friday's value
+    dates = start_date.toordinal() + np.arange(days)
+    trading = (dates + 6) % 7 < 5  # ordinal 1 (0001-01-01) is a Monday
+    values = np.array([row['portfolio_value'] for row in rows], dtype=np.float64)[trading]
+    trading_dates = dates[trading]
+
+    closes = load_price_series([benchmark], start_date, end_date).get(benchmark)
+    benchmark_closes = closes.asof(trading_dates) if closes is not None else None
+
+    metrics = performance_metrics(values, benchmark_closes, risk_free_rate)
+    for key in ('max_drawdown_start', 'max_drawdown_end'):
+        if metrics[key] is not None:
+            metrics[key] = datetime.fromordinal(int(trading_dates[metrics[key]])).strftime('%Y-%m-%d')
+
+    return {
+        'portfolio_id': portfolio.id,
+        'days_requested': days,
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': end_date.strftime('%Y-%m-%d'),
+        'benchmark': benchmark,
+        'risk_free_rate': risk_free_rate,
+        'total_transactions_processed': transaction_count,
+        'metrics': metrics
+    }
+
+
+# Finished analytics keyed by (portfolio, window, portfolio version, day). A trade bumps the portfolio's version,
+# so its old entries are never read again; ttl bounds how stale today's mark-to-market can get
+class AnalyticsCache:
+
+    def __init__(self, ttl=60, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (computed_at, result)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(portfolio, days):
+        return (portfolio.id, days, portfolio.version, datetime.now().date())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] >= self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, result):
+        with self._lock:
+            # Entries of older versions of the same portfolio / window are dead now
+            for old in [k for k in self._entries if k[:2] == key[:2] and k != key]:
+                del self._entries[old]
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+analytics_cache = AnalyticsCache()
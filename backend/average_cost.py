@@ -0,0 +1,15 @@
+# Average cost accounting shared by trade booking (apply_buy / apply_sell), the transaction replay behind the daily
+# history and the /simulate ledger. Plain arithmetic, so it works on Decimals, floats and numpy arrays alike;
+# dropping a position that was sold out is left to the caller, each of them stores positions its own way.
+
+
+def buy(quantity, total_cost, bought, price):
+    """Position after a buy: (quantity, total cost basis), the average cost per share is their ratio"""
+    return quantity + bought, total_cost + bought * price
+
+
+def sell(quantity, cost_basis, sold, price):
+    """Position after a sell at the average cost_basis per share: (quantity, total cost basis, realized P&L).
+    The remaining total cost basis drops by the sale value, not by the cost of the shares sold, the rule the
+    stored holdings have always followed."""
+    return quantity - sold, quantity * cost_basis - sold * price, sold * price - sold * cost_basis
@@ -0,0 +1,175 @@
+"""Benchmark for the /portfolio/daily-history replay.
+
+Compares the old per-day replay (every transaction re-applied for every date, closes found by
+scanning the whole price dict) against the streaming, vectorized replay in history.py on synthetic
+trade logs, and checks both give the same output.
+
+Run from the backend folder:  python benchmarks/bench_daily_history.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from history import replay_daily_history, PriceSeries
+
+TICKERS = ['AAPL', 'GOOGL', 'NFLX', 'AMZN', 'VOO', 'MSFT', 'NVDA', 'META']
+
+
+def make_transactions(count, end_date, span_days, seed=1):
+    """Random but valid buy/sell log spread over span_days, ordered by date"""
+    rng = random.Random(seed)
+    held = {}
+    transactions = []
+    start = datetime.combine(end_date, datetime.min.time()) - timedelta(days=span_days)
+    dates = sorted(start + timedelta(seconds=rng.randrange(span_days * 86400)) for _ in range(count))
+    for transaction_date in dates:
+        ticker = rng.choice(TICKERS)
+        price = Decimal(rng.randint(5000, 50000)) / 100
+        if held.get(ticker, 0) > 0 and rng.random() < 0.4:
+            quantity = Decimal(rng.randint(1, held[ticker]))
+            held[ticker] -= int(quantity)
+            transactions.append(SimpleNamespace(ticker=ticker, transaction_type='sell', price=price, quantity=quantity,
+                                                realized_pnl=Decimal(rng.randint(-5000, 5000)) / 100,
+                                                transaction_date=transaction_date))
+        else:
+            quantity = Decimal(rng.randint(1, 20))
+            held[ticker] = held.get(ticker, 0) + int(quantity)
+            transactions.append(SimpleNamespace(ticker=ticker, transaction_type='buy', price=price, quantity=quantity,
+                                                realized_pnl=None, transaction_date=transaction_date))
+    return transactions
+
+
+def make_closes(start_date, days):
+    """Weekday closes per ticker keyed by datetime, the shape history()['Close'].to_dict() used to have"""
+    closes = {}
+    for ticker in TICKERS:
+        closes[ticker] = {}
+        for n in range(days):
+            day = start_date + timedelta(n)
+            if day.weekday() < 5:
+                closes[ticker][datetime.combine(day, datetime.min.time())] = 100 + (day.toordinal() * 7 + len(ticker)) % 50
+    return closes
+
+
+def legacy_price(ticker, date, historical_data):
+    """The original linear scan in get_historical_price"""
+    if ticker not in historical_data:
+        return None
+    for day_offset in range(5):
+        check_date = date - timedelta(days=day_offset)
+        for price_date, price in historical_data[ticker].items():
+            if price_date.date() == check_date:
+                return float(price)
+    return None
+
+
+def legacy_replay(transactions, start_date, days, historical_data, initial_cash=100000):
+    """The original O(days x transactions) implementation of the endpoint"""
+    daily_snapshots = {}
+    for single_date in (start_date + timedelta(n) for n in range(days)):
+        relevant_transactions = [t for t in transactions if t.transaction_date.date() <= single_date]
+        cash = initial_cash
+        holdings = {}
+        for transaction in relevant_transactions:
+            ticker = transaction.ticker
+            quantity = float(transaction.quantity)
+            price = float(transaction.price)
+            if transaction.transaction_type == 'buy':
+                total_cost = quantity * price
+                cash -= total_cost
+                if ticker in holdings:
+                    new_quantity = holdings[ticker]['quantity'] + quantity
+                    new_total_cost = holdings[ticker]['total_cost_basis'] + total_cost
+                    holdings[ticker] = {'quantity': new_quantity, 'cost_basis': new_total_cost / new_quantity,
+                                        'total_cost_basis': new_total_cost}
+                else:
+                    holdings[ticker] = {'quantity': quantity, 'cost_basis': price, 'total_cost_basis': total_cost}
+            else:
+                cash += quantity * price
+                if ticker in holdings:
+                    remaining_quantity = holdings[ticker]['quantity'] - quantity
+                    if remaining_quantity > 0:
+                        old_total_value = holdings[ticker]['quantity'] * holdings[ticker]['cost_basis']
+                        new_total_value = old_total_value - (price * quantity)
+                        holdings[ticker] = {'quantity': remaining_quantity,
+                                            'cost_basis': new_total_value / remaining_quantity,
+                                            'total_cost_basis': new_total_value}
+                    else:
+                        del holdings[ticker]
+        holdings_value = 0
+        total_cost_basis = 0
+        for ticker, holding_info in holdings.items():
+            price = legacy_price(ticker, single_date, historical_data)
+            if price is None:
+                price = holding_info['cost_basis']
+            holdings_value += holding_info['quantity'] * price
+            total_cost_basis += holding_info['total_cost_basis']
+        portfolio_value = cash + holdings_value
+        unrealized_pnl = holdings_value - total_cost_basis
+        realized_pnl_up_to_date = 0
+        for transaction in relevant_transactions:
+            if transaction.transaction_type == 'sell':
+                realized_pnl_up_to_date += float(transaction.realized_pnl or 0)
+        combined_pnl = unrealized_pnl + realized_pnl_up_to_date
+        daily_snapshots[single_date] = {
+            'date': single_date.strftime('%Y-%m-%d'),
+            'portfolio_value': round(portfolio_value, 2),
+            'cash_balance': round(cash, 2),
+            'holdings_value': round(holdings_value, 2),
+            'total_cost_basis': round(total_cost_basis, 2),
+            'unrealized_pnl': round(unrealized_pnl, 2),
+            'realized_pnl': round(realized_pnl_up_to_date, 2),
+            'combined_pnl': round(combined_pnl, 2),
+            'holdings_count': len(holdings)
+        }
+    return [daily_snapshots[date] for date in sorted(daily_snapshots.keys())]
+
+
+def same_history(old, new):
+    # Vectorized sums may differ from the sequential ones in the last float bit, so allow a rounding cent
+    if len(old) != len(new):
+        return False
+    for old_day, new_day in zip(old, new):
+        for key, value in old_day.items():
+            if isinstance(value, str) or key == 'holdings_count':
+                if value != new_day[key]:
+                    return False
+            elif abs(value - new_day[key]) > 0.011:
+                return False
+    return True
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    days = 365
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=days - 1)
+
+    closes = make_closes(start_date, days)
+    series = {ticker: PriceSeries.from_closes(ticker_closes) for ticker, ticker_closes in closes.items()}
+
+    print(f"{'transactions':>12} {'legacy (s)':>12} {'streaming (s)':>14} {'speedup':>8}")
+    for count in (100, 1000, 5000, 20000, 100000):
+        transactions = make_transactions(count, end_date, span_days=3 * 365)
+        new, new_time = timed(lambda: replay_daily_history(transactions, start_date, days, series))
+        if count <= 5000:
+            old, old_time = timed(lambda: legacy_replay(transactions, start_date, days, closes))
+            assert same_history(old, new), f"streaming replay output differs from the legacy replay for {count} transactions"
+            print(f"{count:>12} {old_time:>12.4f} {new_time:>14.4f} {old_time / new_time:>7.1f}x")
+        else:
+            print(f"{count:>12} {'(skipped)':>12} {new_time:>14.4f} {'':>8}")
+
+
+if __name__ == '__main__':
+    main()
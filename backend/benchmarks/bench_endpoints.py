@@ -0,0 +1,183 @@
+"""Latency / throughput benchmark for the main read and trade endpoints.
+
+Seeds a throw-away SQLite database with N holdings built from M transactions and serves prices from the
+offline ReplayProvider (MARKET_DATA_PROVIDER=replay), so runs need no network and are repeatable. For each
+endpoint it reports sequential latency percentiles and the throughput of a few concurrent clients.
+
+Run from the backend folder:
+    python benchmarks/bench_endpoints.py [--holdings 50] [--transactions 5000] [--requests 200]
+    python benchmarks/bench_endpoints.py --save baseline.json        # record a baseline
+    python benchmarks/bench_endpoints.py --baseline baseline.json    # exit 1 if any p50 regressed
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import insert
+
+from aggregates import reconcile_aggregates
+from app import create_app
+from history import ReplayState
+from models import db, Portfolio, Holding, Transaction
+
+STARTING_CASH = 10 ** 9  # large enough that seeded and benchmark buys never run out
+
+
+def seed(holdings, transactions, days):
+    """One portfolio whose holdings are exactly what its transaction log adds up to"""
+    rng = random.Random(11)
+    tickers = [f"R{n:03d}" for n in range(holdings)]
+    start = datetime.now() - timedelta(days=days)
+    rows = []
+    for n in range(transactions):
+        ticker = tickers[n % holdings] if n < holdings else rng.choice(tickers)
+        rows.append({
+            'portfolio_id': 1,
+            'ticker': ticker,
+            'transaction_type': 'buy' if n < holdings or rng.random() < 0.7 else 'sell',
+            'price': rng.randint(2000, 50000) / 100,
+            'quantity': rng.randint(1, 5),
+            'realized_pnl': 0,
+            'transaction_date': start + timedelta(seconds=rng.randrange(days * 86400))
+        })
+    rows.sort(key=lambda row: row['transaction_date'])
+
+    # Drop sells that would go short, then book the realized P&L the trade endpoint would have
+    state = ReplayState(STARTING_CASH)
+    kept = []
+    for row in rows:
+        held = state.holdings.get(row['ticker'])
+        if row['transaction_type'] == 'sell':
+            if not held or held['quantity'] <= row['quantity']:
+                continue
+            row['realized_pnl'] = round((row['price'] - held['cost_basis']) * row['quantity'], 2)
+        state.apply(SimpleNamespace(**row))
+        kept.append(row)
+
+    db.session.execute(insert(Portfolio), [{'id': 1, 'name': 'Benchmark Portfolio', 'cash_balance': state.cash}])
+    db.session.execute(insert(Transaction), kept)
+    db.session.execute(insert(Holding), [
+        {'portfolio_id': 1, 'ticker': ticker, 'quantity': info['quantity'], 'cost_basis': info['cost_basis']}
+        for ticker, info in state.holdings.items()
+    ])
+    db.session.commit()
+    reconcile_aggregates(1)
+    return tickers, len(kept)
+
+
+def endpoints(tickers, days):
+    rng = random.Random(3)
+    return {
+        '/portfolio': lambda client: client.get('/portfolio'),
+        '/pnl': lambda client: client.get('/pnl'),
+        f'/portfolio/daily-history/{days}': lambda client: client.get(f'/portfolio/daily-history/{days}'),
+        '/trade': lambda client: client.post('/trade', json={
+            'portfolio_id': 1, 'ticker': rng.choice(tickers), 'quantity': 1, 'transaction_type': 'buy'}),
+    }
+
+
+def measure(app, request, count, threads):
+    client = app.test_client()
+    response = request(client)  # warm-up, also fills the quote cache / price store
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        request(client)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    def worker(n):
+        worker_client = app.test_client()
+        for _ in range(n):
+            request(worker_client)
+
+    pool = [threading.Thread(target=worker, args=(count // threads,)) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'throughput_rps': round(threads * (count // threads) / elapsed, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--holdings', type=int, default=50)
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=365, help='history window, also the span of seeded trades')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--threads', type=int, default=4, help='concurrent clients for the throughput run')
+    parser.add_argument('--latency', type=float, default=0, help='seconds of simulated upstream latency per call')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare p50 latencies against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 slowdown vs the baseline')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(folder, 'bench.db')}",
+            'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 30}},
+            'MARKET_DATA_PROVIDER': 'replay',
+            'MARKET_DATA_REPLAY_LATENCY': args.latency,
+            'SYMBOLS_RELOAD_INTERVAL': 0,
+            'SCHEMA_AUTO_CREATE': True,
+        })
+        with app.app_context():
+            tickers, seeded = seed(args.holdings, args.transactions, args.days)
+        print(f"{args.holdings} holdings from {seeded} transactions, {args.requests} requests per endpoint, "
+              f"{args.threads} clients for throughput")
+
+        results = {}
+        for name, request in endpoints(tickers, args.days).items():
+            results[name] = measure(app, request, args.requests, args.threads)
+            r = results[name]
+            print(f"  {name:<32} p50 {r['p50_ms']:8.2f} ms   p95 {r['p95_ms']:8.2f} ms   "
+                  f"mean {r['mean_ms']:8.2f} ms   {r['throughput_rps']:8.1f} req/s")
+
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [
+            f"{name}: p50 {result['p50_ms']} ms vs {baseline[name]['p50_ms']} ms"
+            for name, result in results.items()
+            if name in baseline and result['p50_ms'] > baseline[name]['p50_ms'] * (1 + args.tolerance)
+        ]
+        if regressions:
+            print(f"REGRESSIONS (more than {args.tolerance:.0%} slower than {args.baseline}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark for the holding / transaction indexes.
+
+Seeds a large transactions table in a throw-away SQLite database, times the hot-path queries
+with the indexes dropped, then runs the `flask migrate` upgrade and times them again.
+
+Run from the backend folder:  python benchmarks/bench_indexes.py [transaction count]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import func, insert, text
+
+from app import create_app
+from migrations import upgrade
+from models import db, Portfolio, Holding, Transaction
+
+PORTFOLIOS = 50
+TICKERS = [f"T{n:03d}" for n in range(200)]
+INDEXES = ['ix_holdings_portfolio_ticker', 'ix_transactions_portfolio_date', 'ix_transactions_portfolio_type_pnl']
+
+
+def seed(count):
+    rng = random.Random(7)
+    db.session.execute(insert(Portfolio), [{'id': p, 'name': f"Portfolio {p}", 'cash_balance': 100000} for p in range(1, PORTFOLIOS + 1)])
+    db.session.execute(insert(Holding), [
+        {'portfolio_id': p, 'ticker': ticker, 'quantity': 10, 'cost_basis': 100}
+        for p in range(1, PORTFOLIOS + 1) for ticker in TICKERS
+    ])
+    start = datetime.now() - timedelta(days=5 * 365)
+    batch = []
+    for _ in range(count):
+        sell = rng.random() < 0.4
+        batch.append({
+            'portfolio_id': rng.randint(1, PORTFOLIOS),
+            'ticker': rng.choice(TICKERS),
+            'transaction_type': 'sell' if sell else 'buy',
+            'price': rng.randint(1000, 50000) / 100,
+            'quantity': rng.randint(1, 20),
+            'realized_pnl': rng.randint(-5000, 5000) / 100 if sell else 0,
+            'transaction_date': start + timedelta(seconds=rng.randrange(5 * 365 * 86400))
+        })
+        if len(batch) == 10000:
+            db.session.execute(insert(Transaction), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Transaction), batch)
+    db.session.commit()
+
+
+def hot_path_queries():
+    portfolio_id = PORTFOLIOS // 2
+    return {
+        'holding lookup (buy/sell)': lambda: Holding.query.filter_by(portfolio_id=portfolio_id, ticker='T100').first(),
+        'transactions by date': lambda: Transaction.query.filter_by(portfolio_id=portfolio_id).order_by(
+            Transaction.transaction_date.asc()).all(),
+        'realized P&L sum (/pnl)': lambda: db.session.query(func.sum(Transaction.realized_pnl)).filter(
+            Transaction.portfolio_id == portfolio_id, Transaction.transaction_type == 'sell').scalar(),
+    }
+
+
+def run(label, repeat=20):
+    print(f"\n{label}")
+    for name, query in hot_path_queries().items():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            query()
+            db.session.rollback()
+        elapsed = (time.perf_counter() - started) / repeat * 1000
+        print(f"  {name:<28} {elapsed:9.3f} ms")
+
+
+def explain():
+    statements = {
+        'holding lookup': "SELECT id FROM holdings WHERE portfolio_id = 25 AND ticker = 'T100'",
+        'transactions by date': "SELECT * FROM transactions WHERE portfolio_id = 25 ORDER BY transaction_date",
+        'realized P&L sum': "SELECT sum(realized_pnl) FROM transactions WHERE portfolio_id = 25 AND transaction_type = 'sell'",
+    }
+    print("\nQuery plans")
+    for name, sql in statements.items():
+        plan = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        print(f"  {name:<22} {' / '.join(row[-1] for row in plan)}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as folder:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(folder, 'bench.db')}",
+            'SCHEMA_AUTO_CREATE': True
+        })
+        with app.app_context():
+            for name in INDEXES:
+                db.session.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            started = time.perf_counter()
+            seed(count)
+            print(f"Seeded {count} transactions / {PORTFOLIOS * len(TICKERS)} holdings in {time.perf_counter() - started:.1f}s")
+
+            run("Without indexes")
+            explain()
+
+            started = time.perf_counter()
+            upgrade()
+            print(f"\nMigration took {time.perf_counter() - started:.2f}s")
+
+            run("With indexes")
+            explain()
+            db.session.remove()
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Benchmark for resting limit / stop order evaluation.
+
+Part 1 rests N orders across T tickers in the in-memory OrderBook and feeds it random-walk price ticks,
+timing each tick against a naive scan of every open order; both must fire exactly the same orders.
+Part 2 runs the OrderMatcher end to end on a throw-away SQLite database: orders are loaded from the
+orders table, a fake price feed drives the ticks and every fill goes through the regular trade accounting.
+No network is used.
+
+Run from the backend folder:  python benchmarks/bench_order_book.py [--orders 50000] [--tickers 200] [--ticks 500]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import insert
+
+import market_data
+from aggregates import reconcile_aggregates
+from app import create_app
+from market_data import StaticProvider
+from models import db, Portfolio, Order
+from orders import OrderBook, OrderMatcher, LIMIT, STOP, FILLED, REJECTED, fires_below
+
+
+def random_orders(count, tickers, prices, rng):
+    orders = []
+    for order_id in range(1, count + 1):
+        ticker = rng.choice(tickers)
+        transaction_type = rng.choice(['buy', 'sell'])
+        order_type = rng.choice([LIMIT, STOP])
+        # Triggers on the side of the price where they rest, up to 20% away
+        distance = prices[ticker] * rng.uniform(0.001, 0.2)
+        below = fires_below(transaction_type, order_type)
+        trigger = round(prices[ticker] - distance if below else prices[ticker] + distance, 4)
+        orders.append((order_id, ticker, transaction_type, order_type, trigger))
+    return orders
+
+
+def walk(prices, rng, volatility=0.01):
+    return {ticker: round(price * (1 + rng.gauss(0, volatility)), 4) for ticker, price in prices.items()}
+
+
+def naive_crossed(open_orders, prices):
+    """Every open order checked on every tick"""
+    fired = []
+    for order_id, (ticker, transaction_type, order_type, trigger) in list(open_orders.items()):
+        price = prices.get(ticker)
+        if price is None:
+            continue
+        if (price <= trigger) if fires_below(transaction_type, order_type) else (price >= trigger):
+            fired.append(order_id)
+            del open_orders[order_id]
+    return fired
+
+
+def bench_book(count, ticker_count, ticks):
+    rng = random.Random(7)
+    tickers = [f"T{n:04d}" for n in range(ticker_count)]
+    prices = {ticker: rng.uniform(10, 500) for ticker in tickers}
+    orders = random_orders(count, tickers, prices, rng)
+
+    book = OrderBook()
+    started = time.perf_counter()
+    for order in orders:
+        book.add(*order)
+    load_seconds = time.perf_counter() - started
+    open_orders = {order_id: rest for order_id, *rest in orders}
+
+    book_times, naive_times, fired_total = [], [], 0
+    for _ in range(ticks):
+        prices = walk(prices, rng)
+
+        started = time.perf_counter()
+        fired = book.crossed(prices)
+        book_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        expected = naive_crossed(open_orders, prices)
+        naive_times.append(time.perf_counter() - started)
+
+        if sorted(order_id for order_id, _ in fired) != sorted(expected):
+            raise SystemExit("MISMATCH: the order book and the naive scan fired different orders")
+        fired_total += len(fired)
+
+    book_times.sort()
+    naive_times.sort()
+    print(f"{count} resting orders on {ticker_count} tickers, {ticks} ticks moving every ticker "
+          f"(loaded in {load_seconds * 1000:.1f} ms)")
+    print(f"  order book   mean {statistics.fmean(book_times) * 1e6:9.1f} us   "
+          f"p99 {book_times[int(len(book_times) * 0.99) - 1] * 1e6:9.1f} us per tick")
+    print(f"  naive scan   mean {statistics.fmean(naive_times) * 1e6:9.1f} us   "
+          f"p99 {naive_times[int(len(naive_times) * 0.99) - 1] * 1e6:9.1f} us per tick")
+    print(f"  {fired_total} orders fired, identical to the naive scan, {len(book)} still resting")
+
+
+def bench_matcher(count, ticks):
+    rng = random.Random(5)
+    tickers = ['AAPL', 'GOOGL', 'NFLX', 'AMZN', 'VOO', 'MSFT']
+    prices = {'AAPL': 150.0, 'GOOGL': 180.0, 'NFLX': 900.0, 'AMZN': 200.0, 'VOO': 305.0, 'MSFT': 520.0}
+    feed = StaticProvider({ticker: {'regularMarketPrice': price} for ticker, price in prices.items()})
+
+    with tempfile.TemporaryDirectory() as folder:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(folder, 'orders.db')}",
+            'SCHEMA_AUTO_CREATE': True,
+            'SYMBOLS_RELOAD_INTERVAL': 0,
+        })
+        market_data.set_provider(feed)
+        app.test_client().post('/setup')
+
+        with app.app_context():
+            portfolio = db.session.get(Portfolio, 1)
+            portfolio.cash_balance += Decimal(10 ** 6)
+            db.session.commit()
+            db.session.execute(insert(Order), [{
+                'portfolio_id': 1, 'ticker': ticker, 'transaction_type': transaction_type, 'order_type': order_type,
+                'quantity': rng.randint(1, 3), 'trigger_price': trigger, 'status': 'open', 'created_at': datetime.now()
+            } for _, ticker, transaction_type, order_type, trigger in random_orders(count, tickers, prices, rng)])
+            db.session.commit()
+
+            matcher = OrderMatcher(app)
+            started = time.perf_counter()
+            matcher.sync()
+            print(f"\nMatcher: {len(matcher.book)} orders loaded from the database in "
+                  f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+            tick_times, statuses = [], []
+            for _ in range(ticks):
+                prices = walk(prices, rng, volatility=0.005)
+                for ticker, price in prices.items():
+                    feed.set_price(ticker, price)
+                quotes = feed.get_infos(tickers)
+                started = time.perf_counter()
+                statuses.extend(status for _, status in matcher.on_quotes(quotes))
+                tick_times.append(time.perf_counter() - started)
+
+            tick_times.sort()
+            print(f"  {ticks} ticks: {statuses.count(FILLED)} fills and {statuses.count(REJECTED)} rejections booked, "
+                  f"mean {statistics.fmean(tick_times) * 1000:.2f} ms, max {tick_times[-1] * 1000:.2f} ms per tick "
+                  f"(including the fills' DB transactions)")
+            drifts = reconcile_aggregates(1, fix=False)
+            print("  portfolio totals match the transaction log" if not drifts else f"  DRIFT: {drifts}")
+            db.session.remove()
+            db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--tickers', type=int, default=200)
+    parser.add_argument('--ticks', type=int, default=500)
+    parser.add_argument('--matcher-orders', type=int, default=2000, help='orders for the end-to-end run')
+    args = parser.parse_args()
+
+    bench_book(args.orders, args.tickers, args.ticks)
+    bench_matcher(args.matcher_orders, min(args.ticks, 100))
+
+
+if __name__ == '__main__':
+    main()
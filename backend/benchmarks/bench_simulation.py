@@ -0,0 +1,88 @@
+"""Benchmark for /simulate: many what-if scenarios over one dates x tickers close matrix.
+
+Builds a random-walk close matrix (no database, no network), then evaluates the same batch of rebalancing and
+trade-list scenarios in process and over the spawned process pool with several worker counts, checking every
+run returns identical results. The pool only pays off with more than one CPU; its first use includes start up.
+
+Run from the backend folder:  python benchmarks/bench_simulation.py [--scenarios 500] [--days 2520] [--tickers 50]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from simulation import PERIODS, run_scenarios, simulate, _discard_pool, _executor
+
+
+def close_matrix(days, tickers, rng):
+    returns = rng.normal(0.0003, 0.012, size=(days, tickers))
+    closes = 100 * np.exp(np.cumsum(returns, axis=0))
+    # Business days from 2015 on, a few tickers list late
+    day_ordinals = np.busday_offset('2015-01-02', np.arange(days)).astype(np.int64) + date(1970, 1, 1).toordinal()
+    for col in range(0, tickers, 10):
+        closes[:days // 4, col] = np.nan
+    return day_ordinals, closes
+
+
+def scenarios(count, names, day_ordinals, rng):
+    batch = []
+    for number in range(count):
+        picked = rng.sample(names, rng.randint(2, 8))
+        if number % 2:
+            weights = {ticker: round(1 / len(picked), 6) for ticker in picked}
+            rule = {'weights': weights, 'every': rng.choice(list(PERIODS) + [5, 21]), 'fractional': bool(number % 3)}
+            batch.append({'name': f"rebalance {number}", 'trades': [], 'rebalance': rule, 'portfolio_id': None})
+        else:
+            trades = []
+            for ticker in picked:
+                bought = rng.randrange(len(day_ordinals) // 4, len(day_ordinals) - 1)
+                trades.append((int(day_ordinals[bought]), ticker, 50.0, None))
+                trades.append((int(day_ordinals[rng.randrange(bought, len(day_ordinals))]), ticker, -20.0, None))
+            batch.append({'name': f"trades {number}", 'trades': trades, 'rebalance': None, 'portfolio_id': None})
+    return batch
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', type=int, default=500)
+    parser.add_argument('--days', type=int, default=2520, help='trading days, 2520 is about ten years')
+    parser.add_argument('--tickers', type=int, default=50)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8])
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    names = [f"T{n:03d}" for n in range(args.tickers)]
+    day_ordinals, closes = close_matrix(args.days, args.tickers, np.random.default_rng(3))
+    batch = scenarios(args.scenarios, names, day_ordinals, rng)
+
+    one, _ = timed(lambda: simulate(batch[1], names, day_ordinals, closes, 100000))
+    print(f"{args.scenarios} scenarios, {args.days} days x {args.tickers} tickers, {os.cpu_count()} CPUs "
+          f"(one rebalancing scenario: {one * 1000:.1f} ms)")
+
+    seconds, (expected, _) = timed(lambda: run_scenarios(batch, names, day_ordinals, closes, 100000, workers=1))
+    print(f"  in process                 {seconds:7.2f} s")
+    for workers in args.workers:
+        cold, (results, processes) = timed(lambda: run_scenarios(batch, names, day_ordinals, closes, 100000, workers=workers))
+        warm, (results_again, _) = timed(lambda: run_scenarios(batch, names, day_ordinals, closes, 100000, workers=workers))
+        if results != expected or results_again != expected:
+            raise SystemExit(f"MISMATCH: the pool with {workers} workers returned different results")
+        print(f"  pool of {workers:<2} ({processes} used)      {warm:7.2f} s   first call {cold:7.2f} s")
+        _discard_pool(_executor(workers))
+    errors = sum('error' in result for result in expected)
+    print(f"  identical results on every run, {errors} scenarios reported an error")
+
+
+if __name__ == '__main__':
+    main()
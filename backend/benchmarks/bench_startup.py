@@ -0,0 +1,108 @@
+"""Startup benchmark: import time of the app and time to a ready create_app().
+
+Every measurement runs in a fresh interpreter, so module caches from earlier runs do not help. The
+"eager yfinance" rows import yfinance (and with it pandas) before the app, which is what every worker
+paid at start when market_data imported it at module load; "schema on start" is create_app() with the
+old db.create_all() on every start. Also lists the slowest imports from python -X importtime.
+
+Run from the backend folder:  python benchmarks/bench_startup.py [--runs 5] [--top 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+IMPORT_APP = """
+import json, sys, time
+started = time.perf_counter()
+{prelude}
+import app
+print(json.dumps({{'seconds': time.perf_counter() - started,
+                  'pandas': 'pandas' in sys.modules, 'yfinance': 'yfinance' in sys.modules}}))
+"""
+
+CREATE_APP = """
+import json, time
+started = time.perf_counter()
+{prelude}
+from app import create_app
+create_app({{'SQLALCHEMY_DATABASE_URI': {uri!r}, 'SCHEMA_AUTO_CREATE': {schema}, 'SYMBOLS_RELOAD_INTERVAL': 0}})
+print(json.dumps({{'seconds': time.perf_counter() - started}}))
+"""
+
+
+def run(code, *flags):
+    result = subprocess.run([sys.executable, *flags, '-c', code], cwd=BACKEND, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return result
+
+
+def median_seconds(code, runs):
+    samples = [json.loads(run(code).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+    return statistics.median(sample['seconds'] for sample in samples), samples[-1]
+
+
+def slowest_imports(top):
+    """(cumulative microseconds, module) of `import app` and the slowest modules it imports directly"""
+    stderr = run('import app', '-X', 'importtime').stderr
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # every nesting level indents the name by two spaces
+        # A module is reported after everything it imported, so the direct imports of app come right before it
+        if depth == 0 and name.strip() != 'app':
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            return [(int(cumulative), 'app')] + sorted(children, reverse=True)[:top]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per measurement')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    args = parser.parse_args()
+
+    try:
+        run('import yfinance')
+        eager = 'import yfinance'
+    except RuntimeError:
+        eager = None
+        print("yfinance is not installed, the eager import rows are skipped")
+
+    with tempfile.TemporaryDirectory() as folder:
+        uri = f"sqlite:///{os.path.join(folder, 'startup.db')}"
+        cases = [
+            ('import app', IMPORT_APP.format(prelude='')),
+            ('import app (eager yfinance)', eager and IMPORT_APP.format(prelude=eager)),
+            ('create_app()', CREATE_APP.format(prelude='', uri=uri, schema=False)),
+            ('create_app() (schema on start)', CREATE_APP.format(prelude='', uri=uri, schema=True)),
+            ('create_app() (eager yfinance, schema on start)', eager and CREATE_APP.format(prelude=eager, uri=uri, schema=True)),
+        ]
+        print(f"Median of {args.runs} fresh interpreters")
+        for name, code in cases:
+            if code is None:
+                continue
+            seconds, sample = median_seconds(code, args.runs)
+            loaded = ''
+            if 'pandas' in sample:
+                loaded = f"   pandas loaded: {sample['pandas']}, yfinance loaded: {sample['yfinance']}"
+            print(f"  {name:<48} {seconds * 1000:8.1f} ms{loaded}")
+
+    print("\nSlowest imports made by `import app` (cumulative):")
+    for microseconds, module in slowest_imports(args.top):
+        print(f"  {module:<32} {microseconds / 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
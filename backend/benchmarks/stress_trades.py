@@ -0,0 +1,133 @@
+"""Concurrent stress test for trade execution.
+
+Fires many parallel /trade and /trades/batch requests at one portfolio (local SQLite database,
+fixed prices from a StaticProvider, no network) and then checks the invariants that lost updates
+or double spends would break:
+
+  - cash never goes negative
+  - cash == starting cash - sum(buys) + sum(sells) over the transaction log
+  - every holding's quantity == bought - sold for that ticker, and there is one holding row per ticker
+  - every successful response is backed by exactly one transaction row
+  - the portfolio's running P&L / cost basis / trade count totals match a recomputation
+
+Run from the backend folder:  python benchmarks/stress_trades.py [workers] [trades per worker]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import func
+
+import market_data
+from aggregates import reconcile_aggregates
+from app import create_app
+from market_data import StaticProvider
+from models import db, Portfolio, Holding, Transaction
+
+PRICES = {'AAPL': 150.0, 'GOOGL': 180.0, 'NFLX': 900.0, 'AMZN': 200.0, 'VOO': 305.0, 'MSFT': 520.0}
+STARTING_CASH = Decimal('100000')
+
+
+def worker(app, count, seed, statuses, filled):
+    rng = random.Random(seed)
+    client = app.test_client()
+    for _ in range(count):
+        if rng.random() < 0.2:
+            orders = [{'ticker': rng.choice(list(PRICES)), 'quantity': rng.randint(1, 5),
+                       'transaction_type': rng.choice(['buy', 'sell'])} for _ in range(rng.randint(2, 5))]
+            response = client.post('/trades/batch', json={'portfolio_id': 1, 'orders': orders, 'mode': 'best_effort'})
+            statuses[f"batch {response.status_code}"] += 1
+            if response.status_code == 200:
+                filled[0] += response.get_json()['filled']
+        else:
+            response = client.post('/trade', json={'portfolio_id': 1, 'ticker': rng.choice(list(PRICES)),
+                                                   'quantity': rng.randint(1, 10),
+                                                   'transaction_type': rng.choice(['buy', 'buy', 'sell'])})
+            statuses[f"trade {response.status_code}"] += 1
+            if response.status_code == 200:
+                filled[0] += 1
+
+
+def check_invariants(seeded_transactions, filled):
+    failures = []
+    portfolio = db.session.get(Portfolio, 1)
+    cash = portfolio.cash_balance
+
+    buys = db.session.query(func.sum(Transaction.price * Transaction.quantity)).filter_by(transaction_type='buy').scalar() or 0
+    sells = db.session.query(func.sum(Transaction.price * Transaction.quantity)).filter_by(transaction_type='sell').scalar() or 0
+    expected_cash = STARTING_CASH - Decimal(buys) + Decimal(sells)
+    if cash < 0:
+        failures.append(f"cash went negative: {cash}")
+    if abs(cash - expected_cash) > Decimal('0.01'):
+        failures.append(f"cash {cash} != {expected_cash} from the transaction log")
+
+    for ticker in PRICES:
+        bought = db.session.query(func.sum(Transaction.quantity)).filter_by(ticker=ticker, transaction_type='buy').scalar() or 0
+        sold = db.session.query(func.sum(Transaction.quantity)).filter_by(ticker=ticker, transaction_type='sell').scalar() or 0
+        rows = Holding.query.filter_by(portfolio_id=1, ticker=ticker).all()
+        held = sum(h.quantity for h in rows)
+        if len(rows) > 1:
+            failures.append(f"{ticker}: {len(rows)} holding rows")
+        if held != Decimal(bought) - Decimal(sold):
+            failures.append(f"{ticker}: holding {held} != bought {bought} - sold {sold}")
+
+    new_transactions = Transaction.query.count() - seeded_transactions
+    if new_transactions != filled:
+        failures.append(f"{filled} successful orders but {new_transactions} new transactions")
+
+    for drift in reconcile_aggregates(1, fix=False):
+        failures.append(f"running {drift['field']} {drift['stored']} != recomputed {drift['actual']}")
+    return failures
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    per_worker = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    with tempfile.TemporaryDirectory() as folder:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(folder, 'stress.db')}",
+            'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 30}},
+        })
+        market_data.set_provider(StaticProvider({ticker: {'regularMarketPrice': price} for ticker, price in PRICES.items()}))
+        app.test_client().post('/setup')
+
+        with app.app_context():
+            seeded_transactions = Transaction.query.count()
+
+        statuses = Counter()
+        filled = [0]
+        threads = [threading.Thread(target=worker, args=(app, per_worker, seed, statuses, filled)) for seed in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        print(f"{workers} workers x {per_worker} requests in {elapsed:.2f}s ({workers * per_worker / elapsed:.0f} req/s)")
+        for status, count in sorted(statuses.items()):
+            print(f"  {status}: {count}")
+
+        with app.app_context():
+            failures = check_invariants(seeded_transactions, filled[0])
+            db.session.remove()
+            db.engine.dispose()
+
+    if failures:
+        print("INVARIANTS BROKEN:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"All invariants hold ({filled[0]} orders filled)")
+
+
+if __name__ == '__main__':
+    main()
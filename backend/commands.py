@@ -0,0 +1,66 @@
+import click
+from datetime import date, timedelta
+
+from models import Portfolio
+from snapshots import backfill_snapshots
+from migrations import upgrade
+from lots import rebuild_lots, LOT_METHODS
+from aggregates import reconcile_aggregates
+from market_data import get_provider, record_replay_file
+
+
+# Maintenance commands, run with `flask --app app <command>` from the backend folder
+def register_commands(app):
+
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Upgrade an existing database schema (new tables, indexes) in place"""
+        upgrade(echo=click.echo)
+        click.echo("Database is up to date")
+
+    @app.cli.command('backfill-snapshots')
+    @click.option('--portfolio-id', type=int, default=None, help='Only rebuild this portfolio (default: all)')
+    @click.option('--initial-cash', type=float, default=None, help='Cash the portfolio started with (default: derived from its live cash balance)')
+    def backfill_snapshots_command(portfolio_id, initial_cash):
+        """Rebuild the daily portfolio snapshots from the transaction log"""
+        query = Portfolio.query if portfolio_id is None else Portfolio.query.filter_by(id=portfolio_id)
+        for portfolio in query.all():
+            written = backfill_snapshots(portfolio.id, initial_cash)
+            click.echo(f"Portfolio {portfolio.id}: {written} daily snapshots written")
+
+    @app.cli.command('record-market-data')
+    @click.argument('tickers', nargs=-1, required=True)
+    @click.option('--days', type=int, default=365, show_default=True, help='Days of daily bars to record')
+    @click.option('--out', 'path', default='market_data_replay.json', show_default=True, help='File to write')
+    def record_market_data_command(tickers, days, path):
+        """Record quotes and daily bars from the current provider for offline replay (MARKET_DATA_PROVIDER=replay)"""
+        tickers = [ticker.upper() for ticker in tickers]
+        end = date.today()
+        recording = record_replay_file(get_provider(), tickers, end - timedelta(days=days), end, path)
+        bars = sum(len(history) for history in recording['history'].values())
+        click.echo(f"Recorded {len(recording['infos'])} quotes and {bars} daily bars to {path}")
+
+    @app.cli.command('rebuild-lots')
+    @click.option('--portfolio-id', type=int, default=None, help='Only rebuild this portfolio (default: all)')
+    @click.option('--method', type=click.Choice([m for m in LOT_METHODS if m != 'specific']), default=None,
+                  help='Order sells consumed lots in (default: the LOT_METHOD config)')
+    def rebuild_lots_command(portfolio_id, method):
+        """Re-derive tax lots and per-lot realized P&L from the transaction log"""
+        lots, closures = rebuild_lots(portfolio_id, method)
+        click.echo(f"{lots} lots and {closures} lot closures written")
+
+    @app.cli.command('reconcile-aggregates')
+    @click.option('--portfolio-id', type=int, default=None, help='Only check this portfolio (default: all)')
+    @click.option('--dry-run', is_flag=True, help='Report drift without correcting it')
+    def reconcile_aggregates_command(portfolio_id, dry_run):
+        """Recompute the portfolios' running P&L / cost basis / trade count totals and report (and fix) any drift"""
+        drifts = reconcile_aggregates(portfolio_id, fix=not dry_run)
+        for drift in drifts:
+            click.echo(f"Portfolio {drift['portfolio_id']} {drift['field']}: stored {drift['stored']}, "
+                       f"recomputed {drift['actual']}")
+        if not drifts:
+            click.echo("All portfolio totals match the transaction log")
+        elif dry_run:
+            raise SystemExit(1)
+        else:
+            click.echo(f"{len(drifts)} drifted totals corrected")
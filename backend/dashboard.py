@@ -0,0 +1,201 @@
+from sqlalchemy import func
+
+from models import db, Portfolio, Holding
+from market_data import get_quotes, price_of
+
+DASHBOARD_SECTIONS = ('portfolio', 'pnl', 'sectors')
+
+
+# Holdings of a portfolio loaded and priced once, every dashboard section is derived from it
+class PortfolioSnapshot:
+
+    def __init__(self, portfolio, holdings, quotes):
+        self.portfolio = portfolio
+        self.cash_balance = float(portfolio.cash_balance)
+        self.quotes = quotes
+        self.positions = []
+        for holding in holdings:
+            current_price = price_of(quotes, holding.ticker)
+            quantity = float(holding.quantity)
+            cost_basis = float(holding.cost_basis)
+            market_value = quantity * current_price
+            cost_basis_value = quantity * cost_basis
+            self.positions.append({
+                'holding': holding,
+                'quantity': quantity,
+                'cost_basis': cost_basis,
+                'current_price': current_price,
+                'market_value': market_value,
+                'cost_basis_value': cost_basis_value,
+                'unrealized_pnl': market_value - cost_basis_value,
+                'stale': bool((quotes.get(holding.ticker.upper()) or {}).get('stale')),
+                'sector': (quotes.get(holding.ticker.upper()) or {}).get('sector', 'Unknown')
+            })
+
+    @classmethod
+    def load(cls, portfolio_id):
+        """One portfolio read, one holdings read and one batched price lookup, None if the portfolio does not exist"""
+        portfolio = Portfolio.query.filter_by(id=portfolio_id).first()
+        if not portfolio:
+            return None
+        holdings = Holding.query.filter_by(portfolio_id=portfolio.id).all()
+        return cls(portfolio, holdings, get_quotes([holding.ticker for holding in holdings]))
+
+    @classmethod
+    def load_many(cls, portfolio_ids):
+        """Snapshots of several portfolios from one portfolio read, one holdings read and one batched price lookup
+        over their distinct tickers, keyed by portfolio id (ids that do not exist are missing)"""
+        portfolios = Portfolio.query.filter(Portfolio.id.in_(portfolio_ids)).all()
+        holdings = {portfolio.id: [] for portfolio in portfolios}
+        for holding in Holding.query.filter(Holding.portfolio_id.in_(list(holdings))).all():
+            holdings[holding.portfolio_id].append(holding)
+        quotes = get_quotes(sorted({holding.ticker for rows in holdings.values() for holding in rows}))
+        return {portfolio.id: cls(portfolio, holdings[portfolio.id], quotes) for portfolio in portfolios}
+
+    def state(self):
+        """(portfolio version, held tickers) this snapshot was priced for, see portfolio_state()"""
+        return self.portfolio.version, [position['holding'].ticker for position in self.positions]
+
+    def stale(self):
+        """True when any holding is priced from a last known quote because upstream is unavailable"""
+        return any(position['stale'] for position in self.positions)
+
+    def total_value(self):
+        total_value = self.cash_balance
+        for position in self.positions:
+            total_value += position['market_value']
+        return total_value
+
+
+def portfolio_state(portfolio_id):
+    """(version, held tickers) of a portfolio from one query and without pricing anything, None if it does not exist.
+    Every trade bumps the version, so together with the quote cache's snapshot token it validates a priced view."""
+    rows = db.session.query(Portfolio.version, Holding.ticker).outerjoin(
+        Holding, Holding.portfolio_id == Portfolio.id
+    ).filter(Portfolio.id == portfolio_id).all()
+    if not rows:
+        return None
+    return rows[0][0], [ticker for _, ticker in rows if ticker is not None]
+
+
+def portfolio_view(snapshot):
+    """Body of /portfolio"""
+    return {
+        'id': snapshot.portfolio.id,
+        'name': snapshot.portfolio.name,
+        'cash_balance': round(snapshot.cash_balance, 2),
+        'holdings': [{
+            'id': position['holding'].id,
+            'ticker': position['holding'].ticker,
+            'quantity': position['quantity'],
+            'cost_basis': position['cost_basis'],
+            'current_price': position['current_price'],
+            'market_value': position['market_value'],
+            'unrealized_pnl': position['unrealized_pnl'],
+            'stale': position['stale']
+        } for position in snapshot.positions],
+        'total_value': round(snapshot.total_value(), 2),
+        'stale': snapshot.stale()
+    }
+
+
+def pnl_view(snapshot):
+    """Body of /pnl, realized P&L and cost basis come from the portfolio's running totals (no transaction scan).
+    Realized P&L is on the average cost basis, per tax lot figures are in /lots"""
+    total_market_value = 0
+    for position in snapshot.positions:
+        total_market_value += position['market_value']
+
+    portfolio = snapshot.portfolio
+    total_realized_pnl = float(portfolio.realized_pnl_total or 0)
+    total_cost_basis = float(portfolio.total_cost_basis or 0)
+    total_unrealized_pnl = total_market_value - total_cost_basis
+
+    return {
+        'total_unrealized_pnl': total_unrealized_pnl,
+        'total_realized_pnl': total_realized_pnl,
+        'realized_pnl_basis': 'average_cost',
+        'total_pnl': total_unrealized_pnl + total_realized_pnl,
+        'total_cost_basis': total_cost_basis,
+        'total_market_value': total_market_value,
+        'return_percentage': (total_unrealized_pnl / total_cost_basis * 100) if total_cost_basis > 0 else 0,
+        'trade_count': portfolio.trade_count or 0,
+        'stale': snapshot.stale()
+    }
+
+
+def sector_view(snapshot):
+    """Body of /portfolio/sector-breakdown: holdings value per sector as a share of the total portfolio value"""
+    total_value = snapshot.total_value()
+    sector_data = {}
+    for position in snapshot.positions:
+        sector_data[position['sector']] = sector_data.get(position['sector'], 0) + position['market_value']
+
+    sectors = []
+    for sector, value in sector_data.items():
+        if value > 0:  # Only include sectors with holdings
+            percentage = (value / total_value * 100) if total_value > 0 else 0
+            sectors.append({
+                'sector': sector,
+                'value': round(value, 2),
+                'percentage': round(percentage, 2)
+            })
+
+    # Sort by percentage (highest first)
+    sectors.sort(key=lambda x: x['percentage'], reverse=True)
+    return sectors
+
+
+def build_dashboard(snapshot, fields=DASHBOARD_SECTIONS):
+    """Any combination of the portfolio, pnl and sectors sections from one snapshot"""
+    views = {'portfolio': portfolio_view, 'pnl': pnl_view, 'sectors': sector_view}
+    return {field: views[field](snapshot) for field in fields}
+
+
+def portfolio_summaries(portfolio_ids=None, limit=1000, offset=0):
+    """Value of many portfolios from one aggregated SQL query (cash and running totals plus quantity per held
+    ticker) and one batched price lookup over the distinct tickers, ordered by portfolio id"""
+    page = db.session.query(Portfolio.id).order_by(Portfolio.id)
+    if portfolio_ids is not None:
+        page = page.filter(Portfolio.id.in_(portfolio_ids))
+    page = page.limit(limit).offset(offset).subquery()
+
+    rows = db.session.query(
+        Portfolio.id, Portfolio.name, Portfolio.cash_balance, Portfolio.total_cost_basis, Portfolio.realized_pnl_total,
+        Holding.ticker, func.sum(Holding.quantity)
+    ).join(page, page.c.id == Portfolio.id).outerjoin(
+        Holding, Holding.portfolio_id == Portfolio.id
+    ).group_by(
+        Portfolio.id, Portfolio.name, Portfolio.cash_balance, Portfolio.total_cost_basis, Portfolio.realized_pnl_total,
+        Holding.ticker
+    ).order_by(Portfolio.id).all()
+
+    quotes = get_quotes(sorted({row[5] for row in rows if row[5]}))
+
+    summaries = {}
+    for portfolio_id, name, cash_balance, total_cost_basis, realized_pnl_total, ticker, quantity in rows:
+        summary = summaries.get(portfolio_id)
+        if summary is None:
+            summary = summaries[portfolio_id] = {
+                'id': portfolio_id,
+                'name': name,
+                'cash_balance': float(cash_balance),
+                'holdings_count': 0,
+                'total_cost_basis': float(total_cost_basis or 0),
+                'total_realized_pnl': round(float(realized_pnl_total or 0), 2),
+                'total_market_value': 0.0,
+                'stale': False
+            }
+        if ticker is None or not quantity:
+            continue
+        quantity = float(quantity)
+        summary['holdings_count'] += 1
+        summary['total_market_value'] += quantity * price_of(quotes, ticker)
+        summary['stale'] = summary['stale'] or bool((quotes.get(ticker.upper()) or {}).get('stale'))
+
+    for summary in summaries.values():
+        summary['total_unrealized_pnl'] = round(summary['total_market_value'] - summary['total_cost_basis'], 2)
+        summary['total_value'] = round(summary['cash_balance'] + summary['total_market_value'], 2)
+        for key in ('cash_balance', 'total_cost_basis', 'total_market_value'):
+            summary[key] = round(summary[key], 2)
+    return list(summaries.values())
@@ -0,0 +1,35 @@
+# Production serving profile: gunicorn -c gunicorn.conf.py wsgi:app
+# Every setting can be overridden from the environment without editing this file.
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5001')
+
+# Threaded workers: views mostly wait on the database and upstream market data. Quote caches are per worker,
+# so prefer a few workers with many threads over many single-threaded workers. Each /stream/quotes client holds
+# a thread for as long as it is connected (an idle stream costs a thread stack, no database connection), so
+# threads are sized for the open browser tabs: the app lets streams use every thread but DB_POOL_SIZE of them
+# (STREAM_MAX_CONNECTIONS, 32 per worker by default) and answers 503 past that, clients then retry with backoff.
+# Raise GUNICORN_THREADS for more concurrent viewers, regular requests keep DB_POOL_SIZE threads either way.
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get('GUNICORN_THREADS', 40))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))  # above MARKET_DATA_TIMEOUT so slow upstream calls can fail cleanly
+graceful_timeout = 30
+keepalive = 5
+
+# Import the app (models, routes, symbol directory) once in the master, workers fork with it already loaded
+preload_app = True
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Connections, the market data event loop and background threads must not be shared with the master
+    from app import after_fork
+    from wsgi import app
+    after_fork(app)
+    server.log.info("Worker %s ready", worker.pid)
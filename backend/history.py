@@ -0,0 +1,207 @@
+import numpy as np
+from datetime import timedelta
+
+import average_cost
+
+
+# Running portfolio state while replaying transactions in date order
+class ReplayState:
+
+    def __init__(self, initial_cash=100000):
+        self.cash = initial_cash
+        self.holdings = {}  # ticker -> {quantity, cost_basis, total_cost_basis}
+        self.realized_pnl = 0
+
+    def apply(self, transaction):
+        """Apply one buy/sell with the average cost rules apply_buy / apply_sell book trades with"""
+        ticker = transaction.ticker
+        quantity = float(transaction.quantity)
+        price = float(transaction.price)
+        holdings = self.holdings
+
+        if transaction.transaction_type == 'buy':
+            total_cost = quantity * price
+            self.cash -= total_cost
+
+            if ticker in holdings:
+                # Update existing holding with weighted average cost
+                new_quantity, new_total_cost = average_cost.buy(holdings[ticker]['quantity'],
+                                                                holdings[ticker]['total_cost_basis'], quantity, price)
+                holdings[ticker] = {
+                    'quantity': new_quantity,
+                    'cost_basis': new_total_cost / new_quantity,  # Average cost per share
+                    'total_cost_basis': new_total_cost
+                }
+            else:
+                holdings[ticker] = {
+                    'quantity': quantity,
+                    'cost_basis': price,  # Average cost per share
+                    'total_cost_basis': total_cost
+                }
+
+        else:  # sell
+            self.cash += quantity * price
+
+            if ticker in holdings:
+                # Calculate updated cost basis based on average of all shares held
+                remaining_quantity, new_total_value, _ = average_cost.sell(holdings[ticker]['quantity'],
+                                                                           holdings[ticker]['cost_basis'], quantity, price)
+                if remaining_quantity > 0:
+                    holdings[ticker] = {
+                        'quantity': remaining_quantity,
+                        'cost_basis': new_total_value / remaining_quantity,  # Average cost per share
+                        'total_cost_basis': new_total_value
+                    }
+                else:
+                    # All shares sold, remove holding
+                    del holdings[ticker]
+
+            # Realized P&L is taken from the stored transaction, same as /pnl
+            self.realized_pnl += float(transaction.realized_pnl or 0)
+
+
+# Date-sorted, array-backed close series for one ticker, looked up with binary search
+class PriceSeries:
+
+    def __init__(self, dates, closes):
+        # dates are day ordinals (date.toordinal()), closes the matching closing prices
+        order = np.argsort(dates, kind='stable')
+        self.dates = np.asarray(dates, dtype=np.int64)[order]
+        self.closes = np.asarray(closes, dtype=np.float64)[order]
+
+    @classmethod
+    def from_closes(cls, closes):
+        """Build from a pandas Series / dict of timestamp -> close, e.g. history()['Close']"""
+        items = closes.items()
+        dates, values = [], []
+        for price_date, price in items:
+            dates.append(price_date.date().toordinal())
+            values.append(float(price))
+        return cls(dates, values)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def asof(self, days, max_lag=4):
+        """Close on or before each day ordinal, looking back at most max_lag days (NaN if none)"""
+        days = np.asarray(days, dtype=np.int64)
+        result = np.full(days.shape, np.nan)
+        if not len(self.dates):
+            return result
+        idx = np.searchsorted(self.dates, days, side='right') - 1
+        found = idx >= 0
+        idx = np.where(found, idx, 0)
+        found &= self.dates[idx] >= days - max_lag
+        result[found] = self.closes[idx[found]]
+        return result
+
+
+def replay_changes(transactions, start_date, days, initial_cash=100000):
+    """Yield (day, cash, realized_pnl, positions) for every day in the window on which something changed.
+
+    Transactions (sorted by date) and dates are walked together in a single O(transactions + days) pass.
+    positions only holds the tickers touched that day, mapped to their holding info or None once closed;
+    transactions before start_date are folded into day 0."""
+    state = ReplayState(initial_cash)
+    position = 0
+    for day in range(days):
+        single_date = start_date + timedelta(day)
+        # Carry the state forward with only the transactions that happened since the previous date
+        touched = set()
+        while position < len(transactions) and transactions[position].transaction_date.date() <= single_date:
+            state.apply(transactions[position])
+            touched.add(transactions[position].ticker)
+            position += 1
+
+        if touched or day == 0:
+            yield day, state.cash, state.realized_pnl, {ticker: state.holdings.get(ticker) for ticker in touched}
+
+
+def value_daily_history(start_date, days, changes, price_series, initial_cash=100000):
+    """Return one end-of-day snapshot per date from start_date, built from the sparse changes
+    produced by replay_changes() (or read back from stored snapshots).
+
+    The days x tickers quantity / cost matrices are forward filled from the last change of each position
+    and valued against the as-of closes from price_series (ticker -> PriceSeries) in one vectorized step.
+    Holdings without a close in the last 5 days are valued at cost basis."""
+    days = max(days, 0)
+    columns = {}
+    entries = []  # (day, col, quantity, cost_basis, total_cost_basis)
+    change_days, cash_values, realized_values = [], [], []
+
+    for day, cash, realized_pnl, positions in changes:
+        change_days.append(day)
+        cash_values.append(cash)
+        realized_values.append(realized_pnl)
+        for ticker, holding_info in positions.items():
+            col = columns.setdefault(ticker, len(columns))
+            if holding_info:
+                entries.append((day, col, holding_info['quantity'], holding_info['cost_basis'], holding_info['total_cost_basis']))
+            else:
+                entries.append((day, col, 0, 0, 0))
+
+    tickers = list(columns)
+    shape = (days, len(tickers))
+    quantity = np.zeros(shape)
+    cost_basis = np.zeros(shape)
+    total_cost = np.zeros(shape)
+    changed = np.zeros(shape, dtype=bool)
+    if entries:
+        rows, cols, quantities, costs, totals = (np.array(values) for values in zip(*entries))
+        rows = rows.astype(np.int64)
+        cols = cols.astype(np.int64)
+        quantity[rows, cols] = quantities
+        cost_basis[rows, cols] = costs
+        total_cost[rows, cols] = totals
+        changed[rows, cols] = True
+
+    # Forward fill every position from the last day it changed (-1 = never held so far)
+    last_change = np.where(changed, np.arange(days)[:, None], -1)
+    np.maximum.accumulate(last_change, axis=0, out=last_change)
+    rows = np.maximum(last_change, 0)
+    cols = np.arange(len(tickers))
+    held = (last_change >= 0) & (quantity[rows, cols] > 0)
+    quantity = np.where(held, quantity[rows, cols], 0)
+    cost_basis = np.where(held, cost_basis[rows, cols], 0)
+    total_cost = np.where(held, total_cost[rows, cols], 0)
+
+    # Cash and realized P&L carry forward the same way
+    last_state = np.full(days, -1)
+    last_state[np.array(change_days, dtype=np.int64)] = np.arange(len(change_days))
+    np.maximum.accumulate(last_state, out=last_state)
+    cash = np.append(np.array(cash_values, dtype=np.float64), initial_cash)[last_state]
+    realized = np.append(np.array(realized_values, dtype=np.float64), 0)[last_state]
+
+    # As-of join of every ticker's closes against the date axis, falling back to cost basis
+    day_ordinals = start_date.toordinal() + np.arange(days)
+    closes = np.empty(shape)
+    for col, ticker in enumerate(tickers):
+        series = price_series.get(ticker)
+        closes[:, col] = series.asof(day_ordinals) if series is not None else np.nan
+    prices = np.where(np.isnan(closes), cost_basis, closes)
+
+    holdings_value = (quantity * prices).sum(axis=1)
+    total_cost_basis = total_cost.sum(axis=1)
+    portfolio_value = cash + holdings_value
+    unrealized_pnl = holdings_value - total_cost_basis
+    combined_pnl = unrealized_pnl + realized
+    holdings_count = held.sum(axis=1)
+
+    return [{
+        'date': (start_date + timedelta(day)).strftime('%Y-%m-%d'),
+        'portfolio_value': round(float(portfolio_value[day]), 2),
+        'cash_balance': round(float(cash[day]), 2),
+        'holdings_value': round(float(holdings_value[day]), 2),
+        'total_cost_basis': round(float(total_cost_basis[day]), 2),
+        'unrealized_pnl': round(float(unrealized_pnl[day]), 2),
+        'realized_pnl': round(float(realized[day]), 2),
+        'combined_pnl': round(float(combined_pnl[day]), 2),
+        'holdings_count': int(holdings_count[day])
+    } for day in range(days)]
+
+
+def replay_daily_history(transactions, start_date, days, price_series, initial_cash=100000):
+    """Daily snapshots rebuilt straight from the transaction log (see replay_changes / value_daily_history)"""
+    days = max(days, 0)
+    changes = replay_changes(transactions, start_date, days, initial_cash)
+    return value_daily_history(start_date, days, changes, price_series, initial_cash)
@@ -0,0 +1,233 @@
+import io
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from symbols import symbol_directory
+
+# Histogram buckets in seconds, from a cached lookup to a slow multi-year history request
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class _Histogram:
+
+    def __init__(self, buckets):
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+
+# Minimal in-process Prometheus registry: labelled histograms and counters rendered in the text exposition format
+class Metrics:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # name -> {labels tuple: _Histogram}
+        self._counters = {}  # name -> {labels tuple: value}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, help_text='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            histogram = self._histograms.setdefault(name, {}).get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = _Histogram(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram.counts[i] += 1
+                    break
+            histogram.total += 1
+            histogram.sum += seconds
+
+    def increment(self, name, amount=1, help_text='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self, gauges=None):
+        """Prometheus text format, gauges is an optional name -> value map sampled at scrape time"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{self._labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{self._labels(key, [('le', '+Inf')])} {histogram.total}")
+                    lines.append(f"{name}_sum{self._labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{self._labels(key)} {histogram.total}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+# Symbols outside the directory that still get their own upstream latency series (the market indices)
+labelled_symbols = set()
+
+
+def symbol_label(symbol):
+    """Per-symbol label of a bounded set of series: directory listings and labelled_symbols, 'other' for the rest"""
+    return symbol if symbol in labelled_symbols or symbol in symbol_directory else 'other'
+
+
+# Per-request tally of where the time went, read back into the Server-Timing header
+class RequestTimings:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+
+
+def _current_timings():
+    return g.get('timings') if has_request_context() else None
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+@contextmanager
+def upstream_timer(method, symbols=()):
+    """Time one market data provider call. Batched calls are recorded once per symbol with the batch latency,
+    which is what a caller waiting on that symbol saw; symbols anyone can type in share the 'other' series."""
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        for symbol in symbols or ('',):
+            metrics.observe('upstream_request_duration_seconds', elapsed,
+                            'Market data provider call latency', method=method, symbol=symbol_label(symbol) if symbol else '')
+        if failed:
+            metrics.increment('upstream_errors_total', help_text='Failed market data provider calls', method=method)
+        timings = _current_timings()
+        if timings is not None:
+            timings.upstream_calls += 1
+            timings.upstream_seconds += elapsed
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    timings = _current_timings()
+    route = _route_label() if timings is not None else 'background'
+    metrics.observe('db_query_duration_seconds', elapsed, 'SQL statement latency', route=route)
+    if timings is not None:
+        timings.db_queries += 1
+        timings.db_seconds += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute, drop its start time so they do not pile up
+    if context.connection is not None and context.statement is not None:
+        started = context.connection.info.get('query_started')
+        if started:
+            started.pop()
+
+
+def _profiled(view):
+    """Run a view under a profiler and return its report instead of the response (opt-in, one request).
+    Uses the pyinstrument sampling profiler when it is installed, cProfile otherwise."""
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    if Profiler is not None:
+        profiler = Profiler(interval=0.0005)
+        profiler.start()
+        try:
+            view()
+        finally:
+            profiler.stop()
+        return Response(profiler.output_text(unicode=True, color=False), mimetype='text/plain')
+
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.runcall(view)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+    return Response(report.getvalue(), mimetype='text/plain')
+
+
+def init_instrumentation(app):
+    """Request hooks that time every request, count its SQL and upstream calls and report them
+    in a Server-Timing header and the /metrics histograms"""
+
+    @app.before_request
+    def start_timings():
+        g.timings = RequestTimings()
+        # ?profile=1 on any route returns a profile of that single request, only when PROFILING_ENABLED is set
+        if app.config.get('PROFILING_ENABLED') and request.args.get('profile') == '1' and request.endpoint:
+            view = app.view_functions[request.endpoint]
+            return _profiled(lambda: view(**(request.view_args or {})))
+
+    @app.after_request
+    def report_timings(response):
+        timings = g.get('timings')
+        if timings is None:
+            return response
+        elapsed = time.perf_counter() - timings.started
+        route = _route_label()
+        metrics.observe('http_request_duration_seconds', elapsed, 'Request latency by route',
+                        method=request.method, route=route, status=response.status_code)
+        metrics.increment('db_queries_total', timings.db_queries, 'SQL statements executed', route=route)
+
+        # Streamed bodies are still being produced here, their total covers the time to the first byte
+        app_seconds = max(elapsed - timings.db_seconds - timings.upstream_seconds, 0)
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={timings.db_seconds * 1000:.2f};desc="{timings.db_queries} queries"',
+            f'upstream;dur={timings.upstream_seconds * 1000:.2f};desc="{timings.upstream_calls} calls"',
+            f'app;dur={app_seconds * 1000:.2f}',
+            f'total;dur={elapsed * 1000:.2f}'
+        ])
+        response.headers['Timing-Allow-Origin'] = '*'  # let the cross-origin frontend read it in devtools
+        return response
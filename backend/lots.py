@@ -0,0 +1,271 @@
+import logging
+from collections import deque
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import and_, or_, insert
+
+from models import db, Lot, LotClosure, Transaction
+
+logger = logging.getLogger(__name__)
+
+FIFO = 'fifo'
+LIFO = 'lifo'
+SPECIFIC = 'specific'
+LOT_METHODS = (FIFO, LIFO, SPECIFIC)
+
+
+# Invalid lot selection on a sell, the message is safe to show to the user
+class LotError(ValueError):
+    pass
+
+
+def default_lot_method():
+    """Lot method of sells that do not name one and of lot rebuilds, LOT_METHOD in the app config"""
+    return current_app.config.get('LOT_METHOD', FIFO)
+
+
+def parse_lot_selection(data):
+    """Optional lot_method / lot_ids of a sell order, returns (method or None for the configured default, lot ids)"""
+    method = (data.get('lot_method') or '').lower() or None
+    lot_ids = data.get('lot_ids') or []
+    if method is not None and method not in LOT_METHODS:
+        raise LotError(f"lot_method must be one of {', '.join(LOT_METHODS)}")
+    if not isinstance(lot_ids, list) or not all(isinstance(lot_id, int) for lot_id in lot_ids):
+        raise LotError("lot_ids must be a list of lot ids")
+    if lot_ids and method in (None, SPECIFIC):
+        method = SPECIFIC
+    elif method == SPECIFIC:
+        raise LotError("lot_ids are required for specific lot identification")
+    return method, lot_ids
+
+
+# Open lot while a ledger is being replayed, remaining drops to 0 when the lot is fully sold
+class OpenLot:
+    __slots__ = ('id', 'ticker', 'transaction_id', 'acquired_at', 'quantity', 'remaining', 'cost_per_share')
+
+    def __init__(self, id, ticker, transaction_id, acquired_at, quantity, cost_per_share):
+        self.id = id
+        self.ticker = ticker
+        self.transaction_id = transaction_id
+        self.acquired_at = acquired_at
+        self.quantity = quantity
+        self.remaining = quantity
+        self.cost_per_share = cost_per_share
+
+
+# In-memory lot ledger: one deque of open lots per ticker in acquisition order. FIFO consumes from the left,
+# LIFO from the right, so a sell only touches the lots it closes. Lots closed by specific-ID sells stay in the
+# deque with nothing remaining and are dropped when they reach an end.
+class LotLedger:
+
+    def __init__(self, method=FIFO):
+        self.method = method
+        self._open = {}  # ticker -> deque of OpenLot
+        self._by_id = {}
+
+    def add(self, lot):
+        self._open.setdefault(lot.ticker, deque()).append(lot)
+        self._by_id[lot.id] = lot
+
+    def open_lots(self, ticker):
+        return [lot for lot in self._open.get(ticker, ()) if lot.remaining > 0]
+
+    def consume(self, ticker, quantity, method=None, lot_ids=()):
+        """Take quantity out of the ticker's lots, returns ([(lot, quantity taken)], quantity left uncovered)"""
+        method = method or self.method
+        taken = []
+        lots = self._open.get(ticker, deque())
+
+        if method == SPECIFIC:
+            for lot_id in lot_ids:
+                lot = self._by_id.get(lot_id)
+                if quantity <= 0 or lot is None or lot.ticker != ticker or lot.remaining <= 0:
+                    continue
+                take = min(lot.remaining, quantity)
+                lot.remaining -= take
+                quantity -= take
+                taken.append((lot, take))
+        else:
+            while quantity > 0 and lots:
+                lot = lots[0] if method == FIFO else lots[-1]
+                if lot.remaining > 0:
+                    take = min(lot.remaining, quantity)
+                    lot.remaining -= take
+                    quantity -= take
+                    taken.append((lot, take))
+                if lot.remaining <= 0:
+                    lots.popleft() if method == FIFO else lots.pop()
+                    self._by_id.pop(lot.id, None)
+        return taken, quantity
+
+
+def open_lot(portfolio, ticker, quantity, price, buy_transaction):
+    """Record the lot a buy opens, inside the caller's DB transaction"""
+    lot = Lot(
+        portfolio_id=portfolio.id,
+        ticker=ticker,
+        transaction=buy_transaction,
+        acquired_at=buy_transaction.transaction_date,
+        quantity=quantity,
+        remaining_quantity=quantity,
+        cost_per_share=price
+    )
+    db.session.add(lot)
+    return lot
+
+
+def _paged(query, newest_first, page_size=20):
+    # Lots in consumption order, read a page at a time so a sell stops reading once it is covered. Pages continue
+    # after the last (acquired_at, id) seen, so a deep lot stack costs one index range scan per page, not an OFFSET
+    if newest_first:
+        order = (Lot.acquired_at.desc(), Lot.id.desc())
+        after = lambda lot: or_(Lot.acquired_at < lot.acquired_at, and_(Lot.acquired_at == lot.acquired_at, Lot.id < lot.id))
+    else:
+        order = (Lot.acquired_at, Lot.id)
+        after = lambda lot: or_(Lot.acquired_at > lot.acquired_at, and_(Lot.acquired_at == lot.acquired_at, Lot.id > lot.id))
+    last = None
+    while True:
+        page = (query if last is None else query.filter(after(last))).order_by(*order).limit(page_size).all()
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+
+
+def close_lots(portfolio, ticker, quantity, price, sell_transaction, method=None, lot_ids=()):
+    """Consume the open lots a sell closes and record the realized P&L of each one, inside the caller's
+    DB transaction. Lots are read in consumption order and only until the sold quantity is covered.
+    The per-lot P&L is the tax lot view of the sell, the sell's own realized P&L stays on average cost."""
+    method = method or default_lot_method()
+    query = Lot.query.filter(Lot.portfolio_id == portfolio.id, Lot.ticker == ticker, Lot.remaining_quantity > 0)
+    if method == SPECIFIC:
+        lots = {lot.id: lot for lot in query.filter(Lot.id.in_(lot_ids)).all()}
+        missing = [lot_id for lot_id in lot_ids if lot_id not in lots]
+        if missing:
+            raise LotError(f"Lots {missing} are not open {ticker} lots of this portfolio")
+        if sum(lot.remaining_quantity for lot in lots.values()) < quantity:
+            raise LotError(f"Selected lots hold less than {quantity} shares of {ticker}")
+        candidates = (lots[lot_id] for lot_id in lot_ids)
+    else:
+        candidates = _paged(query, newest_first=method == LIFO)
+
+    closures = []
+    remaining = quantity
+    with db.session.no_autoflush:
+        for lot in candidates:
+            if remaining <= 0:
+                break
+            take = min(lot.remaining_quantity, remaining)
+            lot.remaining_quantity -= take
+            remaining -= take
+            closure = LotClosure(
+                lot=lot,
+                sell_transaction=sell_transaction,
+                portfolio_id=portfolio.id,
+                ticker=ticker,
+                quantity=take,
+                cost_per_share=lot.cost_per_share,
+                sale_price=price,
+                realized_pnl=(price - lot.cost_per_share) * take,
+                closed_at=sell_transaction.transaction_date
+            )
+            db.session.add(closure)
+            closures.append(closure)
+
+    if remaining > 0:
+        # Shares bought before lot tracking existed, `flask rebuild-lots` derives their lots from the transactions
+        logger.warning("Portfolio %s has no open lots for %s of %s shares sold", portfolio.id, remaining, ticker)
+    return closures
+
+
+def rebuild_lots(portfolio_id=None, method=None, batch_size=1000):
+    """Re-derive every lot and lot closure from the transaction log in one streaming pass ordered by
+    portfolio and date, consuming lots with method (default_lot_method() unless given). Existing lots of the
+    rebuilt portfolios are replaced. Returns (lots, closures) written."""
+    method = method or default_lot_method()
+    closures, lots = LotClosure.query, Lot.query
+    transactions = db.session.query(
+        Transaction.id, Transaction.portfolio_id, Transaction.ticker, Transaction.transaction_type,
+        Transaction.price, Transaction.quantity, Transaction.transaction_date
+    )
+    if portfolio_id is not None:
+        closures = closures.filter(LotClosure.portfolio_id == portfolio_id)
+        lots = lots.filter(Lot.portfolio_id == portfolio_id)
+        transactions = transactions.filter(Transaction.portfolio_id == portfolio_id)
+    closures.delete(synchronize_session=False)
+    lots.delete(synchronize_session=False)
+
+    transactions = transactions.order_by(
+        Transaction.portfolio_id, Transaction.transaction_date, Transaction.id
+    ).execution_options(yield_per=batch_size)
+
+    # Rows are written once the stream is exhausted, some drivers cannot run statements while a cursor streams.
+    # OpenLot ids are positions in lot_rows until the database has assigned the real ones.
+    lot_rows = []  # (row, OpenLot), the remaining quantity is read off the ledger at the end
+    closure_rows = []  # (row, OpenLot closed)
+    current_portfolio = None
+    ledger = None
+    for t in transactions:
+        if t.portfolio_id != current_portfolio:
+            current_portfolio = t.portfolio_id
+            ledger = LotLedger(method)
+
+        quantity = Decimal(t.quantity)
+        price = Decimal(t.price)
+        if t.transaction_type == 'buy':
+            lot = OpenLot(len(lot_rows), t.ticker, t.id, t.transaction_date, quantity, price)
+            ledger.add(lot)
+            lot_rows.append(({
+                'portfolio_id': t.portfolio_id, 'ticker': t.ticker, 'transaction_id': t.id,
+                'acquired_at': t.transaction_date, 'quantity': quantity, 'cost_per_share': price
+            }, lot))
+        else:
+            taken, uncovered = ledger.consume(t.ticker, quantity)
+            for lot, take in taken:
+                closure_rows.append(({
+                    'sell_transaction_id': t.id, 'portfolio_id': t.portfolio_id, 'ticker': t.ticker,
+                    'quantity': take, 'cost_per_share': lot.cost_per_share, 'sale_price': price,
+                    'realized_pnl': (price - lot.cost_per_share) * take, 'closed_at': t.transaction_date
+                }, lot))
+            if uncovered > 0:
+                logger.warning("Transaction %s sells %s more %s than was bought", t.id, uncovered, t.ticker)
+
+    # Lot ids come from the database (autoincrement), flushed a batch at a time and read back for the closures
+    lot_ids = []
+    for start in range(0, len(lot_rows), batch_size):
+        batch = [Lot(remaining_quantity=lot.remaining, **row) for row, lot in lot_rows[start:start + batch_size]]
+        db.session.add_all(batch)
+        db.session.flush()
+        lot_ids.extend(lot.id for lot in batch)
+        for lot in batch:
+            db.session.expunge(lot)
+    rows = [dict(row, lot_id=lot_ids[lot.id]) for row, lot in closure_rows]
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(LotClosure), rows[start:start + batch_size])
+    db.session.commit()
+    return len(lot_ids), len(rows)
+
+
+def lot_to_dict(lot):
+    return {
+        'id': lot.id,
+        'ticker': lot.ticker,
+        'acquired_at': lot.acquired_at.isoformat() if lot.acquired_at else None,
+        'quantity': float(lot.quantity),
+        'remaining_quantity': float(lot.remaining_quantity),
+        'cost_per_share': float(lot.cost_per_share)
+    }
+
+
+def closure_to_dict(closure):
+    return {
+        'lot_id': closure.lot_id,
+        'sell_transaction_id': closure.sell_transaction_id,
+        'ticker': closure.ticker,
+        'quantity': float(closure.quantity),
+        'cost_per_share': float(closure.cost_per_share),
+        'sale_price': float(closure.sale_price),
+        'realized_pnl': float(closure.realized_pnl),
+        'closed_at': closure.closed_at.isoformat() if closure.closed_at else None
+    }
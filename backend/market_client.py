@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+# Raised when an upstream call did not answer within its timeout
+class UpstreamTimeout(Exception):
+    pass
+
+
+# Asyncio client every upstream market data call goes through. A dedicated event loop thread schedules the
+# blocking yfinance calls onto a bounded pool, so one request can fetch many symbols concurrently, a slow symbol
+# only costs its own timeout, and a global semaphore caps in-flight upstream requests for the whole worker
+class AsyncMarketDataClient:
+
+    def __init__(self, max_in_flight=8, timeout=10):
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout  # seconds, per upstream call
+
+        self._loop = None
+        self._semaphore = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def configure(self, max_in_flight=None, timeout=None):
+        """Override the concurrency cap / timeout, e.g. from app config. A new cap applies to the next loop start"""
+        with self._lock:
+            if timeout is not None:
+                self.timeout = timeout
+            if max_in_flight is not None and max_in_flight != self.max_in_flight:
+                self.max_in_flight = max_in_flight
+                self._stop()
+
+    def reset_after_fork(self):
+        """In a forked worker: the parent's loop thread and pool threads do not exist here, start fresh on first use"""
+        self._lock = threading.Lock()
+        self._loop = None
+        self._semaphore = None
+        self._executor = None
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='market-data-io')
+                self._semaphore = asyncio.Semaphore(self.max_in_flight)
+                threading.Thread(target=loop.run_forever, name='market-data-loop', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _stop(self):
+        # Called with the lock held, in-flight calls on the old loop finish on their own
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._executor.shutdown(wait=False)
+            self._loop = None
+
+    async def call(self, fn, *args, timeout=None):
+        """Run one blocking upstream call under the global semaphore, raising UpstreamTimeout if it is too slow"""
+        timeout = self.timeout if timeout is None else timeout
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(
+                    asyncio.get_running_loop().run_in_executor(self._executor, fn, *args), timeout)
+            except asyncio.TimeoutError:
+                raise UpstreamTimeout(f"{getattr(fn, '__name__', 'upstream call')}{args} timed out after {timeout}s")
+
+    async def call_many(self, fn, keys, timeout=None):
+        """fn(key) for every key concurrently, returns key -> result or the exception it raised"""
+        keys = list(keys)
+        results = await asyncio.gather(*(self.call(fn, key, timeout=timeout) for key in keys), return_exceptions=True)
+        return dict(zip(keys, results))
+
+    def run(self, coroutine, timeout=None):
+        """Run a coroutine on the client loop from synchronous code (a Flask view) and wait for its result.
+        The caller blocks until it is done, so no request leaves calls behind: if the caller gives up (timeout, worker
+        shutdown) the future is cancelled here, calls still queued for a semaphore slot never go upstream. A blocking
+        call that already started cannot be interrupted, it finishes on its pool thread. Client disconnects are not
+        watched: a WSGI view gets no signal while it waits, and quote fetches are shared by every request waiting
+        on the same ticker."""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise UpstreamTimeout(f"Upstream calls did not finish within {timeout}s")
+        except BaseException:
+            future.cancel()
+            raise
+
+    def fetch(self, fn, *args):
+        """Blocking fn(*args) with the per-call timeout"""
+        return self.run(self.call(fn, *args), timeout=self.timeout + 1)
+
+    def fetch_many(self, fn, keys):
+        """Blocking fn(key) for many keys fetched concurrently, returns key -> result or exception"""
+        keys = list(keys)
+        waves = -(-len(keys) // self.max_in_flight)  # keys beyond the cap queue for a free slot
+        return self.run(self.call_many(fn, keys), timeout=self.timeout * max(waves, 1) + 1)
+
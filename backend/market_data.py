@@ -0,0 +1,370 @@
+import json
+import logging
+import math
+import random
+import time
+from datetime import date, timedelta
+
+from quote_cache import QuoteCache
+from market_client import AsyncMarketDataClient
+from resilience import TokenBucket, CircuitBreaker, UpstreamUnavailable
+from instrumentation import upstream_timer, labelled_symbols
+
+logger = logging.getLogger(__name__)
+
+# Market indices shown on the dashboard, always kept warm by the refresher
+MARKET_INDICES = [
+    {'name': 'Dow Jones', 'symbol': '^DJI'},
+    {'name': 'S&P 500', 'symbol': '^GSPC'},
+    {'name': 'NASDAQ', 'symbol': '^IXIC'},
+    {'name': 'Russell 2000', 'symbol': '^RUT'}
+]
+labelled_symbols.update(index['symbol'] for index in MARKET_INDICES)
+
+
+# Interface every market data source implements, routes never talk to yfinance directly
+class MarketDataProvider:
+
+    def get_info(self, ticker):
+        """Return the quote / company info dict for one ticker"""
+        raise NotImplementedError
+
+    def get_infos(self, tickers):
+        """Return a ticker -> info map for many tickers, tickers that fail are left out"""
+        infos = {}
+        for ticker in tickers:
+            try:
+                infos[ticker] = self.get_info(ticker)
+            except Exception as e:
+                logger.warning("Error fetching quote for %s: %s", ticker, e)
+        return infos
+
+    def get_history(self, ticker, start, end):
+        """Return daily bars for start <= date < end as a list of
+        {'date', 'open', 'high', 'low', 'close', 'volume'} dicts, oldest first"""
+        raise NotImplementedError
+
+    def get_histories(self, ranges):
+        """get_history() for many (ticker, start, end) ranges, returns range -> bars or the exception it raised"""
+        histories = {}
+        for ticker, start, end in ranges:
+            try:
+                histories[(ticker, start, end)] = self.get_history(ticker, start, end)
+            except Exception as e:
+                histories[(ticker, start, end)] = e
+        return histories
+
+
+# Live provider backed by yfinance, every call goes through the async client so it is concurrent,
+# time-limited and counted against the worker-wide cap on in-flight upstream requests
+class YFinanceProvider(MarketDataProvider):
+
+    def __init__(self, client=None):
+        self.client = client or AsyncMarketDataClient()
+
+    @staticmethod
+    def _yf():
+        # Imported on first use: yfinance pulls in pandas, which workers serving cached or replayed data never need
+        import yfinance
+        return yfinance
+
+    def _info(self, ticker):
+        return self._yf().Ticker(ticker).info
+
+    def _history(self, ticker, start, end):
+        return self._yf().Ticker(ticker).history(start=start, end=end)
+
+    def get_info(self, ticker):
+        return self.client.fetch(self._info, ticker)
+
+    def get_infos(self, tickers):
+        # yfinance has no multi-symbol .info call, so batches are fetched concurrently on the client loop
+        infos = {}
+        for ticker, result in self.client.fetch_many(self._info, tickers).items():
+            if isinstance(result, Exception):
+                logger.warning("Error fetching quote for %s: %s", ticker, result)
+            else:
+                infos[ticker] = result
+        return infos
+
+    def get_history(self, ticker, start, end):
+        return self._bars(self.client.fetch(self._history, ticker, start, end))
+
+    def get_histories(self, ranges):
+        histories = self.client.fetch_many(lambda key: self._history(*key), ranges)
+        return {key: hist if isinstance(hist, Exception) else self._bars(hist) for key, hist in histories.items()}
+
+    @staticmethod
+    def _bars(hist):
+        return [{
+            'date': timestamp.date(),
+            'open': float(row['Open']),
+            'high': float(row['High']),
+            'low': float(row['Low']),
+            'close': float(row['Close']),
+            'volume': int(row['Volume'])
+        } for timestamp, row in hist.iterrows()]
+
+
+# Provider wrapper that rate limits upstream calls and stops calling a failing upstream until it recovers.
+# Rejected calls fail fast with UpstreamUnavailable so pages render from stale data instead of waiting on timeouts
+class ResilientProvider(MarketDataProvider):
+
+    def __init__(self, provider, rate_limiter=None, breaker=None):
+        self.provider = provider
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self.breaker = breaker or CircuitBreaker()
+        self.rejected = 0
+
+    def _guarded(self, cost, call, failures=lambda result: 0):
+        """call() charged cost tokens (one per upstream call it makes), failures(result) counts the calls of a batch
+        that failed without raising"""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable("Market data provider unavailable (circuit open)")
+        if not self.rate_limiter.try_acquire(cost):
+            self.rejected += 1
+            self.breaker.release()  # not an upstream failure
+            raise UpstreamUnavailable("Market data rate limit reached")
+        try:
+            result = call()
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        failed = failures(result)
+        # A batch counts once per failed call when at least half of it failed, a few bad symbols in an otherwise
+        # answered batch do not mean upstream is down
+        if failed and failed * 2 >= cost:
+            self.breaker.record_failure(failed)
+        else:
+            self.breaker.record_success()
+        return result
+
+    def _batched(self, items, call, failures):
+        """call(chunk) -> dict over items split into chunks the token bucket can cover right now, so every upstream
+        call of a batch is charged; failures(chunk, result) counts the failed calls of a chunk. Once a chunk is
+        rejected the rest of the batch is left out (the quote cache serves it stale), only a batch rejected
+        outright raises UpstreamUnavailable."""
+        results = {}
+        position = 0
+        while position < len(items):
+            size = max(1, min(int(self.rate_limiter.capacity), int(self.rate_limiter.available())))
+            chunk = items[position:position + size]
+            try:
+                results.update(self._guarded(len(chunk), lambda: call(chunk), lambda result: failures(chunk, result)))
+            except UpstreamUnavailable:
+                if not results:
+                    raise
+                break
+            position += size
+        return results
+
+    def get_info(self, ticker):
+        return self._guarded(1, lambda: self.provider.get_info(ticker))
+
+    def get_infos(self, tickers):
+        # One upstream call per ticker, batches leave out the tickers that failed
+        return self._batched(list(tickers), self.provider.get_infos,
+                             failures=lambda chunk, infos: sum(ticker not in infos for ticker in chunk))
+
+    def get_history(self, ticker, start, end):
+        return self._guarded(1, lambda: self.provider.get_history(ticker, start, end))
+
+    def get_histories(self, ranges):
+        return self._batched(list(ranges), self.provider.get_histories,
+                             failures=lambda chunk, histories: sum(isinstance(h, Exception) for h in histories.values()))
+
+    def stats(self):
+        return dict(self.breaker.stats(), tokens_available=round(self.rate_limiter.available(), 2), rejected=self.rejected)
+
+
+# In-memory provider serving fixed quotes, handy for local testing without network access
+class StaticProvider(MarketDataProvider):
+
+    def __init__(self, infos=None, closes=None):
+        self.infos = {ticker.upper(): info for ticker, info in (infos or {}).items()}
+        self.closes = {ticker.upper(): dict(series) for ticker, series in (closes or {}).items()}  # ticker -> {date: close}
+        self.calls = 0
+
+    def set_price(self, ticker, price):
+        self.infos.setdefault(ticker.upper(), {})['regularMarketPrice'] = price
+
+    def get_info(self, ticker):
+        self.calls += 1
+        if ticker.upper() not in self.infos:
+            raise LookupError(f"Unknown ticker {ticker}")
+        return dict(self.infos[ticker.upper()])
+
+    def get_infos(self, tickers):
+        self.calls += 1
+        return {ticker: dict(self.infos[ticker.upper()]) for ticker in tickers if ticker.upper() in self.infos}
+
+    def get_history(self, ticker, start, end):
+        self.calls += 1
+        series = self.closes.get(ticker.upper(), {})
+        return [{'date': day, 'open': close, 'high': close, 'low': close, 'close': close, 'volume': 0}
+                for day, close in sorted(series.items()) if start <= day < end]
+
+
+REPLAY_SECTORS = ('Technology', 'Healthcare', 'Financial Services', 'Energy', 'Consumer Defensive')
+
+
+# Deterministic offline provider for benchmarks and load tests. Serves quotes / daily bars recorded to a JSON file
+# (see record_replay_file) and synthesizes a repeatable price path for any ticker the file does not cover
+class ReplayProvider(MarketDataProvider):
+
+    def __init__(self, path=None, seed=0, latency=0, today=None):
+        self.seed = seed
+        self.latency = latency  # seconds slept per call, to mimic upstream round trips
+        self.today = today  # pin "today" for fully reproducible quotes
+        self.infos = {}
+        self.bars = {}  # ticker -> {date: bar}
+        self.calls = 0
+        if path:
+            with open(path, encoding='utf-8') as f:
+                recording = json.load(f)
+            self.infos = {ticker.upper(): info for ticker, info in recording.get('infos', {}).items()}
+            for ticker, bars in recording.get('history', {}).items():
+                self.bars[ticker.upper()] = {date.fromisoformat(bar['date']): dict(bar, date=date.fromisoformat(bar['date']))
+                                             for bar in bars}
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _close(self, ticker, day):
+        # Same ticker, day and seed always give the same close, whatever range it is asked for in
+        rng = random.Random(f"{self.seed}:{ticker}")
+        base = rng.uniform(20, 500)
+        period = rng.uniform(60, 400)
+        phase = rng.uniform(0, 2 * math.pi)
+        noise = random.Random(f"{self.seed}:{ticker}:{day.toordinal()}").gauss(0, 0.01)
+        return round(base * (1 + 0.2 * math.sin(2 * math.pi * day.toordinal() / period + phase) + noise), 4)
+
+    def _bar(self, ticker, day):
+        recorded = self.bars.get(ticker)
+        if recorded is not None:
+            return recorded.get(day)
+        if day.weekday() >= 5:
+            return None
+        close = self._close(ticker, day)
+        return {'date': day, 'open': close, 'high': round(close * 1.01, 4), 'low': round(close * 0.99, 4),
+                'close': close, 'volume': random.Random(f"{self.seed}:{ticker}:{day.toordinal()}:v").randint(10**5, 10**7)}
+
+    def _info(self, ticker):
+        ticker = ticker.upper()
+        if ticker in self.infos:
+            return dict(self.infos[ticker])
+        today = self.today or date.today()
+        previous = today - timedelta(days=1)
+        while previous.weekday() >= 5:
+            previous -= timedelta(days=1)
+        price = self._close(ticker, today)
+        return {
+            'symbol': ticker,
+            'shortName': ticker,
+            'longName': f"{ticker} (replay)",
+            'sector': random.Random(f"{self.seed}:{ticker}").choice(REPLAY_SECTORS),
+            'regularMarketPrice': price,
+            'previousClose': self._close(ticker, previous),
+            'regularMarketDayHigh': round(price * 1.01, 4),
+            'regularMarketDayLow': round(price * 0.99, 4),
+            'regularMarketVolume': 1000000,
+            'marketCap': int(price * 10**9)
+        }
+
+    def get_info(self, ticker):
+        self._call()
+        return self._info(ticker)
+
+    def get_infos(self, tickers):
+        self._call()
+        return {ticker: self._info(ticker) for ticker in tickers}
+
+    def get_history(self, ticker, start, end):
+        self._call()
+        bars = []
+        day = start
+        while day < end:
+            bar = self._bar(ticker.upper(), day)
+            if bar:
+                bars.append(bar)
+            day += timedelta(days=1)
+        return bars
+
+
+def record_replay_file(provider, tickers, start, end, path):
+    """Capture quotes and daily bars from provider (e.g. the live one) into a file ReplayProvider can serve"""
+    recording = {'infos': provider.get_infos(tickers), 'history': {}}
+    for ticker in tickers:
+        recording['history'][ticker] = [dict(bar, date=bar['date'].isoformat())
+                                        for bar in provider.get_history(ticker, start, end)]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(recording, f, indent=1, default=str)
+    return recording
+
+
+# Shared by every provider instance in this worker, so the in-flight cap is global
+market_client = AsyncMarketDataClient()
+
+# Rate limit and circuit breaker in front of yfinance, quotes fall back to stale cache entries while they reject calls
+rate_limiter = TokenBucket()
+breaker = CircuitBreaker()
+
+_provider = ResilientProvider(YFinanceProvider(market_client), rate_limiter, breaker)
+
+
+def get_provider():
+    return _provider
+
+
+def provider_from_config(config):
+    """The provider named by MARKET_DATA_PROVIDER, 'yfinance' (default, live) or 'replay' (offline)"""
+    name = config.get('MARKET_DATA_PROVIDER') or 'yfinance'
+    if name == 'yfinance':
+        return ResilientProvider(YFinanceProvider(market_client), rate_limiter, breaker)
+    if name == 'replay':
+        return ReplayProvider(
+            path=config.get('MARKET_DATA_REPLAY_FILE'),
+            seed=config.get('MARKET_DATA_REPLAY_SEED', 0),
+            latency=config.get('MARKET_DATA_REPLAY_LATENCY', 0)
+        )
+    raise ValueError(f"Unknown MARKET_DATA_PROVIDER {name!r}, expected 'yfinance' or 'replay'")
+
+
+def set_provider(provider):
+    """Swap the market data source (e.g. for a local fake), cached quotes from the old one are dropped"""
+    global _provider
+    _provider = provider
+    quote_cache.invalidate()
+
+
+def _fetch_info(ticker):
+    with upstream_timer('get_info', [ticker]):
+        return get_provider().get_info(ticker)
+
+
+def _fetch_infos(tickers):
+    with upstream_timer('get_infos', tickers):
+        return get_provider().get_infos(tickers)
+
+
+def fetch_histories(ranges):
+    """Timed get_histories() on the current provider"""
+    with upstream_timer('get_histories', sorted({ticker for ticker, _, _ in ranges})):
+        return get_provider().get_histories(ranges)
+
+
+# One quote cache shared by every route, so polled tickers are not re-fetched on each request
+quote_cache = QuoteCache(fetch=_fetch_info, fetch_many=_fetch_infos)
+
+
+def get_quotes(tickers, max_age=None):
+    """Resolve every ticker a request needs in one batched lookup, returns ticker -> info"""
+    return quote_cache.get_many(tickers, max_age)
+
+
+def price_of(quotes, ticker):
+    """Current price out of a get_quotes() map, 0 when the ticker could not be priced"""
+    return (quotes.get(ticker.upper()) or {}).get('regularMarketPrice') or 0
@@ -0,0 +1,88 @@
+from sqlalchemy import inspect, func, text
+
+from models import db, Holding, Transaction
+from aggregates import AGGREGATES, reconcile_aggregates
+
+
+# Idempotent upgrade steps for databases created before the current models, run with `flask migrate`
+def merge_duplicate_holdings():
+    """Fold duplicate (portfolio_id, ticker) holdings into one row so the unique index can be built.
+    Returns the number of rows removed."""
+    duplicates = db.session.query(Holding.portfolio_id, Holding.ticker).group_by(
+        Holding.portfolio_id, Holding.ticker
+    ).having(func.count(Holding.id) > 1).all()
+
+    removed = 0
+    for portfolio_id, ticker in duplicates:
+        rows = Holding.query.filter_by(portfolio_id=portfolio_id, ticker=ticker).order_by(Holding.id).all()
+        keep = rows[0]
+        total_quantity = sum(h.quantity for h in rows)
+        total_cost = sum(h.quantity * h.cost_basis for h in rows)
+        for holding in rows[1:]:
+            Transaction.query.filter_by(holding_id=holding.id).update({'holding_id': keep.id})
+            db.session.delete(holding)
+            removed += 1
+        keep.quantity = total_quantity
+        keep.cost_basis = total_cost / total_quantity
+
+    db.session.commit()
+    return removed
+
+
+def add_missing_columns():
+    """Add columns declared on the models that existing tables do not have yet (needs a server default if NOT NULL)"""
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                connection.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_missing_indexes():
+    """Create every index declared on the models that the database does not have yet"""
+    inspector = inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        existing |= {constraint['name'] for constraint in inspector.get_unique_constraints(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+    return created
+
+
+def upgrade(echo=print):
+    """Bring an existing database up to the current models, safe to run repeatedly"""
+    db.create_all()  # tables that do not exist yet
+
+    added = add_missing_columns()
+    for name in added:
+        echo(f"Added column {name}")
+
+    # Running totals added to existing portfolios start at 0, fill them from the transaction log
+    if any(name.split('.')[1] in AGGREGATES for name in added if name.startswith('portfolios.')):
+        drifts = reconcile_aggregates()
+        echo(f"Filled running totals of {len({drift['portfolio_id'] for drift in drifts})} portfolios")
+
+    removed = merge_duplicate_holdings()
+    if removed:
+        echo(f"Merged {removed} duplicate holding rows")
+
+    for name in create_missing_indexes():
+        echo(f"Created index {name}")
@@ -11,11 +11,20 @@ class Portfolio(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255))
     cash_balance = db.Column(db.Numeric(10, 4))
+    # Bumped on every update, concurrent trades that read a stale row fail instead of overwriting each other
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Running totals kept by every trade so P&L reads never scan the transaction log,
+    # `flask reconcile-aggregates` recomputes them from the transactions and holdings
+    realized_pnl_total = db.Column(db.Numeric(18, 4), nullable=False, default=0, server_default='0')
+    total_cost_basis = db.Column(db.Numeric(18, 4), nullable=False, default=0, server_default='0')
+    trade_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Cascade delete for holdings and transactions to ensure they are removed when the portfolio is deleted
     holdings = db.relationship('Holding', backref='portfolio', cascade="all, delete-orphan")
     transactions = db.relationship('Transaction', backref='portfolio', cascade="all, delete-orphan")
 
+    __mapper_args__ = {'version_id_col': version}
+
 
 # Holding model to represent individual stock holdings in a portfolio, all rows are unique
 class Holding(db.Model):
@@ -25,14 +34,18 @@ class Holding(db.Model):
     ticker = db.Column(db.String(255), nullable=False)
     quantity = db.Column(db.Numeric(18, 8), nullable=False)
     cost_basis = db.Column(db.Numeric(10, 4), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     # Foreign key to link holding to a portfolio
     portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
 
-    # Ensure that quantity is always positive
+    # Ensure that quantity is always positive, and one row per ticker in a portfolio
+    # (the unique index also serves the holding lookup on every buy/sell)
     __table_args__ = (
         CheckConstraint('quantity > 0', name='check_quantity_positive'),
+        db.Index('ix_holdings_portfolio_ticker', 'portfolio_id', 'ticker', unique=True),
     )
+    __mapper_args__ = {'version_id_col': version}
 
 
 # Transaction model to record buy/sell actions
@@ -50,4 +63,125 @@ class Transaction(db.Model):
     holding_id = db.Column(db.Integer, db.ForeignKey('holdings.id'), nullable=True)
 
     # Foreign key to link transaction to a portfolio
-    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
\ No newline at end of file
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+
+    __table_args__ = (
+        # Transaction history / daily history: filter by portfolio, ordered by date
+        db.Index('ix_transactions_portfolio_date', 'portfolio_id', 'transaction_date'),
+        # Covers the realized P&L sum in /pnl without touching the table rows
+        db.Index('ix_transactions_portfolio_type_pnl', 'portfolio_id', 'transaction_type', 'realized_pnl'),
+    )
+
+# Tax lot opened by a buy, sells consume lots FIFO / LIFO / by id and record one LotClosure per lot touched
+class Lot(db.Model):
+    __tablename__ = 'lots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    ticker = db.Column(db.String(10), nullable=False)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=True)  # the opening buy
+    acquired_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    quantity = db.Column(db.Numeric(18, 8), nullable=False)
+    remaining_quantity = db.Column(db.Numeric(18, 8), nullable=False)
+    cost_per_share = db.Column(db.Numeric(10, 4), nullable=False)
+
+    transaction = db.relationship('Transaction')
+
+    __table_args__ = (
+        # Open lots of one ticker in acquisition order, the order FIFO / LIFO sells walk them in
+        db.Index('ix_lots_portfolio_ticker_acquired', 'portfolio_id', 'ticker', 'acquired_at'),
+    )
+
+
+# Part of a lot closed by a sell, realized P&L is (sale price - lot cost) x quantity for that lot
+class LotClosure(db.Model):
+    __tablename__ = 'lot_closures'
+
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('lots.id'), nullable=False)
+    sell_transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    ticker = db.Column(db.String(10), nullable=False)
+    quantity = db.Column(db.Numeric(18, 8), nullable=False)
+    cost_per_share = db.Column(db.Numeric(10, 4), nullable=False)
+    sale_price = db.Column(db.Numeric(10, 4), nullable=False)
+    realized_pnl = db.Column(db.Numeric(14, 4), nullable=False)
+    closed_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    lot = db.relationship('Lot')
+    sell_transaction = db.relationship('Transaction')
+
+    __table_args__ = (
+        db.Index('ix_lot_closures_portfolio_closed', 'portfolio_id', 'closed_at'),
+    )
+
+
+# Daily OHLC bar for a ticker, past closes never change so they are fetched once and kept locally
+class PriceHistory(db.Model):
+    __tablename__ = 'price_history'
+
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(20), nullable=False)
+    price_date = db.Column(db.Date, nullable=False)
+    open = db.Column(db.Numeric(12, 4))
+    high = db.Column(db.Numeric(12, 4))
+    low = db.Column(db.Numeric(12, 4))
+    close = db.Column(db.Numeric(12, 4), nullable=False)
+    volume = db.Column(db.BigInteger)
+
+    # One bar per ticker and day, also the lookup index for range reads
+    __table_args__ = (
+        db.UniqueConstraint('ticker', 'price_date', name='uq_price_history_ticker_date'),
+    )
+
+
+# Date range per ticker that has already been downloaded into price_history (weekends/holidays have no bars)
+class PriceHistoryCoverage(db.Model):
+    __tablename__ = 'price_history_coverage'
+
+    ticker = db.Column(db.String(20), primary_key=True)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+
+
+# End-of-day state of a portfolio, written on every trade so daily history does not have to replay transactions
+class PortfolioDailySnapshot(db.Model):
+    __tablename__ = 'portfolio_daily_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    snapshot_date = db.Column(db.Date, nullable=False)
+    cash_balance = db.Column(db.Numeric(18, 4), nullable=False)
+    realized_pnl = db.Column(db.Numeric(18, 4), nullable=False, default=0)  # cumulative up to this day
+    trade_count = db.Column(db.Integer, nullable=False, default=0)  # cumulative up to this day
+    # ticker -> {quantity, cost_basis, total_cost_basis} for every holding open at the end of the day
+    positions = db.Column(db.JSON, nullable=False, default=dict)
+
+    __table_args__ = (
+        db.UniqueConstraint('portfolio_id', 'snapshot_date', name='uq_snapshot_portfolio_date'),
+    )
+
+
+# Resting limit / stop order, filled through the regular buy / sell accounting when a price tick crosses its trigger
+class Order(db.Model):
+    __tablename__ = 'orders'
+
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    ticker = db.Column(db.String(20), nullable=False)
+    transaction_type = db.Column(db.String(10), nullable=False)  # buy / sell
+    order_type = db.Column(db.String(10), nullable=False)  # limit / stop
+    quantity = db.Column(db.Numeric(18, 8), nullable=False)
+    trigger_price = db.Column(db.Numeric(10, 4), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='open')  # open / filled / cancelled / rejected
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=datetime.now)
+    closed_at = db.Column(db.DateTime(timezone=True))
+    fill_price = db.Column(db.Numeric(10, 4))
+    reject_reason = db.Column(db.String(255))
+
+    __table_args__ = (
+        CheckConstraint('quantity > 0', name='check_order_quantity_positive'),
+        # Loading the book (open orders past the last id seen) and listing a portfolio's orders
+        db.Index('ix_orders_status_id', 'status', 'id'),
+        db.Index('ix_orders_portfolio_status', 'portfolio_id', 'status'),
+    )
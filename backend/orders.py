@@ -0,0 +1,262 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from models import db, Order
+from trading import TradeError, parse_order, execution_price, apply_buy, apply_sell, execute_trade
+
+logger = logging.getLogger(__name__)
+
+LIMIT = 'limit'
+STOP = 'stop'
+ORDER_TYPES = (LIMIT, STOP)
+
+OPEN = 'open'
+FILLED = 'filled'
+CANCELLED = 'cancelled'
+REJECTED = 'rejected'
+ORDER_STATUSES = (OPEN, FILLED, CANCELLED, REJECTED)
+
+# Orders committed by other workers can get ids below the last one a sync saw, re-read this many ids back
+SYNC_OVERLAP = 100
+
+
+def parse_resting_order(data):
+    """Validate a limit / stop order dict, returns (ticker, quantity, transaction_type, order_type, trigger_price)"""
+    ticker, quantity, transaction_type = parse_order(data)
+    order_type = (data.get('order_type') or '').lower()
+    if order_type not in ORDER_TYPES:
+        raise TradeError("order_type must be 'limit' or 'stop'")
+    try:
+        trigger_price = Decimal(str(data.get('trigger_price')))
+        if not trigger_price.is_finite() or trigger_price <= 0:
+            raise ValueError()
+    except (ValueError, TypeError, ArithmeticError):
+        raise TradeError("trigger_price must be a positive number")
+    return ticker, quantity, transaction_type, order_type, trigger_price
+
+
+def fires_below(transaction_type, order_type):
+    """Buy limits and sell stops trigger when the price falls to the trigger, sell limits and buy stops when it rises to it"""
+    return (transaction_type == 'buy') == (order_type == LIMIT)
+
+
+# In-memory book of resting orders: per ticker, a max-heap of the orders that fire when the price falls to their
+# trigger and a min-heap of those that fire when it rises to it. A tick only pops the orders it crossed, the
+# rest of the book is never looked at. Cancelled orders are dropped lazily when they surface at the top.
+class OrderBook:
+
+    def __init__(self):
+        self._below = {}  # ticker -> heap of (-trigger, seq, order id)
+        self._above = {}  # ticker -> heap of (trigger, seq, order id)
+        self._live = {}  # order id -> ticker
+        self._counts = {}  # ticker -> live orders
+        self._dead = 0  # cancelled entries still sitting in the heaps
+        self._seq = itertools.count()  # equal triggers fire in the order they were added
+        self._lock = threading.Lock()
+
+    def add(self, order_id, ticker, transaction_type, order_type, trigger_price):
+        with self._lock:
+            if order_id in self._live:
+                return
+            self._live[order_id] = ticker
+            self._counts[ticker] = self._counts.get(ticker, 0) + 1
+            if fires_below(transaction_type, order_type):
+                heapq.heappush(self._below.setdefault(ticker, []), (-float(trigger_price), next(self._seq), order_id))
+            else:
+                heapq.heappush(self._above.setdefault(ticker, []), (float(trigger_price), next(self._seq), order_id))
+
+    def discard(self, order_id):
+        with self._lock:
+            if self._release(order_id):
+                self._dead += 1
+                if self._dead > max(len(self._live), 1024):
+                    self._compact()
+
+    def crossed(self, prices):
+        """Pop every order a {ticker: price} tick crossed, returns [(order id, price)] in trigger order per ticker"""
+        fired = []
+        with self._lock:
+            for ticker, price in prices.items():
+                if not self._counts.get(ticker):
+                    continue
+                below = self._below.get(ticker)
+                while below and -below[0][0] >= price:
+                    order_id = heapq.heappop(below)[2]
+                    if self._release(order_id):
+                        fired.append((order_id, price))
+                    else:
+                        self._dead = max(self._dead - 1, 0)
+                above = self._above.get(ticker)
+                while above and above[0][0] <= price:
+                    order_id = heapq.heappop(above)[2]
+                    if self._release(order_id):
+                        fired.append((order_id, price))
+                    else:
+                        self._dead = max(self._dead - 1, 0)
+        return fired
+
+    def tickers(self):
+        with self._lock:
+            return list(self._counts)
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, order_id):
+        return order_id in self._live
+
+    def _release(self, order_id):
+        # Caller holds the lock, False when the order was not live
+        ticker = self._live.pop(order_id, None)
+        if ticker is None:
+            return False
+        self._counts[ticker] -= 1
+        if not self._counts[ticker]:
+            del self._counts[ticker]
+        return True
+
+    def _compact(self):
+        # Caller holds the lock, rebuild the heaps without the cancelled entries
+        for heaps in (self._below, self._above):
+            for ticker in list(heaps):
+                heap = [entry for entry in heaps[ticker] if entry[2] in self._live]
+                if heap:
+                    heapq.heapify(heap)
+                    heaps[ticker] = heap
+                else:
+                    del heaps[ticker]
+        self._dead = 0
+
+
+# Raised inside a fill's DB transaction when the order was closed by someone else first
+class _OrderClosed(Exception):
+    pass
+
+
+def fill_order(order_id, price):
+    """Execute a triggered order at price through the regular buy / sell accounting (execute_trade). The order is
+    claimed in the trade's DB transaction, so a cancel or another worker's fill that got there first wins and
+    nothing is booked; an order the account can no longer cover is rejected. Retryable trade errors (a portfolio busy
+    with other trades) leave the order open and are raised for the caller to try again.
+    Returns the order's new status, None when it was no longer open."""
+    order = db.session.get(Order, order_id)
+    if order is None or order.status != OPEN:
+        return None
+    apply = apply_buy if order.transaction_type == 'buy' else apply_sell
+
+    def claim(portfolio, result):
+        claimed = Order.query.filter_by(id=order_id, status=OPEN).update(
+            {'status': FILLED, 'fill_price': price, 'closed_at': datetime.now()}, synchronize_session=False)
+        if not claimed:
+            raise _OrderClosed()
+
+    try:
+        execute_trade(apply, order.portfolio_id, order.ticker, order.quantity, price, before_commit=claim)
+        return FILLED
+    except _OrderClosed:
+        return None
+    except TradeError as e:
+        # Only business errors (400: cash, shares, lots) close the order, a 409 / 503 is worth another tick
+        if e.status != 400:
+            raise
+        claimed = Order.query.filter_by(id=order_id, status=OPEN).update(
+            {'status': REJECTED, 'reject_reason': str(e)[:255], 'closed_at': datetime.now()}, synchronize_session=False)
+        db.session.commit()
+        return REJECTED if claimed else None
+
+
+# Keeps one worker's OrderBook in step with the orders table and fills what every price tick crosses.
+# Orders placed through this worker are added directly, sync() picks up the ones placed through other workers.
+class OrderMatcher:
+
+    def __init__(self, app, book=None, sync_interval=30):
+        self.app = app
+        self.book = book if book is not None else OrderBook()
+        self.sync_interval = sync_interval
+        self.fills = 0
+        self.rejections = 0
+        self._last_id = 0
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def add(self, order):
+        self.book.add(order.id, order.ticker, order.transaction_type, order.order_type, order.trigger_price)
+
+    def cancel(self, order_id):
+        self.book.discard(order_id)
+
+    def sync(self):
+        """Load open orders past the last id seen into the book, returns how many were added"""
+        with self._lock:
+            before = len(self.book)
+            rows = db.session.query(
+                Order.id, Order.ticker, Order.transaction_type, Order.order_type, Order.trigger_price
+            ).filter(Order.status == OPEN, Order.id > self._last_id - SYNC_OVERLAP).order_by(Order.id)
+            for row in rows.execution_options(yield_per=5000):
+                self.book.add(*row)
+                self._last_id = max(self._last_id, row.id)
+            self._synced_at = time.monotonic()
+            return len(self.book) - before
+
+    def sync_if_due(self):
+        """sync() at most once per sync_interval, a failed sync is not retried before the interval is over either"""
+        now = time.monotonic()
+        if self._synced_at is None or now - self._synced_at >= self.sync_interval:
+            self._synced_at = now
+            self.sync()
+
+    def on_quotes(self, quotes):
+        """Price tick (ticker -> quote info): fill every order whose trigger it crossed, returns [(order id, status)].
+        Only prices a trade may execute at count, stale quotes (upstream unavailable) never trigger anything."""
+        prices = {}
+        for ticker, info in quotes.items():
+            try:
+                prices[ticker] = execution_price(ticker, info)
+            except TradeError:
+                continue
+        fired = self.book.crossed(prices)
+        if not fired:
+            return []
+
+        results = []
+        with self.app.app_context():
+            for order_id, price in fired:
+                try:
+                    status = fill_order(order_id, price)
+                except Exception as e:
+                    # Still open in the database, back into the book so the next tick tries again
+                    db.session.rollback()
+                    logger.warning("Filling order %s failed: %s", order_id, e)
+                    order = db.session.get(Order, order_id)
+                    if order is not None and order.status == OPEN:
+                        self.add(order)
+                    continue
+                if status == FILLED:
+                    self.fills += 1
+                elif status == REJECTED:
+                    self.rejections += 1
+                results.append((order_id, status))
+            db.session.remove()
+        return results
+
+
+def order_to_dict(order):
+    return {
+        'id': order.id,
+        'portfolio_id': order.portfolio_id,
+        'ticker': order.ticker,
+        'transaction_type': order.transaction_type,
+        'order_type': order.order_type,
+        'quantity': str(order.quantity),
+        'trigger_price': str(order.trigger_price),
+        'status': order.status,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'closed_at': order.closed_at.isoformat() if order.closed_at else None,
+        'fill_price': str(order.fill_price) if order.fill_price is not None else None,
+        'reject_reason': order.reject_reason
+    }
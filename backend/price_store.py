@@ -0,0 +1,124 @@
+import logging
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+from models import db, PriceHistory, PriceHistoryCoverage
+from market_data import fetch_histories, get_quotes, price_of
+from history import PriceSeries
+
+logger = logging.getLogger(__name__)
+
+
+def missing_ranges(coverage, start_date, end_date):
+    """Date ranges (inclusive) not yet downloaded for a ticker, kept contiguous with what is already stored"""
+    if start_date > end_date:
+        return []
+    if coverage is None:
+        return [(start_date, end_date)]
+
+    ranges = []
+    if start_date < coverage.start_date:
+        ranges.append((start_date, coverage.start_date - timedelta(days=1)))
+    if end_date > coverage.end_date:
+        ranges.append((coverage.end_date + timedelta(days=1), end_date))
+    return ranges
+
+
+def sync_history(tickers, start_date, end_date):
+    """Download only the bars missing from the local store for each ticker and merge them in.
+    Only finished trading days are stored, today's bar is still moving. A range counts as covered once its download
+    succeeds, whatever bars came back: holidays and days before a listing have none and are not asked for again."""
+    last_complete_day = min(end_date, date.today() - timedelta(days=1))
+    coverage = {c.ticker: c for c in PriceHistoryCoverage.query.filter(PriceHistoryCoverage.ticker.in_(tickers)).all()}
+
+    # Every missing range of every ticker is downloaded concurrently, then merged in order
+    ranges = [(ticker, range_start, range_end + timedelta(days=1))
+              for ticker in tickers
+              for range_start, range_end in missing_ranges(coverage.get(ticker), start_date, last_complete_day)]
+    histories = fetch_histories(ranges) if ranges else {}
+
+    for ticker, range_start, range_stop in ranges:
+        range_end = range_stop - timedelta(days=1)
+        bars = histories.get((ticker, range_start, range_stop))
+        if isinstance(bars, Exception) or bars is None:
+            logger.warning("History download failed for %s %s - %s: %s", ticker, range_start, range_end, bars)
+            continue
+
+        # Replace anything already stored in the range so the merge stays idempotent
+        PriceHistory.query.filter(
+            PriceHistory.ticker == ticker,
+            PriceHistory.price_date.between(range_start, range_end)
+        ).delete(synchronize_session=False)
+        db.session.add_all(PriceHistory(
+            ticker=ticker,
+            price_date=bar['date'],
+            open=bar['open'],
+            high=bar['high'],
+            low=bar['low'],
+            close=bar['close'],
+            volume=bar['volume']
+        ) for bar in bars if range_start <= bar['date'] <= range_end)
+
+        # Missing ranges always adjoin the stored one, so coverage stays contiguous
+        cov = coverage.get(ticker)
+        if cov is None:
+            cov = coverage[ticker] = PriceHistoryCoverage(ticker=ticker, start_date=range_start, end_date=range_end)
+            db.session.add(cov)
+        else:
+            cov.start_date = min(cov.start_date, range_start)
+            cov.end_date = max(cov.end_date, range_end)
+
+        # Another worker syncing the same ticker may have stored the range first, its bars are just as good
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            coverage.pop(ticker, None)
+            logger.info("History of %s %s - %s was stored concurrently", ticker, range_start, range_end)
+        else:
+            logger.debug("Stored %s %s - %s (%d bars)", ticker, range_start, range_end, len(bars))
+
+
+def load_price_series(tickers, start_date, end_date):
+    """ticker -> PriceSeries of closes between start_date and end_date, served from the local store.
+    Repeated calls for an already stored window make no history requests, today's price comes from the quote cache."""
+    tickers = sorted(set(tickers))
+    series = {ticker: ([], []) for ticker in tickers}
+    if not tickers:
+        return {}
+
+    sync_history(tickers, start_date, end_date)
+
+    rows = db.session.query(PriceHistory.ticker, PriceHistory.price_date, PriceHistory.close).filter(
+        PriceHistory.ticker.in_(tickers),
+        PriceHistory.price_date.between(start_date, end_date)
+    ).order_by(PriceHistory.ticker, PriceHistory.price_date).all()
+    for ticker, price_date, close in rows:
+        series[ticker][0].append(price_date.toordinal())
+        series[ticker][1].append(float(close))
+
+    today = date.today()
+    if start_date <= today <= end_date:
+        quotes = get_quotes(tickers)
+        for ticker in tickers:
+            price = price_of(quotes, ticker)
+            if price and (not series[ticker][0] or series[ticker][0][-1] < today.toordinal()):
+                series[ticker][0].append(today.toordinal())
+                series[ticker][1].append(float(price))
+
+    return {ticker: PriceSeries(dates, closes) for ticker, (dates, closes) in series.items()}
+
+
+def load_close_matrix(tickers, start_date, end_date, max_lag=7):
+    """(sorted tickers, trading day ordinals, dates x tickers closes) for the window from the local store, with the same
+    incremental sync as load_price_series. The date axis is every day any of the tickers traded, a ticker
+    missing a day carries its previous close forward for up to max_lag days and is NaN before its first bar."""
+    series = load_price_series(tickers, start_date, end_date)
+    tickers = sorted(series)
+    days = np.unique(np.concatenate([s.dates for s in series.values()] or [np.array([], dtype=np.int64)]))
+    closes = np.empty((len(days), len(tickers)))
+    for col, ticker in enumerate(tickers):
+        closes[:, col] = series[ticker].asof(days, max_lag=max_lag)
+    return tickers, days, closes
@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """An in-progress upstream fetch that other callers can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Shared quote cache sitting in front of every yfinance .info lookup. One .info call returns the price together
+# with the company metadata (sector, longName...), so a whole entry lives as long as its price does
+class QuoteCache:
+
+    def __init__(self, fetch, fetch_many=None, price_ttl=15, max_entries=512):
+        self.fetch = fetch
+        self.fetch_many = fetch_many
+        self.price_ttl = price_ttl
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # ticker -> (fetched_at, info), oldest first
+        self._flights = {}  # ticker -> _Flight
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_served = 0
+
+    def configure(self, price_ttl=None, max_entries=None):
+        """Override the TTL / size limit, e.g. from app config"""
+        with self._lock:
+            if price_ttl is not None:
+                self.price_ttl = price_ttl
+            if max_entries is not None:
+                self.max_entries = max_entries
+                self._evict()
+
+    def get(self, ticker):
+        """Return the .info dict for a ticker, only going upstream if the cached copy is too old"""
+        ticker = ticker.upper()
+        ttl = self.price_ttl
+
+        with self._lock:
+            entry = self._entries.get(ticker)
+            if entry and time.monotonic() - entry[0] < ttl:
+                self._entries.move_to_end(ticker)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            flight = self._flights.get(ticker)
+            leader = flight is None
+            if leader:
+                flight = self._flights[ticker] = _Flight()
+
+        # Only one caller per ticker goes upstream, everyone else waits for its result
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            info = self.fetch(ticker) or {}
+            flight.result = info
+            with self._lock:
+                self._entries[ticker] = (time.monotonic(), info)
+                self._entries.move_to_end(ticker)
+                self._evict()
+            return info
+        except Exception as e:
+            # Upstream is failing: the last known good quote, flagged stale, beats an error page
+            with self._lock:
+                flight.result = self._stale(ticker)
+            if flight.result is None:
+                flight.error = e
+                raise
+            return flight.result
+        finally:
+            with self._lock:
+                self._flights.pop(ticker, None)
+            flight.event.set()
+
+    def get_many(self, tickers, max_age=None):
+        """Return a ticker -> .info map, resolving every miss in one bulk upstream call.
+        Tickers that could not be fetched fall back to their last known quote flagged 'stale': True,
+        or are left out of the result if there is none. max_age (seconds) tightens the TTL,
+        e.g. for a refresher that wants fresher data than regular readers."""
+        ttl = self.price_ttl if max_age is None else min(max_age, self.price_ttl)
+        result = {}
+        owned = {}  # tickers this call fetches itself
+        waiting = {}  # tickers someone else is already fetching
+
+        with self._lock:
+            now = time.monotonic()
+            for ticker in dict.fromkeys(t.upper() for t in tickers):
+                entry = self._entries.get(ticker)
+                if entry and now - entry[0] < ttl:
+                    self._entries.move_to_end(ticker)
+                    self.hits += 1
+                    result[ticker] = entry[1]
+                    continue
+
+                self.misses += 1
+                if ticker in self._flights:
+                    waiting[ticker] = self._flights[ticker]
+                else:
+                    owned[ticker] = self._flights[ticker] = _Flight()
+
+        if owned:
+            fetched = {}
+            error = None
+            try:
+                if self.fetch_many:
+                    fetched = self.fetch_many(list(owned)) or {}
+                else:
+                    fetched = {ticker: self.fetch(ticker) or {} for ticker in owned}
+            except Exception as e:
+                error = e
+
+            with self._lock:
+                for ticker, flight in owned.items():
+                    if ticker in fetched:
+                        info = fetched[ticker] or {}
+                        self._entries[ticker] = (time.monotonic(), info)
+                        self._entries.move_to_end(ticker)
+                        flight.result = result[ticker] = info
+                    else:
+                        stale = self._stale(ticker)
+                        if stale is not None:
+                            flight.result = result[ticker] = stale
+                        else:
+                            flight.error = error or LookupError(f"No quote returned for {ticker}")
+                    self._flights.pop(ticker, None)
+                self._evict()
+            for flight in owned.values():
+                flight.event.set()
+
+        for ticker, flight in waiting.items():
+            flight.event.wait()
+            if flight.error is None:
+                result[ticker] = flight.result
+
+        return result
+
+    def snapshot_token(self, tickers):
+        """Newest fetch time among the cached quotes of tickers, without fetching or counting a lookup.
+        None when any of them is missing or too old (reading them would go upstream);
+        otherwise it changes whenever one of those quotes is refetched, so it can validate a priced response."""
+        ttl = self.price_ttl
+        token = 0
+        with self._lock:
+            now = time.monotonic()
+            for ticker in tickers:
+                entry = self._entries.get(ticker.upper())
+                if entry is None or now - entry[0] >= ttl:
+                    return None
+                token = max(token, entry[0])
+        return token
+
+    def invalidate(self, ticker=None):
+        """Drop one ticker, or everything when no ticker is given"""
+        with self._lock:
+            if ticker is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(ticker.upper(), None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'stale_served': self.stale_served,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'price_ttl': self.price_ttl
+            }
+
+    def _stale(self, ticker):
+        # Caller must hold the lock, expired entries stay around until evicted so they can back up a failing upstream
+        entry = self._entries.get(ticker)
+        if entry is None:
+            return None
+        self.stale_served += 1
+        return dict(entry[1], stale=True)
+
+    def _evict(self):
+        # Caller must hold the lock, least recently used entries go first
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,150 @@
+import json
+import logging
+import threading
+import time
+
+from models import db, Holding
+from market_data import get_quotes, MARKET_INDICES
+
+logger = logging.getLogger(__name__)
+
+
+def quote_summary(info):
+    """The handful of fields clients need to redraw a price"""
+    price = info.get('regularMarketPrice') or 0
+    previous_close = info.get('previousClose') or 0
+    change = price - previous_close if previous_close else 0
+    return {
+        'price': round(price, 4),
+        'change': round(change, 4),
+        'percent_change': round(change / previous_close * 100, 2) if previous_close else 0,
+        'stale': bool(info.get('stale'))
+    }
+
+
+# Subscriber of the quote stream, extra_tickers are symbols it watches besides the held ones and the indices.
+# Unread deltas are merged per symbol instead of queued, so a slow client skips intermediate prices but never
+# misses a symbol's latest one, and what it holds is bounded by the number of symbols.
+class _Subscriber:
+
+    def __init__(self, extra_tickers):
+        self.extra_tickers = set(extra_tickers)
+        self._pending = {}  # symbol -> latest summary the client has not read yet
+        self._ready = threading.Condition()
+
+    def publish(self, deltas):
+        with self._ready:
+            self._pending.update(deltas)
+            self._ready.notify()
+
+    def take(self, timeout):
+        """Everything published since the last take, waiting up to timeout seconds for it ({} when nothing came)"""
+        with self._ready:
+            if not self._pending:
+                self._ready.wait(timeout)
+            pending, self._pending = self._pending, {}
+        return pending
+
+
+# Background task that prices the union of held tickers, index symbols and subscriber watch lists once per
+# interval and pushes only the changed quotes to every subscriber, so upstream load scales with symbols, not clients.
+# Listeners (the order book) get every tick too and keep it running while they have symbols to watch.
+class MarketDataRefresher:
+
+    def __init__(self, app, interval=5):
+        self.app = app
+        self.interval = interval
+        self._subscribers = set()
+        self._last = {}  # symbol -> last published summary
+        self._listeners = []  # (on_quotes(quotes), symbols())
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add_listener(self, on_quotes, symbols):
+        """Call on_quotes(ticker -> info) after every refresh with symbols() priced as well"""
+        with self._lock:
+            self._listeners.append((on_quotes, symbols))
+
+    def start(self):
+        """Make sure the refresh loop runs, it stops by itself once there is no subscriber or listener symbol"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='market-data-refresher', daemon=True)
+                self._thread.start()
+
+    def subscribe(self, extra_tickers=(), limit=None):
+        """New subscriber, None when limit subscribers are already connected"""
+        subscriber = _Subscriber(t.upper() for t in extra_tickers)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(subscriber)
+            # New subscribers start from the last full picture, deltas follow
+            if self._last:
+                subscriber.publish(self._last)
+        self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def symbols(self):
+        with self.app.app_context():
+            held = [ticker for (ticker,) in db.session.query(Holding.ticker).distinct()]
+            db.session.remove()
+        with self._lock:
+            extra = set().union(*(s.extra_tickers for s in self._subscribers)) if self._subscribers else set()
+            listeners = list(self._listeners)
+        for _, symbols in listeners:
+            extra.update(symbols())
+        return sorted(set(held) | extra | {index['symbol'] for index in MARKET_INDICES})
+
+    def refresh(self):
+        """Price every watched symbol once and publish what changed, returns the published deltas"""
+        quotes = get_quotes(self.symbols(), max_age=self.interval)
+        deltas = {}
+        for symbol, info in quotes.items():
+            summary = quote_summary(info)
+            if self._last.get(symbol) != summary:
+                deltas[symbol] = summary
+
+        with self._lock:
+            self._last.update(deltas)
+            if deltas:
+                for subscriber in self._subscribers:
+                    subscriber.publish(deltas)
+            listeners = list(self._listeners)
+
+        for on_quotes, _ in listeners:
+            try:
+                on_quotes(quotes)
+            except Exception as e:
+                logger.warning("Quote listener failed: %s", e)
+        return deltas
+
+    def _run(self):
+        # Runs while anyone is listening, the next subscriber (or resting order) starts it again
+        while True:
+            with self._lock:
+                if not self._subscribers and not any(symbols() for _, symbols in self._listeners):
+                    self._thread = None
+                    return
+            started = time.monotonic()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Market data refresh failed: %s", e)
+            time.sleep(max(self.interval - (time.monotonic() - started), 0.1))
+
+    def stream(self, subscriber, heartbeat=15):
+        """Server-Sent Events for one subscriber, a comment line keeps idle connections open"""
+        try:
+            while True:
+                deltas = subscriber.take(timeout=heartbeat)
+                if deltas:
+                    yield f"event: quotes\ndata: {json.dumps(deltas)}\n\n"
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import logging
+
+from flask import request, current_app
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+# Speedups listed in requirements.txt, everything falls back to the standard library (with a warning at start
+# up) when they are not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies worth compressing, event streams are flushed per message and never buffered for compression
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv', 'text/html')
+
+
+# Flask JSON provider backed by orjson: same output as the default provider (sorted keys, HTTP dates,
+# Decimal / dataclass support through the default hook) at a fraction of the encoding time
+class OrjsonProvider(DefaultJSONProvider):
+
+    def _options(self):
+        options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                   | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_SERIALIZE_NUMPY)
+        return options | orjson.OPT_SORT_KEYS if self.sort_keys else options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:  # indent, separators... only the standard encoder understands them
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def response(self, *args, **kwargs):
+        # Pretty printed debug responses keep the standard encoder
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def etag_for(*parts):
+    """Opaque validator for the state a response was built from, e.g. (route, portfolio version, quote snapshot)"""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def not_modified(etag):
+    """304 response when the request's If-None-Match already holds etag, None when the body has to be built"""
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    return tag_response(current_app.response_class(status=304), etag)
+
+
+def tag_response(response, etag):
+    """Attach etag (weak, the body may be compressed) and ask clients to revalidate instead of reusing blindly"""
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _encoding(response, min_size):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES
+            or (response.content_length or 0) < min_size):
+        return None
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def init_responses(app):
+    """orjson encoding (JSON_FAST) and gzip / brotli compression of buffered bodies (RESPONSE_COMPRESSION)"""
+    if app.config.get('JSON_FAST', True):
+        if orjson is not None:
+            app.json = OrjsonProvider(app)
+        else:
+            logger.warning("JSON_FAST is set but orjson is not installed, responses use the standard library encoder")
+
+    if not app.config.get('RESPONSE_COMPRESSION', True):
+        return
+    if brotli is None:
+        logger.warning("brotli is not installed, responses are compressed with gzip only")
+
+    @app.after_request
+    def compress(response):
+        response.vary.add('Accept-Encoding')
+        encoding = _encoding(response, app.config.get('COMPRESSION_MIN_SIZE', 500))
+        if encoding is None:
+            return response
+        level = app.config.get('COMPRESSION_LEVEL', 6)
+        body = response.get_data()
+        if encoding == 'br':
+            response.set_data(brotli.compress(body, quality=min(level, 11)))
+        else:
+            response.set_data(gzip.compress(body, compresslevel=level, mtime=0))
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -1,17 +1,103 @@
-from flask import request, jsonify
-from models import db, Portfolio, Holding, Transaction
+import logging
+from flask import request, jsonify, Response, stream_with_context
+from models import db, Portfolio, Holding, Transaction, Lot, LotClosure, Order
 from decimal import Decimal
-import yfinance as yf
+import base64
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import CheckConstraint, func
-from datetime import datetime, timezone, timedelta
+from sqlalchemy import CheckConstraint, select, or_, and_
+from datetime import date, datetime, timezone, timedelta
 import pytz
+from market_data import quote_cache, market_client, rate_limiter, breaker, get_provider, set_provider, provider_from_config, get_quotes, MARKET_INDICES
+from symbols import symbol_directory, unknown_symbols, is_valid_ticker
+from trading import TradeError, parse_order, execution_price, apply_buy, apply_sell, execute_trade, lock_portfolio, run_with_retries
+from lots import LotError, parse_lot_selection, rebuild_lots, lot_to_dict, closure_to_dict
+from aggregates import reconcile_aggregates
+from orders import OPEN, CANCELLED, ORDER_STATUSES, OrderMatcher, parse_resting_order, order_to_dict
+from refresher import MarketDataRefresher
+from snapshots import record_snapshot, backfill_snapshots, opening_cash
+from dashboard import DASHBOARD_SECTIONS, PortfolioSnapshot, portfolio_state, portfolio_view, pnl_view, sector_view, build_dashboard, portfolio_summaries
+from responses import etag_for, not_modified, tag_response
+from instrumentation import metrics
+from analytics import daily_history, portfolio_analytics, analytics_cache
+from price_store import load_close_matrix
+from simulation import ScenarioError, parse_scenarios, scenario_tickers, run_scenarios
+
+logger = logging.getLogger(__name__)
 
 
 from models import db, Portfolio, Holding, Transaction
 
 def register_routes(app):
 
+    # The live yfinance provider is the default, anything else (offline replay) is swapped in here
+    if app.config.get('MARKET_DATA_PROVIDER') not in (None, 'yfinance'):
+        set_provider(provider_from_config(app.config))
+
+    quote_cache.configure(
+        price_ttl=app.config.get('QUOTE_PRICE_TTL'),
+        max_entries=app.config.get('QUOTE_CACHE_SIZE')
+    )
+    market_client.configure(
+        max_in_flight=app.config.get('MARKET_DATA_MAX_IN_FLIGHT'),
+        timeout=app.config.get('MARKET_DATA_TIMEOUT')
+    )
+    rate_limiter.configure(rate=app.config.get('MARKET_DATA_RATE'), capacity=app.config.get('MARKET_DATA_BURST'))
+    breaker.configure(
+        failure_threshold=app.config.get('MARKET_DATA_BREAKER_FAILURES'),
+        reset_timeout=app.config.get('MARKET_DATA_BREAKER_RESET')
+    )
+
+    analytics_cache.ttl = app.config.get('ANALYTICS_CACHE_TTL', analytics_cache.ttl)
+
+    # Ticker validation and autocomplete are answered from the local directory and negative cache
+    if app.config.get('SYMBOLS_FILE'):
+        symbol_directory.path = app.config['SYMBOLS_FILE']
+    unknown_symbols.ttl = app.config.get('UNKNOWN_SYMBOL_TTL', unknown_symbols.ttl)
+    try:
+        symbol_directory.load()
+        if app.config.get('SYMBOLS_RELOAD_INTERVAL'):
+            symbol_directory.start_reloader(app.config['SYMBOLS_RELOAD_INTERVAL'])
+    except OSError as e:
+        logger.warning("Symbol directory not loaded: %s", e)
+
+    # Prices held tickers and indices in the background while clients are connected to /stream/quotes
+    refresher = MarketDataRefresher(app, interval=app.config.get('MARKET_REFRESH_INTERVAL', 5))
+    app.extensions['market_data_refresher'] = refresher
+
+    # Resting limit / stop orders are checked against every refresher tick
+    order_matcher = OrderMatcher(app, sync_interval=app.config.get('ORDER_BOOK_SYNC_INTERVAL', 30))
+    refresher.add_listener(order_matcher.on_quotes, order_matcher.book.tickers)
+    app.extensions['order_matcher'] = order_matcher
+
+    @app.before_request
+    def sync_order_book():
+        # Loads the book in each worker process on its first request, then picks up other workers' orders
+        try:
+            order_matcher.sync_if_due()
+        except Exception as e:
+            logger.warning("Order book sync failed: %s", e)
+        if len(order_matcher.book):
+            refresher.start()
+
+    def portfolio_id_arg():
+        """?portfolio_id= of a read route, the first portfolio when it is not given, None when it is not a number"""
+        value = request.args.get('portfolio_id', '1').strip()
+        return int(value) if value.isdigit() else None
+
+    def portfolio_ids_arg(name):
+        """Comma separated ids (?portfolio_ids=1,2,3), [] when not given, None when any of them is not a number"""
+        values = [value.strip() for value in request.args.get(name, '').split(',') if value.strip()]
+        return [int(value) for value in values] if all(value.isdigit() for value in values) else None
+
+    def portfolio_etag(state):
+        """ETag of a priced portfolio view of this URL from (version, held tickers), None when the portfolio does not
+        exist or one of its quotes would have to be refetched, the view is then built and tagged as usual"""
+        if state is None:
+            return None
+        version, tickers = state
+        quotes = quote_cache.snapshot_token(tickers)
+        return None if quotes is None else etag_for(request.full_path, version, quotes)
+
     # Route to handle stock trading - both buy/sell, depending on what user inputs as type
     @app.route('/trade', methods=['POST'])
     def trade_stock():
@@ -20,24 +106,17 @@ def register_routes(app):
             return jsonify({"error": "Invalid JSON"}), 400
 
         portfolio_id = data.get('portfolio_id')
-        ticker = data.get('ticker', '').upper()
-        quantity_str = data.get('quantity')
-        transaction_type = data.get('transaction_type', '').lower()
-
-        if not all([portfolio_id, ticker, quantity_str, transaction_type]):
+        if not all([portfolio_id, data.get('ticker'), data.get('quantity'), data.get('transaction_type')]):
             return jsonify({"error": "Missing required fields: portfolio_id, ticker, quantity, transaction_type"}), 400
 
-        # Validate quantity, make sure positive and numeric
+        # Validate quantity (positive and numeric) and transaction type (buy or sell)
         try:
-            quantity = Decimal(quantity_str)
-            if quantity <= 0:
-                raise ValueError()
-        except (ValueError, TypeError):
-            return jsonify({"error": "Quantity must be a positive number"}), 400
-
-        # Make sure user only puts buy or sell as transaction type
-        if transaction_type not in ['buy', 'sell']:
-            return jsonify({"error": "transaction_type must be 'buy' or 'sell'"}), 400
+            ticker, quantity, transaction_type = parse_order(data)
+            lot_method, lot_ids = parse_lot_selection(data)
+        except TradeError as e:
+            return jsonify({"error": str(e)}), e.status
+        except LotError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Make sure portfolio exists
         portfolio = Portfolio.query.get(portfolio_id)
@@ -46,133 +125,152 @@ def register_routes(app):
 
         # Fetch stock data using yfinance API at execution time
         try:
-            stock = yf.Ticker(ticker)
-            stock_info = stock.info
-
-            if not stock_info.get('regularMarketPrice'):
-                return jsonify({"error": f"Invalid ticker symbol: {ticker}"}), 400
-
-            # Use the most current price available at execution
-            current_price = Decimal(stock_info['regularMarketPrice'])
-            
+            # Use the most current price available at execution, never a stale one
+            current_price = execution_price(ticker, quote_cache.get(ticker))
+        except TradeError as e:
+            return jsonify({"error": str(e)}), e.status
         except Exception as e:
             return jsonify({"error": f"Failed to fetch current price for {ticker}: {str(e)}"}), 500
 
         if transaction_type == 'buy':
-            return handle_buy(portfolio, ticker, quantity, current_price)
+            return handle_buy(portfolio.id, ticker, quantity, current_price)
         else:
-            return handle_sell(portfolio, ticker, quantity, current_price)
+            return handle_sell(portfolio.id, ticker, quantity, current_price, lot_method, lot_ids)
 
     # Function to handle buy transactions
-    def handle_buy(portfolio, ticker, quantity, price):
-        total_cost = quantity * price
-        if portfolio.cash_balance < total_cost:
-            return jsonify({"error": "Insufficient cash balance to complete the purchase"}), 400
-        try:
-            portfolio.cash_balance -= total_cost
-
-            new_transaction = Transaction(
-                portfolio_id=portfolio.id,
-                ticker=ticker,
-                transaction_type='buy',
-                price=price,
-                quantity=quantity,
-                transaction_date=datetime.now()
-            )
-            db.session.add(new_transaction)
-
-            holding = Holding.query.filter_by(portfolio_id=portfolio.id, ticker=ticker).first()
-            if holding:
-                old_total_value = holding.quantity * holding.cost_basis
-                new_total_value = old_total_value + total_cost
-                new_total_quantity = holding.quantity + quantity
-                holding.quantity = new_total_quantity
-                holding.cost_basis = new_total_value / new_total_quantity
-            else:
-                new_holding = Holding(
-                    portfolio_id=portfolio.id,
-                    ticker=ticker,
-                    quantity=quantity,
-                    cost_basis=price
-                )
-                db.session.add(new_holding)
+    def handle_buy(portfolio_id, ticker, quantity, price):
+        return execute_trade_response(apply_buy, portfolio_id, ticker, quantity, price)
 
-            db.session.commit()
-            return jsonify({
-                "message": "Buy transaction successful",
-                "ticker": ticker,
-                "quantity": str(quantity),
-                "price": str(round(price, 4)),
-                "execution_price": str(round(price, 4)),  # Make it clear this is the execution price
-                "total_cost": str(round(quantity * price, 2)),
-                "new_cash_balance": str(round(portfolio.cash_balance, 4))
-            }), 200
-        
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({"error": "An error occurred during the transaction.", "details": str(e)}), 500
-        
     # Function to handle sell transactions
-    def handle_sell(portfolio, ticker, quantity, price):
-        holding = Holding.query.filter_by(portfolio_id=portfolio.id, ticker=ticker).first()
-        if not holding:
-            return jsonify({"error": f"You do not own any shares of {ticker}"}), 400
-        if quantity > holding.quantity:
-            return jsonify({"error": f"Sell quantity ({quantity}) exceeds holding quantity ({int(holding.quantity)})"}), 400
+    def handle_sell(portfolio_id, ticker, quantity, price, lot_method=None, lot_ids=()):
+        def apply(portfolio, ticker, quantity, price):
+            return apply_sell(portfolio, ticker, quantity, price, lot_method=lot_method, lot_ids=lot_ids)
+        return execute_trade_response(apply, portfolio_id, ticker, quantity, price)
 
+    def execute_trade_response(apply, portfolio_id, ticker, quantity, price):
+        # Locked read-validate-write, re-run from scratch if a concurrent trade got in between
         try:
-            total_sale_value = quantity * price
-            portfolio.cash_balance += total_sale_value
-            old_total_value = holding.quantity * holding.cost_basis
-
-            # Calculate realized P&L
-            cost_basis_value = quantity * holding.cost_basis
-            realized_pnl = total_sale_value - cost_basis_value
-
-            new_transaction = Transaction(
-                portfolio_id=portfolio.id,
-                ticker=ticker,
-                transaction_type='sell',
-                price=price,
-                quantity=quantity,
-                realized_pnl=realized_pnl,
-                transaction_date=datetime.now()
-            )
-            db.session.add(new_transaction)
-            holding.quantity -= quantity
-            if holding.quantity == 0:
-                db.session.delete(holding)
-            else:
-                # Calculate updated cost basis based on average of all shares held
-                new_total_value = old_total_value - (price * quantity)
-                holding.cost_basis = new_total_value / holding.quantity
-
-            db.session.commit()
-            return jsonify({
-                "message": "Sell transaction successful",
-                "ticker": ticker,
-                "quantity": str(quantity),
-                "price": str(round(price, 4)),
-                "execution_price": str(round(price, 4)),  # Make it clear this is the execution price
-                "total_proceeds": str(round(quantity * price, 2)),
-                "realized_pnl": str(round(realized_pnl, 2)),
-                "new_cash_balance": str(round(portfolio.cash_balance, 2))
-            }), 200
+            return jsonify(execute_trade(apply, portfolio_id, ticker, quantity, price)), 200
+        except TradeError as e:
+            return jsonify({"error": str(e)}), e.status
         except Exception as e:
             db.session.rollback()
             return jsonify({"error": "An error occurred during the transaction.", "details": str(e)}), 500
-        
-    # Get all transactions for a specific portfolio
-    @app.route('/transactions/<int:portfolio_id>', methods=['GET'])
-    def get_transactions(portfolio_id):
-        """Returns a list of all transactions for a specific portfolio."""
+
+    # Submit many orders at once: priced in one batched quote lookup, applied in one DB transaction
+    @app.route('/trades/batch', methods=['POST'])
+    def trade_batch():
+        """Body: {portfolio_id, orders: [{ticker, quantity, transaction_type}], mode}.
+        mode 'all_or_nothing' (default) rejects the whole batch if any order fails validation,
+        'best_effort' applies the valid orders and reports the rejected ones."""
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({"error": "Invalid JSON"}), 400
+
+        portfolio_id = data.get('portfolio_id')
+        orders = data.get('orders')
+        mode = data.get('mode', 'all_or_nothing')
+        if not portfolio_id or not isinstance(orders, list) or not orders:
+            return jsonify({"error": "Missing required fields: portfolio_id, orders"}), 400
+        if mode not in ['all_or_nothing', 'best_effort']:
+            return jsonify({"error": "mode must be 'all_or_nothing' or 'best_effort'"}), 400
+
         portfolio = Portfolio.query.get(portfolio_id)
         if not portfolio:
             return jsonify({"error": "Portfolio not found"}), 404
-            
-        transactions = Transaction.query.filter_by(portfolio_id=portfolio_id).all()
-        
-        transactions_data = [{
+
+        results = []
+        parsed = []  # (index, ticker, quantity, transaction_type)
+        for index, order in enumerate(orders):
+            try:
+                if not isinstance(order, dict):
+                    raise TradeError("Order must be an object")
+                parsed.append((index,) + parse_order(order))
+                results.append(None)
+            except TradeError as e:
+                results.append({"index": index, "status": "rejected", "error": str(e)})
+
+        # Price every ticker in the batch at once, nothing executes while a price is only known from before an outage
+        quotes = get_quotes([ticker for _, ticker, _, _ in parsed])
+        stale = sorted({ticker for _, ticker, _, _ in parsed if (quotes.get(ticker) or {}).get('stale')})
+        if stale:
+            return jsonify({"error": f"Prices for {', '.join(stale)} are unavailable, please retry later",
+                            "filled": 0}), 503
+
+        def attempt():
+            # Validate against an in-memory projection of cash and holdings, in submission order
+            portfolio = lock_portfolio(portfolio_id)
+            holdings = {h.ticker: h for h in Holding.query.filter_by(portfolio_id=portfolio.id).all()}
+            projected_cash = portfolio.cash_balance
+            projected_quantity = {ticker: holding.quantity for ticker, holding in holdings.items()}
+            order_results = list(results)
+            accepted = []
+            for index, ticker, quantity, transaction_type in parsed:
+                try:
+                    price = execution_price(ticker, quotes.get(ticker))
+                    error = None
+                    if transaction_type == 'buy' and projected_cash < quantity * price:
+                        error = "Insufficient cash balance to complete the purchase"
+                    elif transaction_type == 'sell' and not projected_quantity.get(ticker):
+                        error = f"You do not own any shares of {ticker}"
+                    elif transaction_type == 'sell' and quantity > projected_quantity[ticker]:
+                        error = f"Sell quantity ({quantity}) exceeds holding quantity ({int(projected_quantity[ticker])})"
+                except TradeError as e:
+                    error = str(e)
+
+                if error:
+                    order_results[index] = {"index": index, "ticker": ticker, "status": "rejected", "error": error}
+                    continue
+
+                if transaction_type == 'buy':
+                    projected_cash -= quantity * price
+                    projected_quantity[ticker] = projected_quantity.get(ticker, 0) + quantity
+                else:
+                    projected_cash += quantity * price
+                    projected_quantity[ticker] -= quantity
+                accepted.append((index, ticker, quantity, transaction_type, price))
+
+            rejected = len(orders) - len(accepted)
+            if mode == 'all_or_nothing' and rejected:
+                db.session.rollback()
+                order_results = [result or {"index": index, "status": "not_executed"} for index, result in enumerate(order_results)]
+                return {"error": "Batch rejected, no orders were executed", "mode": mode,
+                        "filled": 0, "rejected": rejected, "results": order_results}, 400
+
+            realized_total = Decimal(0)
+            for index, ticker, quantity, transaction_type, price in accepted:
+                apply = apply_buy if transaction_type == 'buy' else apply_sell
+                result, realized_pnl = apply(portfolio, ticker, quantity, price, holdings)
+                realized_total += realized_pnl
+                order_results[index] = dict(result, index=index, status="filled")
+
+            if accepted:
+                record_snapshot(portfolio, datetime.now().date(), realized_total, trades=len(accepted))
+            db.session.commit()
+
+            return {
+                "mode": mode,
+                "filled": len(accepted),
+                "rejected": rejected,
+                "results": order_results,
+                "new_cash_balance": str(round(portfolio.cash_balance, 4))
+            }, 200
+
+        try:
+            body, status = run_with_retries(attempt)
+            return jsonify(body), status
+        except TradeError as e:
+            return jsonify({"error": str(e)}), e.status
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": "An error occurred during the transaction.", "details": str(e)}), 500
+
+    # Columns streamed out of the transactions table, rows are serialized without loading ORM objects
+    TRANSACTION_COLUMNS = (Transaction.id, Transaction.ticker, Transaction.transaction_type, Transaction.price,
+                           Transaction.quantity, Transaction.realized_pnl, Transaction.transaction_date)
+
+    def transaction_row_to_dict(t):
+        return {
             "id": t.id,
             "ticker": t.ticker,
             "transaction_type": t.transaction_type,
@@ -180,25 +278,193 @@ def register_routes(app):
             "quantity": str(t.quantity),
             "realized_pnl": str(t.realized_pnl) if t.realized_pnl else "0.0000",
             "transaction_date": t.transaction_date.isoformat()
-        } for t in transactions]
+        }
+
+    def encode_cursor(t):
+        return base64.urlsafe_b64encode(f"{t.transaction_date.isoformat()}|{t.id}".encode()).decode()
+
+    def decode_cursor(cursor):
+        transaction_date, transaction_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(transaction_date), int(transaction_id)
+
+    # Get all transactions for a specific portfolio
+    @app.route('/transactions/<int:portfolio_id>', methods=['GET'])
+    def get_transactions(portfolio_id):
+        """Returns the transactions of a portfolio ordered by date.
+
+        Optional filters: ticker, type (buy/sell), start / end (ISO dates, inclusive).
+        With limit (and the next_cursor of the previous page as cursor) one keyset-paginated page is returned,
+        with format=ndjson every row is streamed as one JSON line, otherwise the full list is streamed as a JSON array."""
+        portfolio = Portfolio.query.get(portfolio_id)
+        if not portfolio:
+            return jsonify({"error": "Portfolio not found"}), 404
+
+        # Transactions are only ever added by trades, which bump the portfolio version
+        etag = etag_for(request.full_path, portfolio.version)
+        cached = not_modified(etag)
+        if cached:
+            return cached
 
-        return jsonify(transactions_data), 200
+        query = select(*TRANSACTION_COLUMNS).where(Transaction.portfolio_id == portfolio_id)
+        try:
+            if request.args.get('ticker'):
+                query = query.where(Transaction.ticker == request.args['ticker'].upper())
+            if request.args.get('type'):
+                if request.args['type'].lower() not in ['buy', 'sell']:
+                    raise ValueError("type must be 'buy' or 'sell'")
+                query = query.where(Transaction.transaction_type == request.args['type'].lower())
+            if request.args.get('start'):
+                query = query.where(Transaction.transaction_date >= datetime.fromisoformat(request.args['start']))
+            if request.args.get('end'):
+                end = datetime.fromisoformat(request.args['end'])
+                if len(request.args['end']) <= 10:
+                    end += timedelta(days=1)  # a plain date includes the whole day
+                    query = query.where(Transaction.transaction_date < end)
+                else:
+                    query = query.where(Transaction.transaction_date <= end)
+            if request.args.get('cursor'):
+                cursor_date, cursor_id = decode_cursor(request.args['cursor'])
+                query = query.where(or_(
+                    Transaction.transaction_date > cursor_date,
+                    and_(Transaction.transaction_date == cursor_date, Transaction.id > cursor_id)
+                ))
+            limit = request.args.get('limit', type=int)
+            if limit is not None and not 1 <= limit <= 1000:
+                raise ValueError("limit must be between 1 and 1000")
+        except ValueError as e:
+            return jsonify({"error": f"Invalid query parameters: {str(e)}"}), 400
+
+        query = query.order_by(Transaction.transaction_date.asc(), Transaction.id.asc())
+
+        # Keyset pagination, one page per request
+        if limit is not None or request.args.get('cursor'):
+            rows = db.session.execute(query.limit((limit or 100) + 1)).all()
+            page = rows[:limit or 100]
+            return tag_response(jsonify({
+                "transactions": [transaction_row_to_dict(t) for t in page],
+                "next_cursor": encode_cursor(page[-1]) if len(rows) > len(page) else None
+            }), etag), 200
+
+        # Otherwise stream rows straight from the database cursor so memory stays flat
+        def stream_rows(ndjson):
+            first = True
+            if not ndjson:
+                yield '['
+            for t in db.session.execute(query.execution_options(yield_per=500)):
+                row = app.json.dumps(transaction_row_to_dict(t))
+                if ndjson:
+                    yield row + '\n'
+                else:
+                    yield row if first else ',' + row
+                first = False
+            if not ndjson:
+                yield ']'
+
+        if request.args.get('format') == 'ndjson':
+            return tag_response(Response(stream_with_context(stream_rows(True)), mimetype='application/x-ndjson'), etag)
+        return tag_response(Response(stream_with_context(stream_rows(False)), mimetype='application/json'), etag)
     
+    @app.route('/lots/<int:portfolio_id>', methods=['GET'])
+    def get_lots(portfolio_id):
+        """Open tax lots (optionally ?ticker=), plus the lot closures with per-lot realized P&L when ?closed=1.
+        Lot P&L is the tax lot view and can differ from the average cost realized P&L of /pnl and the transactions"""
+        portfolio = Portfolio.query.get(portfolio_id)
+        if not portfolio:
+            return jsonify({'error': 'Portfolio not found'}), 404
+
+        ticker = (request.args.get('ticker') or '').upper()
+        lots = Lot.query.filter(Lot.portfolio_id == portfolio_id, Lot.remaining_quantity > 0)
+        if ticker:
+            lots = lots.filter(Lot.ticker == ticker)
+        result = {'open_lots': [lot_to_dict(lot) for lot in lots.order_by(Lot.ticker, Lot.acquired_at, Lot.id)]}
+
+        if request.args.get('closed') == '1':
+            closures = LotClosure.query.filter(LotClosure.portfolio_id == portfolio_id)
+            if ticker:
+                closures = closures.filter(LotClosure.ticker == ticker)
+            result['closures'] = [closure_to_dict(c) for c in closures.order_by(LotClosure.closed_at, LotClosure.id)]
+            result['total_lot_realized_pnl'] = round(sum(c['realized_pnl'] for c in result['closures']), 2)
+        return jsonify(result)
+
+    @app.route('/orders', methods=['POST'])
+    def place_order():
+        """Rest a limit or stop order: portfolio_id, ticker, quantity, transaction_type, order_type (limit / stop) and
+        trigger_price. It fills at the market price of the first price tick that crosses trigger_price: buy limits and
+        sell stops at or below it, sell limits and buy stops at or above it"""
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "Invalid JSON"}), 400
+        try:
+            ticker, quantity, transaction_type, order_type, trigger_price = parse_resting_order(data)
+        except TradeError as e:
+            return jsonify({"error": str(e)}), e.status
+
+        portfolio = Portfolio.query.get(data.get('portfolio_id'))
+        if not portfolio:
+            return jsonify({"error": "Portfolio not found"}), 404
+        if not is_valid_ticker(ticker) or ticker in unknown_symbols:
+            return jsonify({"error": f"Invalid ticker symbol: {ticker}"}), 400
+
+        order = Order(
+            portfolio_id=portfolio.id,
+            ticker=ticker,
+            transaction_type=transaction_type,
+            order_type=order_type,
+            quantity=quantity,
+            trigger_price=trigger_price
+        )
+        db.session.add(order)
+        db.session.commit()
+
+        order_matcher.add(order)
+        refresher.start()
+        return jsonify(order_to_dict(order)), 201
+
+    @app.route('/orders/<int:portfolio_id>', methods=['GET'])
+    def get_orders(portfolio_id):
+        """Orders of a portfolio, newest first, optionally only one ?status= (open, filled, cancelled, rejected)"""
+        status = request.args.get('status')
+        if status and status not in ORDER_STATUSES:
+            return jsonify({"error": f"status must be one of {', '.join(ORDER_STATUSES)}"}), 400
+        query = Order.query.filter(Order.portfolio_id == portfolio_id)
+        if status:
+            query = query.filter(Order.status == status)
+        return jsonify({'orders': [order_to_dict(order) for order in query.order_by(Order.id.desc())]})
+
+    @app.route('/orders/<int:order_id>/cancel', methods=['POST'])
+    def cancel_order(order_id):
+        """Cancel a resting order, 409 once it has been filled, rejected or cancelled"""
+        order = Order.query.get(order_id)
+        if not order:
+            return jsonify({"error": "Order not found"}), 404
+
+        # Conditional on the order still being open, a fill that claimed it first wins
+        cancelled = Order.query.filter_by(id=order_id, status=OPEN).update(
+            {'status': CANCELLED, 'closed_at': datetime.now()}, synchronize_session=False)
+        db.session.commit()
+        if not cancelled:
+            db.session.refresh(order)
+            return jsonify({"error": f"Order is already {order.status}"}), 409
+
+        order_matcher.cancel(order_id)
+        db.session.refresh(order)
+        return jsonify(order_to_dict(order))
+
     @app.route('/portfolio/history', methods=['GET'])
     def get_portfolio_history():
-        """Get portfolio value history based on transaction dates"""
-        print("Portfolio history endpoint called")  # Debug print
+        """Get portfolio value history based on transaction dates (?portfolio_id=, the first portfolio by default)"""
         try:
-            portfolio = Portfolio.query.filter_by(id=1).first()
+            portfolio_id = portfolio_id_arg()
+            if portfolio_id is None:
+                return jsonify({'error': 'portfolio_id must be a number'}), 400
+            portfolio = Portfolio.query.filter_by(id=portfolio_id).first()
             if not portfolio:
-                print("Portfolio not found")  # Debug print
                 return jsonify({'error': 'Portfolio not found'}), 404
 
             # Get all transactions ordered by date
             transactions = Transaction.query.filter_by(portfolio_id=portfolio.id).order_by(Transaction.transaction_date.asc()).all()
             
             if not transactions:
-                print("No transactions found")  # Debug print
                 return jsonify({'error': 'No transactions found'}), 404
 
             # Simple return of transaction data without complex calculations
@@ -214,9 +480,12 @@ def register_routes(app):
     
     @app.route('/portfolio/daily-history/<int:days>', methods=['GET'])
     def get_daily_portfolio_history(days=30):
-        """Get actual daily portfolio values based on historical transactions"""
+        """Get actual daily portfolio values based on historical transactions (?portfolio_id=, the first portfolio by default)"""
         try:
-            portfolio = Portfolio.query.filter_by(id=1).first()
+            portfolio_id = portfolio_id_arg()
+            if portfolio_id is None:
+                return jsonify({'error': 'portfolio_id must be a number'}), 400
+            portfolio = Portfolio.query.filter_by(id=portfolio_id).first()
             if not portfolio:
                 return jsonify({'error': 'Portfolio not found'}), 404
 
@@ -224,162 +493,126 @@ def register_routes(app):
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=days-1)
             
-            # Get all transactions up to end date, ordered by date
-            transactions = Transaction.query.filter(
-                Transaction.portfolio_id == portfolio.id,
-                Transaction.transaction_date <= datetime.combine(end_date, datetime.min.time())
-            ).order_by(Transaction.transaction_date.asc()).all()
-            
-            # Get all unique tickers from transactions
-            all_tickers = list(set([t.ticker for t in transactions]))
-            print(f"Fetching {days} days for {len(all_tickers)} stocks from transactions...")
-            
-            # Fetch ALL historical data for all tickers at once
-            historical_data = {}
-            for ticker in all_tickers:
-                try:
-                    stock = yf.Ticker(ticker)
-                    hist = stock.history(start=start_date, end=end_date + timedelta(days=1))
-                    historical_data[ticker] = hist['Close'].to_dict() if not hist.empty else {}
-                    print(f"✓ {ticker}")
-                except Exception as e:
-                    print(f"✗ {ticker}: {e}")
-                    historical_data[ticker] = {}
-            
-            initial_cash = 100000  # Starting cash
-            daily_snapshots = {}  # date -> {cash, holdings}
-            
-            # Get info for each day
-            for single_date in (start_date + timedelta(n) for n in range(days)):
-                # Get transactions up to this date
-                relevant_transactions = [t for t in transactions 
-                                       if t.transaction_date.date() <= single_date]
-                
-                # Replay transactions to get portfolio state on this date
-                cash = initial_cash
-                holdings = {}  # ticker -> {quantity, cost_basis, total_cost_basis}
-                
-                for transaction in relevant_transactions:
-                    ticker = transaction.ticker
-                    quantity = float(transaction.quantity)
-                    price = float(transaction.price)
-                    
-                    if transaction.transaction_type == 'buy':
-                        total_cost = quantity * price
-                        cash -= total_cost
-                        
-                        if ticker in holdings:
-                            # Update existing holding with weighted average cost
-                            old_quantity = holdings[ticker]['quantity']
-                            old_total_cost = holdings[ticker]['total_cost_basis']
-                            new_quantity = old_quantity + quantity
-                            new_total_cost = old_total_cost + total_cost
-                            
-                            holdings[ticker] = {
-                                'quantity': new_quantity,
-                                'cost_basis': new_total_cost / new_quantity,  # Average cost per share
-                                'total_cost_basis': new_total_cost
-                            }
-                        else:
-                            holdings[ticker] = {
-                                'quantity': quantity,
-                                'cost_basis': price,  # Average cost per share
-                                'total_cost_basis': total_cost
-                            }
-                            
-                    else:  # sell
-                        total_proceeds = quantity * price
-                        cash += total_proceeds
-                        
-                        if ticker in holdings:
-                            # Calculate realized PnL for this sale
-                            sale_cost_basis = holdings[ticker]['cost_basis'] * quantity
-                            realized_pnl = total_proceeds - sale_cost_basis
-                            
-                            # Calculate updated cost basis based on average of all shares held
-                            remaining_quantity = holdings[ticker]['quantity'] - quantity
-                            if remaining_quantity > 0:
-                                old_total_value = holdings[ticker]['quantity'] * holdings[ticker]['cost_basis']
-                                new_total_value = old_total_value - (price * quantity)
-                                
-                                holdings[ticker] = {
-                                    'quantity': remaining_quantity,
-                                    'cost_basis': new_total_value / remaining_quantity,  # Average cost per share
-                                    'total_cost_basis': new_total_value
-                                }
-                            else:
-                                # All shares sold, remove holding
-                                del holdings[ticker]
-                
-                # Calculate portfolio value and PnL for this date
-                holdings_value = 0
-                total_cost_basis = 0
-                for ticker, holding_info in holdings.items():
-                    price = get_historical_price(ticker, single_date, historical_data)
-                    if price is None:
-                        price = holding_info['cost_basis']  # Fallback to cost basis
-                    holdings_value += holding_info['quantity'] * price
-                    total_cost_basis += holding_info['total_cost_basis']
-                
-                portfolio_value = cash + holdings_value
-                unrealized_pnl = holdings_value - total_cost_basis
-                
-                # Calculate cumulative realized PnL up to this date
-                realized_pnl_up_to_date = 0
-                for transaction in relevant_transactions:
-                    if transaction.transaction_type == 'sell':
-                        realized_pnl_up_to_date += float(transaction.realized_pnl or 0)
-                
-                combined_pnl = unrealized_pnl + realized_pnl_up_to_date
-                
-                daily_snapshots[single_date] = {
-                    'date': single_date.strftime('%Y-%m-%d'),
-                    'portfolio_value': round(portfolio_value, 2),
-                    'cash_balance': round(cash, 2),
-                    'holdings_value': round(holdings_value, 2),
-                    'total_cost_basis': round(total_cost_basis, 2),
-                    'unrealized_pnl': round(unrealized_pnl, 2),
-                    'realized_pnl': round(realized_pnl_up_to_date, 2),
-                    'combined_pnl': round(combined_pnl, 2),
-                    'holdings_count': len(holdings)
-                }
-            
-            # Convert to list
-            daily_history = [daily_snapshots[date] for date in sorted(daily_snapshots.keys())]
-            
+            daily_history_rows, transaction_count = daily_history(portfolio, start_date, end_date, days)
+
             return jsonify({
-                'daily_history': daily_history,
+                'daily_history': daily_history_rows,
                 'days_requested': days,
                 'start_date': start_date.strftime('%Y-%m-%d'),
                 'end_date': end_date.strftime('%Y-%m-%d'),
-                'total_transactions_processed': len(transactions)
+                'total_transactions_processed': transaction_count
             })
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
-    def get_historical_price(ticker, date, historical_data):
-        """Get historical price for a ticker on a specific date with fallback logic"""
-        if ticker not in historical_data:
-            return None
-        
-        # Try to find price for this date or nearby dates (within 5 days)
-        for day_offset in range(5):
-            check_date = date - timedelta(days=day_offset)
-            for price_date, price in historical_data[ticker].items():
-                if price_date.date() == check_date:
-                    return float(price)
-        return None
-    
-    # Utility function to get just the current price of a stock
-    def get_current_price(ticker):
+    @app.route('/portfolio/analytics', methods=['GET'])
+    def get_portfolio_analytics():
+        """Time-weighted return, volatility, Sharpe ratio, max drawdown and beta / correlation vs the S&P 500
+        over ?days= of daily history (default 365) of ?portfolio_id= (default 1), cached until the next trade on the portfolio"""
         try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
-            return info.get('regularMarketPrice')
+            portfolio_id = portfolio_id_arg()
+            if portfolio_id is None:
+                return jsonify({'error': 'portfolio_id must be a number'}), 400
+            days = int(request.args.get('days', 365))
+            if not 2 <= days <= 3650:
+                return jsonify({'error': 'days must be between 2 and 3650'}), 400
+
+            portfolio = Portfolio.query.filter_by(id=portfolio_id).first()
+            if not portfolio:
+                return jsonify({'error': 'Portfolio not found'}), 404
+
+            key = analytics_cache.key(portfolio, days)
+            result = analytics_cache.get(key)
+            cached = result is not None
+            if not cached:
+                result = portfolio_analytics(portfolio, days, risk_free_rate=app.config.get('RISK_FREE_RATE', 0))
+                analytics_cache.put(key, result)
+
+            return jsonify(dict(result, cached=cached))
+
+        except ValueError:
+            return jsonify({'error': 'days must be a number'}), 400
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/simulate', methods=['POST'])
+    def simulate_scenarios():
+        """What-if backtests over the stored price history. Body: start_date, end_date (default today), initial_cash
+        (default 100000, or the opening cash of a scenario's portfolio), curves (default true) and scenarios, each
+        either trades [{date, ticker, quantity,
+        transaction_type, price (optional)}] on top of an optional portfolio_id's own transactions, or a rebalance rule
+        {weights, every, fractional}. Returns every scenario's summary and its daily equity, cash and P&L"""
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Invalid JSON'}), 400
+        try:
+            scenarios = parse_scenarios(data, app.config.get('SIMULATION_MAX_SCENARIOS', 1000))
+            end_date = datetime.fromisoformat(data['end_date']).date() if data.get('end_date') else datetime.now().date()
+            start_date = (datetime.fromisoformat(data['start_date']).date() if data.get('start_date')
+                          else end_date - timedelta(days=364))
+            cash_given = data.get('initial_cash') is not None
+            initial_cash = float(data['initial_cash']) if cash_given else 100000.0
+        except ScenarioError as e:
+            return jsonify({'error': str(e)}), 400
+        except (TypeError, ValueError):
+            return jsonify({'error': 'start_date / end_date must be YYYY-MM-DD dates and initial_cash a number'}), 400
+        if not 0 <= (end_date - start_date).days < app.config.get('SIMULATION_MAX_DAYS', 3650):
+            return jsonify({'error': f"The window must end after it starts and span at most {app.config.get('SIMULATION_MAX_DAYS', 3650)} days"}), 400
+        if not initial_cash > 0 or initial_cash == float('inf'):
+            return jsonify({'error': 'initial_cash must be a positive number'}), 400
+
+        try:
+            # Scenarios built on a portfolio replay its transactions first, loaded once per portfolio
+            base_trades, base_cash = {}, {}
+            for portfolio_id in {scenario['portfolio_id'] for scenario in scenarios if scenario['portfolio_id'] is not None}:
+                portfolio = db.session.get(Portfolio, portfolio_id)
+                if portfolio is None:
+                    return jsonify({'error': f'Portfolio {portfolio_id} not found'}), 404
+                # Without an explicit initial_cash the replay starts from what the portfolio really started with
+                base_cash[portfolio_id] = opening_cash(portfolio)
+                transactions = db.session.query(
+                    Transaction.ticker, Transaction.transaction_type, Transaction.quantity, Transaction.price,
+                    Transaction.transaction_date
+                ).filter(
+                    Transaction.portfolio_id == portfolio_id,
+                    Transaction.transaction_date < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+                ).order_by(Transaction.transaction_date, Transaction.id)
+                base_trades[portfolio_id] = [(
+                    t.transaction_date.date().toordinal(), t.ticker,
+                    float(t.quantity) if t.transaction_type == 'buy' else -float(t.quantity), float(t.price)
+                ) for t in transactions]
+            for scenario in scenarios:
+                if scenario['portfolio_id'] is not None:
+                    scenario['trades'] = base_trades[scenario['portfolio_id']] + scenario['trades']
+                    if not cash_given and base_cash[scenario['portfolio_id']] > 0:
+                        scenario['initial_cash'] = base_cash[scenario['portfolio_id']]
+
+            # One dates x tickers close matrix for every scenario, served from the local price store
+            tickers, day_ordinals, closes = load_close_matrix(
+                set().union(*(scenario_tickers(scenario) for scenario in scenarios)), start_date, end_date)
+            if not len(day_ordinals):
+                return jsonify({'error': 'No price history for these tickers in the window'}), 404
+
+            results, processes = run_scenarios(
+                scenarios, tickers, day_ordinals, closes, initial_cash,
+                curves=data.get('curves', True) is not False,
+                workers=app.config.get('SIMULATION_WORKERS'),
+                parallel_min=app.config.get('SIMULATION_PARALLEL_MIN', 16)
+            )
+            return jsonify({
+                'start_date': start_date.strftime('%Y-%m-%d'),
+                'end_date': end_date.strftime('%Y-%m-%d'),
+                'initial_cash': initial_cash,
+                'tickers': tickers,
+                'dates': [date.fromordinal(int(day)).strftime('%Y-%m-%d') for day in day_ordinals],
+                'scenario_count': len(results),
+                'processes': processes,
+                'scenarios': results
+            })
+
         except Exception as e:
-            print(f"Error fetching current price for {ticker}: {str(e)}")
-            return 0
+            return jsonify({'error': str(e)}), 500
 
     # Function to fetch stock data using yfinance
     @app.route('/quote/<ticker>')
@@ -390,15 +623,24 @@ def register_routes(app):
                 return jsonify({"error": "Please enter a valid ticker symbol"}), 400
             
             ticker = ticker.upper().strip()
-            stock = yf.Ticker(ticker)
-            info = stock.info
+            if not is_valid_ticker(ticker):
+                return jsonify({"error": "Please enter a valid ticker symbol"}), 400
+
+            # Known bad symbols (and, in strict mode, anything outside the directory) never reach upstream
+            if ticker in unknown_symbols or (app.config.get('SYMBOLS_STRICT') and ticker not in symbol_directory):
+                return jsonify({"error": f"Invalid ticker symbol: {ticker}. Please check the symbol and try again."}), 404
+
+            info = quote_cache.get(ticker)
+            listing = symbol_directory.lookup(ticker) or {}
 
             # Check if yfinance returned valid data
             if not info or not info.get('regularMarketPrice'):
+                unknown_symbols.add(ticker)
                 return jsonify({"error": f"Invalid ticker symbol: {ticker}. Please check the symbol and try again."}), 404
 
             # Additional validation - check if we have minimal required data
-            if not info.get('longName') and not info.get('shortName'):
+            if not info.get('longName') and not info.get('shortName') and not listing.get('name'):
+                unknown_symbols.add(ticker)
                 return jsonify({"error": f"Invalid ticker symbol: {ticker}. No company information found."}), 404
 
             # Safe division for percent change
@@ -411,7 +653,7 @@ def register_routes(app):
                 percent_change = 0
 
             data = {
-                "name": info.get('longName', info.get('shortName', 'N/A')),
+                "name": info.get('longName') or info.get('shortName') or listing.get('name', 'N/A'),
                 "ticker": ticker,
                 "price": round(regular_market_price, 4),
                 "change": round(regular_market_price - previous_close, 4),
@@ -425,216 +667,243 @@ def register_routes(app):
                 "pe_ratio": round(info.get('trailingPE', 0), 2) if info.get('trailingPE') else None,
                 "dividend_yield": info.get('dividendYield') if info.get('dividendYield') else None,
                 "beta": round(info.get('beta', 0), 4) if info.get('beta') else None,
-                "sector": info.get('sector', 'N/A'),
-                "industry": info.get('industry', 'N/A')
+                "sector": info.get('sector') or listing.get('sector') or 'N/A',
+                "industry": info.get('industry', 'N/A'),
+                "stale": bool(info.get('stale'))  # last known price, upstream is currently unavailable
             }
             return jsonify(data)        
         except Exception as e:
+            # Provider said the symbol does not exist (outages and timeouts are not remembered)
+            if isinstance(e, LookupError):
+                unknown_symbols.add(ticker)
             return jsonify({"error": f"Invalid ticker symbol: {ticker}. Please verify the symbol and try again."}), 404
 
-    @app.route('/portfolio', methods=['GET'])
-    def get_portfolio():
-        """MVP 1 : Get user portfolio"""
+    @app.route('/symbols', methods=['GET'])
+    def search_symbols():
+        """Autocomplete: ?q= prefix of a ticker or company name, served from the local symbol directory"""
+        query = request.args.get('q', '')
+        try:
+            limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+        except ValueError:
+            return jsonify({'error': 'limit must be a number'}), 400
+        return jsonify({'symbols': symbol_directory.search(query, limit)})
+
+    @app.route('/dashboard', methods=['GET'])
+    def get_dashboard():
+        """Portfolio, P&L and sector breakdown computed from one holdings read and one batched price lookup,
+        ?fields=portfolio,pnl,sectors picks the sections (all by default). ?portfolio_id= picks the portfolio (default 1);
+        ?portfolio_ids=1,2,3 returns several dashboards keyed by id, priced with one lookup over their distinct tickers"""
         try:
-            portfolio = Portfolio.query.filter_by(id=1).first() #using the single first portfolio
+            fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+            fields = fields or list(DASHBOARD_SECTIONS)
+            unknown = [field for field in fields if field not in DASHBOARD_SECTIONS]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}. Choose from {', '.join(DASHBOARD_SECTIONS)}"}), 400
+
+            portfolio_ids = portfolio_ids_arg('portfolio_ids')
+            if portfolio_ids is None:
+                return jsonify({'error': 'portfolio_ids must be a comma separated list of numbers'}), 400
+            if len(portfolio_ids) > 100:
+                return jsonify({'error': 'At most 100 portfolio_ids per request'}), 400
+            if portfolio_ids:
+                snapshots = PortfolioSnapshot.load_many(portfolio_ids)
+                return jsonify({
+                    'portfolios': {str(portfolio_id): build_dashboard(snapshot, dict.fromkeys(fields))
+                                   for portfolio_id, snapshot in snapshots.items()},
+                    'not_found': [portfolio_id for portfolio_id in portfolio_ids if portfolio_id not in snapshots]
+                })
 
-            holdings = Holding.query.filter_by(portfolio_id=portfolio.id).all()
+            portfolio_id = portfolio_id_arg()
+            if portfolio_id is None:
+                return jsonify({'error': 'portfolio_id must be a number'}), 400
+            # Nothing traded and no held quote refreshed since the client's copy: answer without pricing
+            cached = not_modified(portfolio_etag(portfolio_state(portfolio_id)))
+            if cached:
+                return cached
+            snapshot = PortfolioSnapshot.load(portfolio_id)
+            if not snapshot:
+                return jsonify({'error': 'Portfolio not found'}), 404
 
-            portfolio_data = {
-                'id': portfolio.id,
-                'name': portfolio.name,
-                'cash_balance': round(float(portfolio.cash_balance), 2),
-                'holdings': []
-            }
+            return tag_response(jsonify(build_dashboard(snapshot, dict.fromkeys(fields))), portfolio_etag(snapshot.state()))
 
-            total_value = float(portfolio.cash_balance)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
 
-            for holding in holdings:
-                current_price = get_current_price(holding.ticker)
-                market_value = float(holding.quantity) * current_price
-                total_value += market_value
-                
-                portfolio_data['holdings'].append({
-                    'id': holding.id,
-                    'ticker': holding.ticker,
-                    'quantity': float(holding.quantity),
-                    'cost_basis': float(holding.cost_basis),
-                    'current_price': current_price,
-                    'market_value': market_value,
-                    'unrealized_pnl': market_value - (float(holding.quantity) * float(holding.cost_basis))
-                })
+    @app.route('/portfolio', methods=['GET'])
+    def get_portfolio():
+        """MVP 1 : Get user portfolio (?portfolio_id=, the first portfolio by default)"""
+        try:
+            portfolio_id = portfolio_id_arg()
+            if portfolio_id is None:
+                return jsonify({'error': 'portfolio_id must be a number'}), 400
+            cached = not_modified(portfolio_etag(portfolio_state(portfolio_id)))
+            if cached:
+                return cached
+            snapshot = PortfolioSnapshot.load(portfolio_id)
+            if not snapshot:
+                return jsonify({'error': 'Portfolio not found'}), 404
 
-            portfolio_data['total_value'] = round(total_value, 2)
-            
-            return jsonify(portfolio_data)
+            return tag_response(jsonify(portfolio_view(snapshot)), portfolio_etag(snapshot.state()))
         
         except Exception as e:
             return jsonify({'error': str(e)}), 500
         
     @app.route('/pnl', methods=['GET'])
     def get_profit_loss():
-        """MVP 3 : Get Profit/loss"""
+        """MVP 3 : Get Profit/loss (?portfolio_id=, the first portfolio by default)"""
         try:
-            portfolio = Portfolio.query.filter_by(id=1).first()
-            if not portfolio:
+            portfolio_id = portfolio_id_arg()
+            if portfolio_id is None:
+                return jsonify({'error': 'portfolio_id must be a number'}), 400
+            cached = not_modified(portfolio_etag(portfolio_state(portfolio_id)))
+            if cached:
+                return cached
+            snapshot = PortfolioSnapshot.load(portfolio_id)
+            if not snapshot:
                 return jsonify({'error': 'Portfolio not found'}), 404
-            holdings = Holding.query.filter_by(portfolio_id=portfolio.id).all()
-            #Calculate Unrealized P&L from current holdings
-            total_unrealized_pnl = 0
-            total_cost_basis = 0
-            total_market_value = 0
-
-            for holding in holdings:
-                current_price = get_current_price(holding.ticker)
-                market_value = float(holding.quantity) * current_price
-                cost_basis_value = float(holding.quantity) * float(holding.cost_basis)
-                unrealized_pnl = market_value - cost_basis_value
-                
-                total_market_value += market_value
-                total_cost_basis += cost_basis_value
-                total_unrealized_pnl += unrealized_pnl
-            
-            # Calculate realized P&L from historical transactions
-            realized_pnl_sum = db.session.query(func.sum(Transaction.realized_pnl)).filter(
-                Transaction.portfolio_id == portfolio.id,
-                Transaction.transaction_type == 'sell'
-            ).scalar()
-            
-            # The sum() function returns None if no matching records are found, so handle this
-            total_realized_pnl = float(realized_pnl_sum) if realized_pnl_sum is not None else 0
-
-            #combine and return results
-            pnl_data = {
-                'total_unrealized_pnl': total_unrealized_pnl,
-                'total_realized_pnl': total_realized_pnl,
-                'total_pnl': total_unrealized_pnl + total_realized_pnl,
-                'total_cost_basis': total_cost_basis,
-                'total_market_value': total_market_value,
-                'return_percentage': (total_unrealized_pnl / total_cost_basis * 100) if total_cost_basis > 0 else 0
-            }
-            
-            return jsonify(pnl_data)
+
+            return tag_response(jsonify(pnl_view(snapshot)), portfolio_etag(snapshot.state()))
         
         except Exception as e:
             return jsonify({'error': str(e)}), 500
         
+    @app.route('/portfolios/summary', methods=['GET'])
+    def get_portfolios_summary():
+        """Cash, cost basis, market value and unrealized P&L of every portfolio (or ?portfolio_ids=1,2,3), from one
+        aggregated SQL query and one batched price lookup, paged with ?limit= (default 1000, max 10000) and ?offset="""
+        try:
+            portfolio_ids = portfolio_ids_arg('portfolio_ids')
+            if portfolio_ids is None:
+                return jsonify({'error': 'portfolio_ids must be a comma separated list of numbers'}), 400
+            try:
+                limit = min(max(int(request.args.get('limit', 1000)), 1), 10000)
+                offset = max(int(request.args.get('offset', 0)), 0)
+            except ValueError:
+                return jsonify({'error': 'limit and offset must be numbers'}), 400
+
+            portfolios = portfolio_summaries(portfolio_ids or None, limit, offset)
+            return jsonify({
+                'portfolios': portfolios,
+                'count': len(portfolios),
+                'offset': offset,
+                'total_value': round(sum(portfolio['total_value'] for portfolio in portfolios), 2),
+                'stale': any(portfolio['stale'] for portfolio in portfolios)
+            })
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    def indices_etag(symbols):
+        quotes = quote_cache.snapshot_token(symbols)
+        return None if quotes is None else etag_for(request.path, quotes)
+
     @app.route('/market-indices', methods=['GET'])
     def get_market_indices():
         """Get real-time market indices data"""
         try:
-            indices = [
-                {'name': 'Dow Jones', 'symbol': '^DJI'},
-                {'name': 'S&P 500', 'symbol': '^GSPC'},
-                {'name': 'NASDAQ', 'symbol': '^IXIC'},
-                {'name': 'Russell 2000', 'symbol': '^RUT'}
-            ]
-            
             indices_data = []
+            symbols = [index['symbol'] for index in MARKET_INDICES]
+            cached = not_modified(indices_etag(symbols))
+            if cached:
+                return cached
+
+            # All four indices in one batched lookup, indices that failed are missing from the map
+            quotes = get_quotes(symbols)
             
-            for index in indices:
-                try:
-                    stock = yf.Ticker(index['symbol'])
-                    info = stock.info
+            for index in MARKET_INDICES:
+                info = quotes.get(index['symbol']) or {}
+                
+                if info.get('regularMarketPrice'):
+                    current_price = info.get('regularMarketPrice', 0)
+                    previous_close = info.get('previousClose', 0)
+                    change = current_price - previous_close
+                    percent_change = (change / previous_close * 100) if previous_close > 0 else 0
                     
-                    if info.get('regularMarketPrice'):
-                        current_price = info.get('regularMarketPrice', 0)
-                        previous_close = info.get('previousClose', 0)
-                        change = current_price - previous_close
-                        percent_change = (change / previous_close * 100) if previous_close > 0 else 0
-                        
-                        indices_data.append({
-                            'name': index['name'],
-                            'symbol': index['symbol'],
-                            'value': round(current_price, 2),
-                            'change': round(change, 2),
-                            'percent_change': round(percent_change, 2)
-                        })
-                    else:
-                        # Fallback if data not available
-                        indices_data.append({
-                            'name': index['name'],
-                            'symbol': index['symbol'],
-                            'value': 0,
-                            'change': 0,
-                            'percent_change': 0
-                        })
-                        
-                except Exception as e:
-                    print(f"Error fetching {index['symbol']}: {str(e)}")
-                    # Add fallback data for this index
+                    indices_data.append({
+                        'name': index['name'],
+                        'symbol': index['symbol'],
+                        'value': round(current_price, 2),
+                        'change': round(change, 2),
+                        'percent_change': round(percent_change, 2),
+                        'stale': bool(info.get('stale'))
+                    })
+                else:
+                    # Fallback if data not available
                     indices_data.append({
                         'name': index['name'],
                         'symbol': index['symbol'],
                         'value': 0,
                         'change': 0,
-                        'percent_change': 0
+                        'percent_change': 0,
+                        'stale': False
                     })
             
-            return jsonify({'indices': indices_data})
+            return tag_response(jsonify({'indices': indices_data}), indices_etag(symbols))
             
         except Exception as e:
             return jsonify({'error': f'Failed to fetch market indices: {str(e)}'}), 500
 
     @app.route('/portfolio/sector-breakdown', methods=['GET'])
     def get_sector_breakdown():
-        """Get sector breakdown of current holdings"""
+        """Get sector breakdown of current holdings (?portfolio_id=, the first portfolio by default)"""
         try:
-            portfolio = Portfolio.query.filter_by(id=1).first()
-            if not portfolio:
+            portfolio_id = portfolio_id_arg()
+            if portfolio_id is None:
+                return jsonify({'error': 'portfolio_id must be a number'}), 400
+            snapshot = PortfolioSnapshot.load(portfolio_id)
+            if not snapshot:
                 return jsonify({'error': 'Portfolio not found'}), 404
-                
-            holdings = Holding.query.filter_by(portfolio_id=portfolio.id).all()
-            
-            if not holdings:
-                return jsonify({'sectors': []})
-            
-            # Calculate total portfolio value
-            total_value = float(portfolio.cash_balance)
-            sector_data = {}
-            
-            for holding in holdings:
-                current_price = get_current_price(holding.ticker)
-                market_value = float(holding.quantity) * current_price
-                total_value += market_value
-                
-                # Get sector information for this stock
-                try:
-                    stock = yf.Ticker(holding.ticker)
-                    info = stock.info
-                    sector = info.get('sector', 'Unknown')
-                    
-                    if sector in sector_data:
-                        sector_data[sector] += market_value
-                    else:
-                        sector_data[sector] = market_value
-                        
-                except Exception as e:
-                    print(f"Error fetching sector for {holding.ticker}: {str(e)}")
-                    # Use 'Unknown' sector if we can't get the data
-                    if 'Unknown' in sector_data:
-                        sector_data['Unknown'] += market_value
-                    else:
-                        sector_data['Unknown'] = market_value
-            
-            # Convert to percentages and format response
-            sectors = []
-            for sector, value in sector_data.items():
-                if value > 0:  # Only include sectors with holdings
-                    percentage = (value / total_value * 100) if total_value > 0 else 0
-                    sectors.append({
-                        'sector': sector,
-                        'value': round(value, 2),
-                        'percentage': round(percentage, 2)
-                    })
-            
-            # Sort by percentage (highest first)
-            sectors.sort(key=lambda x: x['percentage'], reverse=True)
-            
-            return jsonify({'sectors': sectors})
+
+            return jsonify({'sectors': sector_view(snapshot)})
             
         except Exception as e:
             return jsonify({'error': f'Failed to get sector breakdown: {str(e)}'}), 500
             
+    @app.route('/stream/quotes', methods=['GET'])
+    def stream_quotes():
+        """Server-Sent Events stream of changed quotes ({symbol: {price, change, percent_change}}) for held
+        tickers, the market indices and up to STREAM_MAX_TICKERS extra symbols passed as ?tickers=TSLA,NVDA"""
+        extra_tickers = sorted({t.strip().upper() for t in request.args.get('tickers', '').split(',') if t.strip()})
+        max_tickers = app.config.get('STREAM_MAX_TICKERS', 20)
+        if len(extra_tickers) > max_tickers:
+            return jsonify({'error': f'At most {max_tickers} tickers can be streamed'}), 400
+        # Extra symbols join the shared upstream refresh set under the same rule as /quote, the ones that fail it are
+        # left out so the held tickers and indices keep streaming
+        strict = app.config.get('SYMBOLS_STRICT')
+        extra_tickers = [t for t in extra_tickers if is_valid_ticker(t) and t not in unknown_symbols
+                         and (not strict or t in symbol_directory)]
+        # Every stream holds one of the worker's threads, past the cap the client reconnects with backoff
+        # (useQuoteStream), a browser never retries an EventSource that got an error status by itself
+        subscriber = refresher.subscribe(extra_tickers, limit=app.config.get('STREAM_MAX_CONNECTIONS'))
+        if subscriber is None:
+            return jsonify({'error': 'Too many open quote streams, please retry later'}), 503, {'Retry-After': '30'}
+        return Response(refresher.stream(subscriber), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Prometheus scrape endpoint: request, SQL and upstream latency histograms plus quote cache counters"""
+        cache = quote_cache.stats()
+        gauges = {f'quote_cache_{name}': cache[name] for name in ('hits', 'misses', 'evictions', 'stale_served', 'size')}
+        provider = get_provider()
+        if hasattr(provider, 'breaker'):
+            gauges['upstream_circuit_open'] = int(provider.breaker.state != 'closed')
+        return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/quote-cache/stats', methods=['GET'])
+    def get_quote_cache_stats():
+        """Hit/miss counters for the shared quote cache, plus circuit breaker / rate limiter state when upstream is guarded"""
+        stats = quote_cache.stats()
+        provider = get_provider()
+        if hasattr(provider, 'breaker'):
+            stats['upstream'] = provider.stats()
+        stats['symbols'] = {
+            'directory_size': len(symbol_directory),
+            'unknown_symbols': len(unknown_symbols),
+            'unknown_symbol_hits': unknown_symbols.hits
+        }
+        return jsonify(stats)
+
     # ---- FOR TESTING PURPOSES ONLY ----
     # Resetting the database and creating a default portfolio
     @app.route('/setup', methods=['POST'])
@@ -674,4 +943,7 @@ def register_routes(app):
             db.session.add(transaction5)
             db.session.add(transaction6)
             db.session.commit()
+            backfill_snapshots(portfolio.id)
+            rebuild_lots(portfolio.id)
+            reconcile_aggregates(portfolio.id)
             return jsonify({"message": "Database reset and default portfolio created.", "portfolio_id": portfolio.id}), 201
\ No newline at end of file
@@ -0,0 +1,377 @@
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+
+import numpy as np
+
+import average_cost
+from symbols import is_valid_ticker
+
+logger = logging.getLogger(__name__)
+
+# Rebalancing periods, calendar based, or a number of trading days
+PERIODS = {'weekly': 'datetime64[W]', 'monthly': 'datetime64[M]', 'quarterly': 'quarterly', 'yearly': 'datetime64[Y]'}
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+# Invalid simulation request, the message is safe to show to the user
+class ScenarioError(ValueError):
+    pass
+
+
+def _date(value, name):
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise ScenarioError(f"{name} must be a YYYY-MM-DD date")
+
+
+def _positive(value, name):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ScenarioError(f"{name} must be a positive number")
+    if not math.isfinite(number) or number <= 0:
+        raise ScenarioError(f"{name} must be a positive number")
+    return number
+
+
+def _ticker(value):
+    ticker = (value or '').upper()
+    if not is_valid_ticker(ticker):
+        raise ScenarioError(f"Invalid ticker symbol: {value}")
+    return ticker
+
+
+def parse_trade(data):
+    """One hypothetical trade {date, ticker, quantity, transaction_type, price (optional, close of the day when left
+    out)}, returns (day ordinal, ticker, signed quantity, price or None)"""
+    if not isinstance(data, dict):
+        raise ScenarioError("trades must be a list of objects")
+    transaction_type = (data.get('transaction_type') or '').lower()
+    if transaction_type not in ('buy', 'sell'):
+        raise ScenarioError("transaction_type must be 'buy' or 'sell'")
+    quantity = _positive(data.get('quantity'), 'quantity')
+    price = _positive(data['price'], 'price') if data.get('price') is not None else None
+    return (_date(data.get('date'), 'date').toordinal(), _ticker(data.get('ticker')),
+            quantity if transaction_type == 'buy' else -quantity, price)
+
+
+def parse_rebalance(data):
+    """Periodic rebalancing rule {weights: {ticker: weight}, every: weekly / monthly / quarterly / yearly or a number
+    of trading days, fractional: false}, what the weights leave over stays in cash"""
+    if not isinstance(data, dict) or not isinstance(data.get('weights'), dict) or not data['weights']:
+        raise ScenarioError("rebalance needs weights: {ticker: weight}")
+    weights = {}
+    for ticker, weight in data['weights'].items():
+        try:
+            weight = float(weight)
+        except (TypeError, ValueError):
+            weight = -1
+        if not math.isfinite(weight) or weight < 0:
+            raise ScenarioError("weights must be numbers of 0 or more")
+        weights[_ticker(ticker)] = weight
+    if sum(weights.values()) > 1 + 1e-9:
+        raise ScenarioError("weights must not add up to more than 1")
+
+    every = data.get('every', 'monthly')
+    if isinstance(every, bool) or not (every in PERIODS or (isinstance(every, int) and every > 0)):
+        raise ScenarioError(f"every must be one of {', '.join(PERIODS)} or a number of trading days")
+    return {'weights': weights, 'every': every, 'fractional': bool(data.get('fractional', False))}
+
+
+def parse_scenarios(data, max_scenarios):
+    """The scenarios list of a /simulate request, returns [{name, trades, rebalance, portfolio_id}].
+    A scenario is a trade list (optionally on top of an existing portfolio's transactions) or a rebalancing rule."""
+    scenarios = data.get('scenarios')
+    if not isinstance(scenarios, list) or not scenarios:
+        raise ScenarioError("scenarios must be a non-empty list")
+    if len(scenarios) > max_scenarios:
+        raise ScenarioError(f"At most {max_scenarios} scenarios per request")
+
+    parsed = []
+    for number, scenario in enumerate(scenarios, 1):
+        if not isinstance(scenario, dict):
+            raise ScenarioError("scenarios must be a list of objects")
+        trades = scenario.get('trades') or []
+        portfolio_id = scenario.get('portfolio_id')
+        if not isinstance(trades, list):
+            raise ScenarioError("trades must be a list of objects")
+        if portfolio_id is not None and (isinstance(portfolio_id, bool) or not isinstance(portfolio_id, int)):
+            raise ScenarioError("portfolio_id must be a number")
+        if scenario.get('rebalance') is not None and (trades or portfolio_id is not None):
+            raise ScenarioError("A scenario is either a trade list or a rebalance rule")
+        if scenario.get('rebalance') is None and not trades and portfolio_id is None:
+            raise ScenarioError("Every scenario needs trades, a portfolio_id or a rebalance rule")
+        parsed.append({
+            'name': str(scenario.get('name') or f"scenario {number}"),
+            'trades': [parse_trade(trade) for trade in trades],
+            'rebalance': parse_rebalance(scenario['rebalance']) if scenario.get('rebalance') is not None else None,
+            'portfolio_id': portfolio_id
+        })
+    return parsed
+
+
+def scenario_tickers(scenario):
+    if scenario['rebalance']:
+        return set(scenario['rebalance']['weights'])
+    return {ticker for _, ticker, _, _ in scenario['trades']}
+
+
+# Cash, positions and average cost of one scenario while its trades are applied in order. Buys and sells go through
+# average_cost like apply_buy / apply_sell, column-wise over the traded tickers, so replaying a real trade list
+# matches the portfolio.
+class Ledger:
+
+    def __init__(self, tickers, initial_cash):
+        self.cash = float(initial_cash)
+        self.quantity = np.zeros(tickers)
+        self.cost = np.zeros(tickers)  # total cost basis per ticker
+        self.realized = 0.0
+        self.trades = 0
+
+    def buy(self, cols, quantities, prices):
+        spent = float(np.dot(quantities, prices))
+        if spent > self.cash + 1e-6:
+            raise ScenarioError(f"Insufficient funds: {spent:.2f} needed, {self.cash:.2f} available")
+        self.quantity[cols], self.cost[cols] = average_cost.buy(self.quantity[cols], self.cost[cols], quantities, prices)
+        self.cash -= spent
+        self.trades += len(cols)
+
+    def sell(self, cols, quantities, prices):
+        held = self.quantity[cols]
+        if np.any(quantities > held + 1e-9):
+            raise ScenarioError("Sell quantity exceeds holding quantity")
+        average = np.where(held > 0, self.cost[cols] / np.where(held > 0, held, 1), 0)
+        remaining, cost, realized = average_cost.sell(held, average, quantities, prices)
+        self.realized += float(realized.sum())
+        self.cash += float(np.dot(quantities, prices))
+        # A closed position drops its whole cost basis
+        self.cost[cols] = np.where(remaining > 1e-9, cost, 0)
+        self.quantity[cols] = np.where(remaining > 1e-9, remaining, 0)
+        self.trades += len(cols)
+
+    def state(self):
+        return self.quantity.copy(), self.cost.copy(), self.cash, self.realized
+
+
+def _trade_events(trades, cols, day_ordinals, closes):
+    """Trade list -> [(row, [(col, signed quantity, price)])] in date order. Trades on a non-trading day execute on
+    the next trading day, priced trades before the window (real transactions) are folded into its first day."""
+    events = {}
+    for position, (ordinal, ticker, quantity, price) in sorted(enumerate(trades), key=lambda t: (t[1][0], t[0])):
+        row = int(np.searchsorted(day_ordinals, ordinal, side='left'))
+        if row >= len(day_ordinals):
+            raise ScenarioError(f"{ticker} trade on {date.fromordinal(ordinal)} is after the last trading day")
+        if ordinal < day_ordinals[0] and price is None:
+            raise ScenarioError(f"{ticker} trade on {date.fromordinal(ordinal)} is before the window, give its price")
+        col = cols[ticker]
+        if price is None:
+            price = closes[row, col]
+            if np.isnan(price):
+                raise ScenarioError(f"No close for {ticker} on {date.fromordinal(int(day_ordinals[row]))}")
+        events.setdefault(row, []).append((col, quantity, float(price)))
+    return sorted(events.items())
+
+
+def _run_trades(ledger, events):
+    for row, trades in events:
+        # Trades of a day run one at a time in their given order, so an earlier sell can fund a later buy
+        for col, quantity, price in trades:
+            trade = (np.array([col]), np.array([abs(quantity)]), np.array([price]))
+            if quantity > 0:
+                ledger.buy(*trade)
+            else:
+                ledger.sell(*trade)
+        yield row, ledger.state()
+
+
+def rebalance_rows(day_ordinals, every):
+    """Trading day rows on which a rebalancing rule trades: the first day and the first day of every new period"""
+    if isinstance(every, int):
+        return np.arange(0, len(day_ordinals), every)
+    days = (np.asarray(day_ordinals) - EPOCH_ORDINAL).astype('datetime64[D]')
+    if every == 'quarterly':
+        periods = days.astype('datetime64[M]').astype(np.int64) // 3
+    else:
+        periods = days.astype(PERIODS[every]).astype(np.int64)
+    return np.flatnonzero(np.diff(periods, prepend=periods[0] - 1))
+
+
+def _run_rebalance(ledger, rule, cols, day_ordinals, closes):
+    tickers = np.array([cols[ticker] for ticker in rule['weights']])
+    weights = np.array(list(rule['weights'].values()))
+    for row in rebalance_rows(day_ordinals, rule['every']):
+        prices = closes[row, tickers]
+        priced = ~np.isnan(prices)
+        if not priced.any():
+            continue
+        tickers_now, weights_now, prices_now = tickers[priced], weights[priced], prices[priced]
+        held = ledger.quantity[tickers_now]
+        # Equity marks unpriced holdings at cost, the way the equity curve does
+        equity = ledger.cash + float(np.nansum(np.where(np.isnan(closes[row]), ledger.cost, ledger.quantity * closes[row])))
+        target = weights_now * equity / prices_now
+        if not rule['fractional']:
+            target = np.floor(target + 1e-9)
+
+        # Sells first so their proceeds fund the buys, buys are scaled down if rounding leaves them short of cash
+        delta = target - held
+        sells = delta < -1e-9
+        if sells.any():
+            ledger.sell(tickers_now[sells], -delta[sells], prices_now[sells])
+        buys = delta > 1e-9
+        if buys.any():
+            quantities = delta[buys]
+            spent = float(np.dot(quantities, prices_now[buys]))
+            if spent > ledger.cash:
+                quantities = quantities * (ledger.cash / spent)
+                if not rule['fractional']:
+                    quantities = np.floor(quantities)
+            keep = quantities > 1e-9
+            if keep.any():
+                ledger.buy(tickers_now[buys][keep], quantities[keep], prices_now[buys][keep])
+        yield int(row), ledger.state()
+
+
+def equity_curve(states, closes, initial_cash):
+    """Daily cash, holdings value, cost basis, realized and unrealized P&L from the sparse (row, state) changes of a
+    Ledger, forward filled over the dates x tickers close matrix in one vectorized step. Holdings without a close
+    are valued at cost basis, the same fallback as the daily history."""
+    days, tickers = closes.shape
+    change_rows = [row for row, _ in states]
+    quantity = np.zeros((len(states) + 1, tickers))
+    cost = np.zeros((len(states) + 1, tickers))
+    cash = np.full(len(states) + 1, float(initial_cash))
+    realized = np.zeros(len(states) + 1)
+    for number, (_, (quantities, costs, cash_now, realized_now)) in enumerate(states, 1):
+        quantity[number], cost[number], cash[number], realized[number] = quantities, costs, cash_now, realized_now
+
+    # State index in force on every day, 0 = nothing traded yet
+    current = np.searchsorted(np.array(change_rows, dtype=np.int64), np.arange(days), side='right')
+    quantity, cost, cash, realized = quantity[current], cost[current], cash[current], realized[current]
+    values = np.where(np.isnan(closes), cost, quantity * np.nan_to_num(closes))
+    holdings_value = values.sum(axis=1)
+    cost_basis = cost.sum(axis=1)
+    return {
+        'cash': cash,
+        'holdings_value': holdings_value,
+        'equity': cash + holdings_value,
+        'cost_basis': cost_basis,
+        'realized_pnl': realized,
+        'unrealized_pnl': holdings_value - cost_basis
+    }
+
+
+def _summary(curve, initial_cash, trades):
+    equity = curve['equity']
+    peaks = np.maximum.accumulate(equity)
+    drawdowns = np.where(peaks > 0, equity / np.where(peaks > 0, peaks, 1) - 1, 0)
+    return {
+        'initial_cash': round(float(initial_cash), 2),
+        'final_value': round(float(equity[-1]), 2),
+        'total_return': round(float(equity[-1] / initial_cash - 1), 6),
+        'max_drawdown': round(float(drawdowns.min()), 6),
+        'realized_pnl': round(float(curve['realized_pnl'][-1]), 2),
+        'unrealized_pnl': round(float(curve['unrealized_pnl'][-1]), 2),
+        'cash_balance': round(float(curve['cash'][-1]), 2),
+        'trade_count': trades
+    }
+
+
+def simulate(scenario, tickers, day_ordinals, closes, initial_cash, curves=True):
+    """Run one parsed scenario over the dates x tickers close matrix (columns in tickers order), returns its summary
+    and, with curves, the daily equity, cash and combined P&L. A scenario's own initial_cash (the opening cash of
+    its portfolio) overrides the shared one. Scenario errors are reported, not raised."""
+    result = {'name': scenario['name']}
+    initial_cash = scenario.get('initial_cash') or initial_cash
+    # Only the scenario's own columns of the shared matrix are carried through the day-by-day arrays
+    used = sorted(scenario_tickers(scenario))
+    columns = {ticker: col for col, ticker in enumerate(tickers)}
+    closes = closes[:, [columns[ticker] for ticker in used]]
+    cols = {ticker: col for col, ticker in enumerate(used)}
+    ledger = Ledger(len(used), initial_cash)
+    try:
+        if scenario['rebalance']:
+            states = list(_run_rebalance(ledger, scenario['rebalance'], cols, day_ordinals, closes))
+        else:
+            states = list(_run_trades(ledger, _trade_events(scenario['trades'], cols, day_ordinals, closes)))
+    except ScenarioError as e:
+        result['error'] = str(e)
+        return result
+
+    curve = equity_curve(states, closes, initial_cash)
+    result.update(_summary(curve, initial_cash, ledger.trades))
+    if curves:
+        result['equity'] = np.round(curve['equity'], 2).tolist()
+        result['cash'] = np.round(curve['cash'], 2).tolist()
+        result['pnl'] = np.round(curve['realized_pnl'] + curve['unrealized_pnl'], 2).tolist()
+    return result
+
+
+def _simulate_chunk(scenarios, tickers, day_ordinals, closes, initial_cash, curves):
+    # Process pool task: a slice of the request's scenarios against the shared close matrix
+    return [simulate(scenario, tickers, day_ordinals, closes, initial_cash, curves) for scenario in scenarios]
+
+
+# Process pool shared by the requests of one worker process, created on first use. Workers are spawned rather than
+# forked: the app runs threads (refresher, market data loop) that a forked child would inherit mid-flight.
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _executor(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def reset_after_fork():
+    """Forget the parent's pool in a forked worker (gunicorn post_fork), its processes belong to the parent"""
+    global _pool
+    _pool = None
+
+
+def default_workers():
+    return min(os.cpu_count() or 1, 8)
+
+
+def run_scenarios(scenarios, tickers, day_ordinals, closes, initial_cash, curves=True, workers=None, parallel_min=16):
+    """Evaluate many scenarios against one close matrix, returns (results in request order, processes used).
+    Batches of at least parallel_min scenarios are split into chunks over a process pool, smaller ones (and a
+    broken pool) run in this process where the pool start up and transfer would cost more than the math."""
+    workers = default_workers() if workers is None else workers
+    args = (tickers, day_ordinals, closes, initial_cash, curves)
+    if workers <= 1 or len(scenarios) < max(parallel_min, 2):
+        return _simulate_chunk(scenarios, *args), 1
+
+    # A few chunks per process evens out scenarios of different cost, each chunk carries its own matrix copy
+    size = math.ceil(len(scenarios) / (workers * 4))
+    chunks = [scenarios[start:start + size] for start in range(0, len(scenarios), size)]
+    pool = _executor(workers)
+    try:
+        futures = [pool.submit(_simulate_chunk, chunk, *args) for chunk in chunks]
+        return [result for future in futures for result in future.result()], min(workers, len(chunks))
+    except BrokenProcessPool as e:
+        logger.warning("Simulation pool failed, running %d scenarios in process: %s", len(scenarios), e)
+        _discard_pool(pool)
+        return _simulate_chunk(scenarios, *args), 1
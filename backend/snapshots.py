@@ -0,0 +1,128 @@
+from sqlalchemy import case, func
+
+from models import db, Portfolio, Holding, Transaction, PortfolioDailySnapshot
+from history import ReplayState
+
+
+def opening_cash(portfolio):
+    """Cash the portfolio started with: its live balance with the cash flow of every trade undone.
+    Replays start from it, so replayed history ends on the same live balance record_snapshot() stores."""
+    flow = Transaction.price * Transaction.quantity
+    spent = db.session.query(func.sum(case((Transaction.transaction_type == 'buy', flow), else_=-flow))).filter(
+        Transaction.portfolio_id == portfolio.id
+    ).scalar()
+    return float(portfolio.cash_balance) + float(spent or 0)
+
+
+def record_snapshot(portfolio, snapshot_date, realized_pnl=0, trades=1):
+    """Upsert the end-of-day snapshot for snapshot_date after a trade, inside the caller's DB transaction.
+    realized_pnl is what the trade(s) just realized, it is added to the running total of the previous snapshot."""
+    snapshot = PortfolioDailySnapshot.query.filter(
+        PortfolioDailySnapshot.portfolio_id == portfolio.id,
+        PortfolioDailySnapshot.snapshot_date <= snapshot_date
+    ).order_by(PortfolioDailySnapshot.snapshot_date.desc()).first()
+
+    if snapshot is None:
+        # Portfolios with older trades but no snapshots have to be backfilled first (flask backfill-snapshots),
+        # until then daily history keeps replaying the transaction log for them
+        if Transaction.query.filter_by(portfolio_id=portfolio.id).count() > trades:
+            return None
+        realized_before = 0
+        trades_before = 0
+    else:
+        realized_before = float(snapshot.realized_pnl)
+        trades_before = snapshot.trade_count
+
+    holdings = Holding.query.filter_by(portfolio_id=portfolio.id).all()
+    if snapshot is None or snapshot.snapshot_date != snapshot_date:
+        snapshot = PortfolioDailySnapshot(portfolio_id=portfolio.id, snapshot_date=snapshot_date)
+        db.session.add(snapshot)
+
+    snapshot.cash_balance = portfolio.cash_balance
+    snapshot.realized_pnl = realized_before + float(realized_pnl)
+    snapshot.trade_count = trades_before + trades
+    snapshot.positions = {h.ticker: {
+        'quantity': float(h.quantity),
+        'cost_basis': float(h.cost_basis),
+        'total_cost_basis': float(h.quantity) * float(h.cost_basis)
+    } for h in holdings}
+    return snapshot
+
+
+def backfill_snapshots(portfolio_id, initial_cash=None):
+    """Rebuild every snapshot of a portfolio from its transaction log in one streaming pass, returns the row count.
+    The replay starts from opening_cash() unless initial_cash is given."""
+    if initial_cash is None:
+        initial_cash = opening_cash(db.session.get(Portfolio, portfolio_id))
+    PortfolioDailySnapshot.query.filter_by(portfolio_id=portfolio_id).delete(synchronize_session=False)
+
+    transactions = Transaction.query.filter_by(portfolio_id=portfolio_id).order_by(
+        Transaction.transaction_date.asc(), Transaction.id.asc()
+    ).yield_per(1000)
+
+    state = ReplayState(initial_cash)
+    current_date = None
+    trade_count = 0
+    written = 0
+
+    def flush(day):
+        db.session.add(PortfolioDailySnapshot(
+            portfolio_id=portfolio_id,
+            snapshot_date=day,
+            cash_balance=state.cash,
+            realized_pnl=state.realized_pnl,
+            trade_count=trade_count,
+            positions={ticker: dict(info) for ticker, info in state.holdings.items()}
+        ))
+
+    for transaction in transactions:
+        transaction_day = transaction.transaction_date.date()
+        if current_date is not None and transaction_day != current_date:
+            flush(current_date)
+            written += 1
+        state.apply(transaction)
+        trade_count += 1
+        current_date = transaction_day
+
+    if current_date is not None:
+        flush(current_date)
+        written += 1
+
+    db.session.commit()
+    return written
+
+
+def has_snapshots(portfolio_id):
+    return db.session.query(PortfolioDailySnapshot.id).filter_by(portfolio_id=portfolio_id).first() is not None
+
+
+def snapshot_changes(portfolio_id, start_date, end_date):
+    """Read the stored snapshots for a window as value_daily_history() changes.
+    Returns (changes, tickers, trade_count): the last snapshot before start_date seeds day 0, only
+    the rows inside the window are scanned after that."""
+    base = PortfolioDailySnapshot.query.filter(
+        PortfolioDailySnapshot.portfolio_id == portfolio_id,
+        PortfolioDailySnapshot.snapshot_date < start_date
+    ).order_by(PortfolioDailySnapshot.snapshot_date.desc()).first()
+
+    rows = PortfolioDailySnapshot.query.filter(
+        PortfolioDailySnapshot.portfolio_id == portfolio_id,
+        PortfolioDailySnapshot.snapshot_date.between(start_date, end_date)
+    ).order_by(PortfolioDailySnapshot.snapshot_date.asc()).all()
+
+    changes = []
+    tickers = set()
+    previous = {}
+    trade_count = 0
+    for snapshot in ([base] if base else []) + rows:
+        day = max((snapshot.snapshot_date - start_date).days, 0)
+        positions = dict(snapshot.positions or {})
+        # Tickers that were open in the previous snapshot and are gone now were closed that day
+        for ticker in previous:
+            positions.setdefault(ticker, None)
+        changes.append((day, float(snapshot.cash_balance), float(snapshot.realized_pnl), positions))
+        tickers.update(snapshot.positions or {})
+        previous = snapshot.positions or {}
+        trade_count = snapshot.trade_count
+
+    return changes, sorted(tickers), trade_count
@@ -0,0 +1,154 @@
+import bisect
+import csv
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bundled ticker -> name / exchange / sector list, replace or extend it without touching code
+DEFAULT_SYMBOLS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'symbols.csv')
+
+# Shape of anything yfinance could know about: letters, digits and the . - ^ = used by classes, indices and futures
+TICKER_PATTERN = re.compile(r'^[A-Z0-9^][A-Z0-9.\-=^]{0,11}$')
+
+
+def is_valid_ticker(ticker):
+    return bool(TICKER_PATTERN.match(ticker or ''))
+
+
+# Local symbol directory, loaded from a CSV file and searched with binary search over sorted keys,
+# so validation and autocomplete never go to the network
+class SymbolDirectory:
+
+    def __init__(self, path=DEFAULT_SYMBOLS_FILE):
+        self.path = path
+        self._symbols = {}  # symbol -> {symbol, name, exchange, sector}
+        self._sorted_symbols = []
+        self._sorted_names = []  # (lowercase name, symbol)
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def load(self):
+        """(Re)read the file, the swap is atomic so readers never see a half loaded directory"""
+        symbols = {}
+        with open(self.path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                symbol = (row.get('symbol') or '').strip().upper()
+                if symbol:
+                    symbols[symbol] = {
+                        'symbol': symbol,
+                        'name': (row.get('name') or '').strip(),
+                        'exchange': (row.get('exchange') or '').strip(),
+                        'sector': (row.get('sector') or '').strip()
+                    }
+        sorted_symbols = sorted(symbols)
+        sorted_names = sorted((entry['name'].lower(), symbol) for symbol, entry in symbols.items() if entry['name'])
+        with self._lock:
+            self._symbols, self._sorted_symbols, self._sorted_names = symbols, sorted_symbols, sorted_names
+            self._mtime = os.path.getmtime(self.path)
+        return len(symbols)
+
+    def reload_if_changed(self):
+        try:
+            if os.path.getmtime(self.path) != self._mtime:
+                self.load()
+        except OSError as e:
+            logger.warning("Symbol directory reload failed: %s", e)
+
+    def start_reloader(self, interval=300):
+        """Pick up edits to the symbol file every interval seconds in a background thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed()
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=run, name='symbol-directory-reloader', daemon=True)
+                self._thread.start()
+
+    def reset_after_fork(self):
+        """In a forked worker the reloader thread is gone (and the lock may have been held by it)"""
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def __contains__(self, ticker):
+        return ticker.upper() in self._symbols
+
+    def lookup(self, ticker):
+        return self._symbols.get(ticker.upper())
+
+    def search(self, query, limit=10):
+        """Symbols starting with query first, then symbols whose company name starts with it"""
+        query = query.strip()
+        if not query:
+            return []
+        symbols, sorted_symbols, sorted_names = self._symbols, self._sorted_symbols, self._sorted_names
+
+        matches = []
+        prefix = query.upper()
+        start = bisect.bisect_left(sorted_symbols, prefix)
+        for symbol in sorted_symbols[start:]:
+            if not symbol.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(symbol)
+
+        prefix = query.lower()
+        start = bisect.bisect_left(sorted_names, (prefix,))
+        for name, symbol in sorted_names[start:]:
+            if not name.startswith(prefix) or len(matches) >= limit:
+                break
+            if symbol not in matches:
+                matches.append(symbol)
+
+        return [symbols[symbol] for symbol in matches]
+
+
+# Tickers upstream said do not exist, remembered for ttl seconds so repeated lookups are answered locally
+class NegativeCache:
+
+    def __init__(self, ttl=3600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._expires = {}  # ticker -> monotonic expiry
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def add(self, ticker):
+        with self._lock:
+            if len(self._expires) >= self.max_entries:
+                # Drop expired entries first, then the oldest ones
+                now = time.monotonic()
+                self._expires = {t: expiry for t, expiry in self._expires.items() if expiry > now}
+                while len(self._expires) >= self.max_entries:
+                    self._expires.pop(next(iter(self._expires)))
+            self._expires[ticker.upper()] = time.monotonic() + self.ttl
+
+    def discard(self, ticker):
+        with self._lock:
+            self._expires.pop(ticker.upper(), None)
+
+    def __contains__(self, ticker):
+        with self._lock:
+            expiry = self._expires.get(ticker.upper())
+            if expiry is None:
+                return False
+            if expiry <= time.monotonic():
+                del self._expires[ticker.upper()]
+                return False
+            self.hits += 1
+            return True
+
+    def __len__(self):
+        return len(self._expires)
+
+
+symbol_directory = SymbolDirectory()
+unknown_symbols = NegativeCache()
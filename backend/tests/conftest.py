@@ -0,0 +1,45 @@
+"""Shared fixtures: an app on a throw-away SQLite database with an offline price feed.
+
+Run from the backend folder:  python -m pytest -q tests
+"""
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import market_data
+from app import create_app
+from market_data import StaticProvider
+from models import db, Portfolio
+
+PRICES = {'AAPL': 100.0, 'MSFT': 200.0, 'VOO': 400.0}
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'SCHEMA_AUTO_CREATE': True,
+        'SYMBOLS_RELOAD_INTERVAL': 0,
+    })
+    market_data.set_provider(StaticProvider({ticker: {'regularMarketPrice': price} for ticker, price in PRICES.items()}))
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def feed(app):
+    return market_data.get_provider()
+
+
+@pytest.fixture
+def portfolio(app):
+    portfolio = Portfolio(name='Test', cash_balance=Decimal('10000'))
+    db.session.add(portfolio)
+    db.session.commit()
+    return portfolio
@@ -0,0 +1,44 @@
+"""Running realized P&L, cost basis and trade count on Portfolio stay equal to what the transaction log and the
+holdings add up to."""
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from aggregates import AGGREGATES, actual_aggregates, reconcile_aggregates
+from models import db, Portfolio, Transaction
+from trading import apply_buy, apply_sell, execute_trade
+
+
+def trade(apply, portfolio, ticker, quantity, price):
+    return execute_trade(apply, portfolio.id, ticker, Decimal(quantity), Decimal(price))
+
+
+def test_running_totals_follow_every_trade(app, portfolio):
+    trade(apply_buy, portfolio, 'AAPL', 7, '101.37')
+    trade(apply_buy, portfolio, 'AAPL', 3, '99.13')
+    trade(apply_buy, portfolio, 'MSFT', '2.5', '201.01')
+    trade(apply_sell, portfolio, 'AAPL', 4, '104.99')
+    trade(apply_sell, portfolio, 'MSFT', '2.5', '198.42')  # closes the position
+
+    db.session.expire_all()
+    portfolio = db.session.get(Portfolio, portfolio.id)
+    assert portfolio.trade_count == 5
+    assert portfolio.realized_pnl_total == sum(t.realized_pnl for t in Transaction.query.filter_by(transaction_type='sell'))
+    assert reconcile_aggregates(portfolio.id, fix=False) == []
+
+
+def test_reconcile_repairs_drift(app, portfolio):
+    trade(apply_buy, portfolio, 'AAPL', 10, 100)
+    trade(apply_sell, portfolio, 'AAPL', 4, 110)
+    db.session.execute(text("UPDATE portfolios SET trade_count = 9, total_cost_basis = 0 WHERE id = :id"),
+                       {'id': portfolio.id})
+    db.session.commit()
+
+    drifts = reconcile_aggregates(portfolio.id)
+    assert {drift['field'] for drift in drifts} == {'trade_count', 'total_cost_basis'}
+    assert reconcile_aggregates(portfolio.id, fix=False) == []
+    db.session.expire_all()
+    portfolio = db.session.get(Portfolio, portfolio.id)
+    expected = actual_aggregates(portfolio.id)[portfolio.id]
+    assert {field: getattr(portfolio, field) for field in AGGREGATES} == expected
+    assert portfolio.trade_count == 2
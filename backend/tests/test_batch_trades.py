@@ -0,0 +1,53 @@
+"""/trades/batch: orders validated in submission order against projected cash and holdings, one commit."""
+from decimal import Decimal
+
+from aggregates import reconcile_aggregates
+from market_data import quote_cache
+from models import db, Holding, Portfolio, PortfolioDailySnapshot, Transaction
+
+
+def submit(app, portfolio, orders, mode=None):
+    body = {'portfolio_id': portfolio.id, 'orders': orders}
+    if mode:
+        body['mode'] = mode
+    response = app.test_client().post('/trades/batch', json=body)
+    db.session.expire_all()
+    return response.status_code, response.get_json()
+
+
+def order(transaction_type, ticker, quantity):
+    return {'transaction_type': transaction_type, 'ticker': ticker, 'quantity': quantity}
+
+
+def test_all_or_nothing_books_nothing_when_one_order_fails(app, portfolio):
+    status, body = submit(app, portfolio, [order('buy', 'AAPL', 10), order('sell', 'MSFT', 1)])
+    assert status == 400 and body['filled'] == 0 and body['rejected'] == 1
+    assert [result['status'] for result in body['results']] == ['not_executed', 'rejected']
+    assert db.session.get(Portfolio, portfolio.id).cash_balance == 10000
+    assert Transaction.query.count() == 0 and Holding.query.count() == 0
+
+
+def test_best_effort_books_the_valid_orders(app, portfolio):
+    status, body = submit(app, portfolio, [
+        order('buy', 'AAPL', 10),  # 1000
+        order('sell', 'MSFT', 1),  # not held
+        order('buy', 'VOO', 30),  # 12000, more than the projected cash
+        order('sell', 'AAPL', 4),  # covered by the first order of the batch
+        order('buy', 'AAPL', 'x'),  # invalid
+    ], mode='best_effort')
+    assert status == 200 and body['filled'] == 2 and body['rejected'] == 3
+    assert [result['status'] for result in body['results']] == ['filled', 'rejected', 'rejected', 'filled', 'rejected']
+
+    assert db.session.get(Portfolio, portfolio.id).cash_balance == Decimal('9400')
+    assert Holding.query.one().quantity == 6
+    assert Transaction.query.count() == 2
+    assert PortfolioDailySnapshot.query.one().trade_count == 2
+    assert reconcile_aggregates(portfolio.id, fix=False) == []
+
+
+def test_stale_prices_execute_nothing(app, feed, portfolio):
+    feed.infos['AAPL']['stale'] = True
+    quote_cache.invalidate()
+    status, body = submit(app, portfolio, [order('buy', 'MSFT', 1), order('buy', 'AAPL', 1)], mode='best_effort')
+    assert status == 503 and body['filled'] == 0 and 'AAPL' in body['error']
+    assert Transaction.query.count() == 0
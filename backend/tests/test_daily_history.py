@@ -0,0 +1,82 @@
+"""Daily history must not depend on whether it is served from the snapshots or replayed from the transaction log.
+
+Run from the backend folder:  python -m pytest -q tests
+"""
+import os
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import market_data
+from analytics import daily_history
+from app import create_app
+from market_data import StaticProvider
+from models import db, Portfolio, Transaction, PortfolioDailySnapshot
+from snapshots import backfill_snapshots
+from trading import apply_buy, apply_sell, execute_trade
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'history.db'}",
+        'SCHEMA_AUTO_CREATE': True,
+        'SYMBOLS_RELOAD_INTERVAL': 0,
+    })
+    days = [TODAY - timedelta(days=n) for n in range(60)]
+    market_data.set_provider(StaticProvider(
+        infos={'AAPL': {'regularMarketPrice': 120.0}, 'MSFT': {'regularMarketPrice': 210.0}},
+        closes={'AAPL': {day: 100.0 + day.day for day in days}, 'MSFT': {day: 200.0 - day.day for day in days}}
+    ))
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def book_trades():
+    # Opening cash other than the 100000 the replay used to assume
+    portfolio = Portfolio(name='History', cash_balance=Decimal('250000'))
+    db.session.add(portfolio)
+    db.session.commit()
+    for apply, ticker, quantity, price in [(apply_buy, 'AAPL', 10, 100), (apply_buy, 'MSFT', 5, 200),
+                                           (apply_sell, 'AAPL', 4, 110), (apply_buy, 'AAPL', 3, 105)]:
+        execute_trade(apply, portfolio.id, ticker, Decimal(quantity), Decimal(price))
+    return portfolio
+
+
+def replayed(portfolio, start_date, end_date):
+    PortfolioDailySnapshot.query.filter_by(portfolio_id=portfolio.id).delete()
+    db.session.commit()
+    return daily_history(portfolio, start_date, end_date, (end_date - start_date).days + 1)
+
+
+def test_live_snapshots_match_replay(app):
+    """Snapshots recorded by the trades themselves (live cash, trades on end_date) against a replay"""
+    portfolio = book_trades()
+    start_date = TODAY - timedelta(days=9)
+    from_snapshots = daily_history(portfolio, start_date, TODAY, 10)
+
+    assert from_snapshots[1] == 4
+    assert from_snapshots[0][-1]['cash_balance'] == pytest.approx(float(portfolio.cash_balance))
+    assert replayed(portfolio, start_date, TODAY) == from_snapshots
+
+
+def test_backfilled_snapshots_match_replay(app):
+    """Trades spread over several days, windows starting before, between and after them and ending on a trade day"""
+    portfolio = book_trades()
+    for transaction, days_ago in zip(Transaction.query.order_by(Transaction.id), (20, 12, 12, 5)):
+        transaction.transaction_date = datetime.combine(TODAY - timedelta(days=days_ago), datetime.min.time()) + timedelta(hours=15)
+    db.session.commit()
+
+    for start_date, end_date in [(TODAY - timedelta(days=30), TODAY), (TODAY - timedelta(days=15), TODAY - timedelta(days=12)),
+                                 (TODAY - timedelta(days=11), TODAY - timedelta(days=5)), (TODAY - timedelta(days=3), TODAY)]:
+        backfill_snapshots(portfolio.id)
+        from_snapshots = daily_history(portfolio, start_date, end_date, (end_date - start_date).days + 1)
+        assert replayed(portfolio, start_date, end_date) == from_snapshots
@@ -0,0 +1,23 @@
+"""Metrics stay bounded: failed statements leave no start times behind, unknown symbols share one series."""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from instrumentation import metrics
+from market_data import get_quotes
+from models import db
+
+
+def test_failed_statement_leaves_no_start_time(app):
+    connection = db.session.connection()
+    with pytest.raises(OperationalError):
+        connection.execute(text('SELECT * FROM no_such_table'))
+    assert connection.info.get('query_started') == []
+
+
+def test_upstream_series_only_for_known_symbols(app):
+    metrics.reset()
+    get_quotes(['AAPL', 'XYZ123', 'QQQQ9', '^GSPC'])
+    rendered = metrics.render()
+    assert 'symbol="AAPL"' in rendered and 'symbol="^GSPC"' in rendered and 'symbol="other"' in rendered
+    assert 'XYZ123' not in rendered and 'QQQQ9' not in rendered
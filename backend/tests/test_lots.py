@@ -0,0 +1,90 @@
+"""Tax lots: FIFO / LIFO / specific-lot consumption, per-lot realized P&L next to the average cost one, rebuilds."""
+from decimal import Decimal
+from functools import partial
+
+import pytest
+
+from lots import rebuild_lots
+from models import db, Holding, Lot, LotClosure
+from trading import TradeError, apply_buy, apply_sell, execute_trade
+
+
+def buy(portfolio, ticker, quantity, price):
+    return execute_trade(apply_buy, portfolio.id, ticker, Decimal(quantity), Decimal(price))
+
+
+def sell(portfolio, ticker, quantity, price, **lot_selection):
+    return execute_trade(partial(apply_sell, **lot_selection), portfolio.id, ticker, Decimal(quantity), Decimal(price))
+
+
+def open_lots(portfolio, ticker):
+    return [(lot.quantity, lot.remaining_quantity, lot.cost_per_share) for lot in
+            Lot.query.filter_by(portfolio_id=portfolio.id, ticker=ticker).order_by(Lot.acquired_at, Lot.id)]
+
+
+@pytest.mark.parametrize('method, lot_pnl, remaining', [('fifo', '350.00', [0, 5]), ('lifo', '250.00', [5, 0])])
+def test_sell_closes_lots_in_method_order(app, portfolio, method, lot_pnl, remaining):
+    buy(portfolio, 'AAPL', 10, 100)
+    buy(portfolio, 'AAPL', 10, 120)
+    result = sell(portfolio, 'AAPL', 15, 130, lot_method=method)
+
+    # Average cost (110) and tax lot P&L are both reported, and labelled
+    assert result['realized_pnl'] == '300.00' and result['realized_pnl_basis'] == 'average_cost'
+    assert result['lot_method'] == method and result['lot_realized_pnl'] == lot_pnl
+    assert [lot[1] for lot in open_lots(portfolio, 'AAPL')] == remaining
+    assert sum(closure.realized_pnl for closure in LotClosure.query) == Decimal(lot_pnl)
+
+
+def test_configured_lot_method_is_the_default(app, portfolio):
+    app.config['LOT_METHOD'] = 'lifo'
+    buy(portfolio, 'AAPL', 10, 100)
+    buy(portfolio, 'AAPL', 10, 120)
+    assert sell(portfolio, 'AAPL', 5, 130)['lot_method'] == 'lifo'
+    assert [lot[1] for lot in open_lots(portfolio, 'AAPL')] == [10, 5]
+
+
+def test_specific_lots(app, portfolio):
+    buy(portfolio, 'AAPL', 10, 100)
+    buy(portfolio, 'AAPL', 10, 120)
+    first, second = Lot.query.order_by(Lot.id)
+    result = sell(portfolio, 'AAPL', 4, 130, lot_method='specific', lot_ids=[second.id])
+    assert [lot['lot_id'] for lot in result['lots']] == [second.id]
+    assert [lot[1] for lot in open_lots(portfolio, 'AAPL')] == [10, 6]
+
+    # Selected lots that cannot cover the sell book nothing
+    with pytest.raises(TradeError):
+        sell(portfolio, 'AAPL', 8, 130, lot_method='specific', lot_ids=[second.id])
+    assert Holding.query.one().quantity == 16
+    assert [lot[1] for lot in open_lots(portfolio, 'AAPL')] == [10, 6]
+
+
+@pytest.mark.parametrize('method, left_at', [('fifo', -1), ('lifo', 0)])
+def test_sell_walks_lots_across_pages(app, portfolio, method, left_at):
+    # More lots than one keyset page (20) holds
+    for number in range(45):
+        buy(portfolio, 'VOO', 1, 100 + number)
+    sell(portfolio, 'VOO', 44, 200, lot_method=method)
+    lots = open_lots(portfolio, 'VOO')
+    assert [lot[1] for lot in lots].count(0) == 44
+    assert lots[left_at][1] == 1
+    assert LotClosure.query.count() == 44
+
+
+def test_rebuild_matches_the_lots_booked_by_trades(app, portfolio):
+    buy(portfolio, 'AAPL', 10, 100)
+    buy(portfolio, 'MSFT', 5, 200)
+    buy(portfolio, 'AAPL', 10, 120)
+    sell(portfolio, 'AAPL', 15, 130)
+    sell(portfolio, 'MSFT', 2, 190)
+    buy(portfolio, 'AAPL', 3, 90)
+
+    def state():
+        lots = sorted((lot.ticker, lot.quantity, lot.remaining_quantity, lot.cost_per_share) for lot in Lot.query)
+        closures = sorted((c.ticker, c.quantity, c.realized_pnl, c.lot.cost_per_share, c.sell_transaction_id)
+                          for c in LotClosure.query)
+        return lots, closures
+
+    booked = state()
+    assert rebuild_lots(portfolio.id) == (4, 3)
+    db.session.expire_all()
+    assert state() == booked
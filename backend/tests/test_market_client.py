@@ -0,0 +1,41 @@
+"""Upstream calls still queued for a slot when the caller gives up are cancelled, started ones finish on their own.
+
+Run from the backend folder:  python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from market_client import AsyncMarketDataClient, UpstreamTimeout
+
+
+def test_timeout_cancels_queued_calls():
+    client = AsyncMarketDataClient(max_in_flight=2, timeout=5)
+    started = []
+    release = threading.Event()
+
+    def slow(key):
+        started.append(key)
+        release.wait(5)
+        return key
+
+    with pytest.raises(UpstreamTimeout):
+        client.run(client.call_many(slow, range(10)), timeout=0.3)
+    release.set()
+    time.sleep(0.3)
+
+    # Only the two calls holding a slot ever reached upstream
+    assert sorted(started) == [0, 1]
+    assert client.fetch(lambda: 'free again') == 'free again'
+
+
+def test_slow_call_times_out_alone():
+    client = AsyncMarketDataClient(max_in_flight=4, timeout=0.2)
+    results = client.fetch_many(lambda key: time.sleep(1) if key == 'slow' else key, ['a', 'slow', 'b'])
+    assert results['a'] == 'a' and results['b'] == 'b'
+    assert isinstance(results['slow'], UpstreamTimeout)
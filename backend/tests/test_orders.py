@@ -0,0 +1,96 @@
+"""Resting limit / stop orders: triggering, fills through the trade accounting and rejections."""
+from decimal import Decimal
+
+import pytest
+
+import orders
+from aggregates import reconcile_aggregates
+from models import db, Order, Holding, Portfolio, Transaction
+from orders import OrderBook, OrderMatcher, OPEN, FILLED, REJECTED, CANCELLED
+from trading import TradeError
+
+
+def rest(portfolio, ticker, transaction_type, order_type, quantity, trigger):
+    order = Order(portfolio_id=portfolio.id, ticker=ticker, transaction_type=transaction_type, order_type=order_type,
+                  quantity=Decimal(quantity), trigger_price=Decimal(trigger))
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+def tick(matcher, **prices):
+    results = matcher.on_quotes({ticker: {'regularMarketPrice': price} for ticker, price in prices.items()})
+    # Fills run in the matcher's own session, read their outcome afresh
+    db.session.expire_all()
+    return results
+
+
+def test_busy_portfolio_leaves_order_open(app, portfolio, monkeypatch):
+    matcher = OrderMatcher(app)
+    order = rest(portfolio, 'AAPL', 'buy', 'limit', 5, 95)
+    matcher.add(order)
+
+    def busy(*args, **kwargs):
+        raise TradeError("Portfolio is busy with other trades, please retry", status=409)
+    monkeypatch.setattr(orders, 'execute_trade', busy)
+    assert tick(matcher, AAPL=94.0) == []
+    assert db.session.get(Order, order.id).status == OPEN
+    assert len(matcher.book) == 1
+
+    monkeypatch.undo()
+    assert tick(matcher, AAPL=94.0) == [(order.id, FILLED)]
+    assert db.session.get(Holding, 1).quantity == 5
+
+
+def test_order_the_account_cannot_cover_is_rejected(app, portfolio):
+    matcher = OrderMatcher(app)
+    order = rest(portfolio, 'MSFT', 'buy', 'limit', 100, 190)
+    matcher.add(order)
+    assert tick(matcher, MSFT=189.0) == [(order.id, REJECTED)]
+    order = db.session.get(Order, order.id)
+    assert order.status == REJECTED and 'Insufficient' in order.reject_reason
+    assert len(matcher.book) == 0
+
+
+@pytest.mark.parametrize('transaction_type, order_type, quiet, crossing', [
+    ('buy', 'limit', 101, 100), ('sell', 'stop', 101, 99.5), ('sell', 'limit', 99, 100), ('buy', 'stop', 99, 100.5)])
+def test_order_book_fires_on_the_trigger_side(transaction_type, order_type, quiet, crossing):
+    book = OrderBook()
+    book.add(1, 'AAPL', transaction_type, order_type, 100)
+    book.add(2, 'MSFT', transaction_type, order_type, 100)
+    assert book.crossed({'AAPL': quiet}) == []
+    assert book.crossed({'AAPL': crossing}) == [(1, crossing)]
+    assert book.crossed({'AAPL': crossing}) == [] and 1 not in book and 2 in book
+
+
+def test_fill_books_the_trade_at_the_tick_price(app, portfolio):
+    matcher = OrderMatcher(app)
+    buy = rest(portfolio, 'AAPL', 'buy', 'limit', 10, 95)
+    matcher.add(buy)
+    assert tick(matcher, AAPL=96.0) == []
+    assert tick(matcher, AAPL=94.5) == [(buy.id, FILLED)]
+
+    order = db.session.get(Order, buy.id)
+    assert order.fill_price == Decimal('94.5') and order.closed_at is not None
+    assert Transaction.query.one().price == Decimal('94.5')
+    assert db.session.get(Portfolio, portfolio.id).cash_balance == Decimal('9055')
+
+    stop = rest(portfolio, 'AAPL', 'sell', 'stop', 4, 90)
+    matcher.add(stop)
+    assert tick(matcher, AAPL=89.0) == [(stop.id, FILLED)]
+    assert Holding.query.one().quantity == 6
+    assert reconcile_aggregates(portfolio.id, fix=False) == []
+
+
+def test_cancelled_and_stale_orders_never_fill(app, portfolio):
+    matcher = OrderMatcher(app)
+    order = rest(portfolio, 'AAPL', 'buy', 'limit', 1, 95)
+    matcher.add(order)
+    assert matcher.on_quotes({'AAPL': {'regularMarketPrice': 90.0, 'stale': True}}) == []
+    assert len(matcher.book) == 1
+
+    # Cancelled in the database by another worker, still resting in this worker's book
+    assert app.test_client().post(f'/orders/{order.id}/cancel').status_code == 200
+    assert tick(matcher, AAPL=90.0) == [(order.id, None)]
+    assert db.session.get(Order, order.id).status == CANCELLED
+    assert Transaction.query.count() == 0
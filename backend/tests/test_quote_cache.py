@@ -0,0 +1,111 @@
+"""Quote cache expiry, LRU bound, single-flight fetching and stale fallback, on a hand-driven clock."""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import quote_cache
+from quote_cache import QuoteCache
+
+
+class Upstream:
+
+    def __init__(self):
+        self.calls = []
+        self.failing = False
+
+    def fetch(self, ticker):
+        self.calls.append(ticker)
+        if self.failing:
+            raise ConnectionError('upstream down')
+        return {'regularMarketPrice': len(self.calls)}
+
+    def fetch_many(self, tickers):
+        self.calls.append(tuple(tickers))
+        if self.failing:
+            raise ConnectionError('upstream down')
+        return {ticker: {'regularMarketPrice': len(self.calls)} for ticker in tickers}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(quote_cache, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+
+def test_entries_expire_after_ttl(clock, upstream):
+    cache = QuoteCache(upstream.fetch, price_ttl=15)
+    assert cache.get('aapl') == cache.get('AAPL') == {'regularMarketPrice': 1}
+    clock.now += 14.9
+    assert cache.get('AAPL')['regularMarketPrice'] == 1
+    clock.now += 0.1
+    assert cache.get('AAPL')['regularMarketPrice'] == 2
+    assert upstream.calls == ['AAPL', 'AAPL']
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_least_recently_used_entry_is_evicted(clock, upstream):
+    cache = QuoteCache(upstream.fetch, price_ttl=15, max_entries=2)
+    cache.get('AAPL')
+    cache.get('MSFT')
+    cache.get('AAPL')  # MSFT is now the oldest
+    cache.get('VOO')
+    assert cache.snapshot_token(['AAPL', 'VOO']) is not None
+    assert cache.snapshot_token(['MSFT']) is None
+    assert cache.stats()['evictions'] == 1 and cache.stats()['size'] == 2
+
+
+def test_get_many_fetches_only_misses_in_one_call(clock, upstream):
+    cache = QuoteCache(upstream.fetch, upstream.fetch_many, price_ttl=15)
+    cache.get('AAPL')
+    assert set(cache.get_many(['aapl', 'MSFT', 'VOO'])) == {'AAPL', 'MSFT', 'VOO'}
+    assert upstream.calls == ['AAPL', ('MSFT', 'VOO')]
+    clock.now += 5
+    cache.get_many(['AAPL', 'MSFT'], max_age=1)
+    assert upstream.calls[-1] == ('AAPL', 'MSFT')
+
+
+def test_concurrent_misses_share_one_fetch(clock):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_fetch(ticker):
+        calls.append(ticker)
+        started.set()
+        release.wait(5)
+        return {'regularMarketPrice': 100}
+
+    cache = QuoteCache(slow_fetch, price_ttl=15)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('AAPL'))) for _ in range(8)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.misses < 8:  # every follower has joined the flight
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ['AAPL']
+    assert results == [{'regularMarketPrice': 100}] * 8
+
+
+def test_failing_upstream_serves_last_quote_as_stale(clock, upstream):
+    cache = QuoteCache(upstream.fetch, upstream.fetch_many, price_ttl=15)
+    cache.get('AAPL')
+    clock.now += 60
+    upstream.failing = True
+
+    assert cache.get('AAPL') == {'regularMarketPrice': 1, 'stale': True}
+    assert cache.get_many(['AAPL', 'MSFT']) == {'AAPL': {'regularMarketPrice': 1, 'stale': True}}
+    with pytest.raises(ConnectionError):
+        cache.get('MSFT')
+    assert cache.stats()['stale_served'] == 2
@@ -0,0 +1,91 @@
+"""Token bucket refill, circuit breaker state changes and per-ticker charging of batched provider calls,
+on a hand-driven clock."""
+from types import SimpleNamespace
+
+import pytest
+
+import resilience
+from market_data import ResilientProvider, StaticProvider
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, TokenBucket, UpstreamUnavailable
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(resilience, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_bucket_refills_at_rate_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert all(bucket.try_acquire() for _ in range(3))
+    assert not bucket.try_acquire()
+    clock.now += 0.5
+    assert bucket.try_acquire() and not bucket.try_acquire()
+    clock.now += 60
+    assert bucket.available() == 3
+    assert not bucket.try_acquire(4)  # larger than the bucket, never fits
+    assert bucket.try_acquire(3)
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()  # a single trial call at a time
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.trips == 2
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0 and breaker.allow()
+
+
+def quotes(*tickers):
+    return StaticProvider({ticker: {'regularMarketPrice': 100} for ticker in tickers})
+
+
+def test_batches_are_charged_per_ticker(clock):
+    provider = ResilientProvider(quotes('A', 'B', 'C', 'D', 'E'), TokenBucket(rate=1, capacity=3),
+                                 CircuitBreaker(failure_threshold=100))
+    # Three tokens cover the first three tickers, the rest of the batch is left out
+    assert set(provider.get_infos(['A', 'B', 'C', 'D', 'E'])) == {'A', 'B', 'C'}
+    assert provider.rejected == 1
+    with pytest.raises(UpstreamUnavailable):
+        provider.get_infos(['D', 'E'])
+    clock.now += 2
+    assert set(provider.get_infos(['D', 'E'])) == {'D', 'E'}
+
+
+def test_failed_tickers_count_towards_the_breaker(clock):
+    provider = ResilientProvider(quotes('A', 'B', 'C'), TokenBucket(rate=100, capacity=100),
+                                 CircuitBreaker(failure_threshold=3))
+    provider.get_infos(['A', 'B', 'C', 'X'])  # one unknown symbol in an answered batch
+    assert provider.breaker.state == CLOSED and provider.breaker.failures == 0
+
+    assert provider.get_infos(['X', 'Y', 'Z', 'A']) == {'A': {'regularMarketPrice': 100}}
+    assert provider.breaker.state == OPEN
+    with pytest.raises(UpstreamUnavailable):
+        provider.get_info('A')
+
+
+def test_rate_limited_call_does_not_use_up_the_trial(clock):
+    provider = ResilientProvider(quotes('A'), TokenBucket(rate=1, capacity=1), CircuitBreaker(failure_threshold=1))
+    with pytest.raises(LookupError):
+        provider.get_info('X')
+    assert provider.breaker.state == OPEN
+
+    clock.now += 30  # breaker ready for a trial, bucket refilled once ...
+    assert provider.rate_limiter.try_acquire()  # ... but someone else took the token
+    with pytest.raises(UpstreamUnavailable):
+        provider.get_info('A')
+    clock.now += 1
+    assert provider.get_info('A') == {'regularMarketPrice': 100}
+    assert provider.breaker.state == CLOSED
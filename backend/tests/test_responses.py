@@ -0,0 +1,47 @@
+"""Polled views answer 304 while the portfolio and its quotes are unchanged, and buffered JSON is compressed."""
+import gzip
+import json
+from decimal import Decimal
+
+from trading import apply_buy, execute_trade
+
+
+def test_portfolio_revalidates_until_a_trade(app, portfolio):
+    execute_trade(apply_buy, portfolio.id, 'AAPL', Decimal(5), Decimal(100))
+    client = app.test_client()
+    url = f'/portfolio?portfolio_id={portfolio.id}'
+
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+    again = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and again.data == b''
+    assert again.headers['ETag'] == first.headers['ETag']
+
+    trade = {'portfolio_id': portfolio.id, 'ticker': 'MSFT', 'quantity': 1, 'transaction_type': 'buy'}
+    assert client.post('/trade', json=trade).status_code == 200
+    changed = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
+
+
+def test_etag_is_per_url(app, portfolio):
+    client = app.test_client()
+    etag = client.get(f'/transactions/{portfolio.id}?limit=10').headers['ETag']
+    assert client.get(f'/transactions/{portfolio.id}?limit=10', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(f'/transactions/{portfolio.id}?limit=20', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_json_is_compressed_when_accepted(app, portfolio):
+    app.config['COMPRESSION_MIN_SIZE'] = 0
+    for ticker in ('AAPL', 'MSFT', 'VOO'):
+        execute_trade(apply_buy, portfolio.id, ticker, Decimal(1), Decimal(100))
+    client = app.test_client()
+    url = f'/portfolio?portfolio_id={portfolio.id}'
+
+    plain = client.get(url)
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] in ('gzip', 'br')
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    if compressed.headers['Content-Encoding'] == 'gzip':
+        assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
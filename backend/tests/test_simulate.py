@@ -0,0 +1,33 @@
+"""/simulate scenarios built on a portfolio replay its trades from the cash it really started with."""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import market_data
+from market_data import StaticProvider
+from models import db, Portfolio, Transaction
+from trading import apply_buy, execute_trade
+
+TODAY = date.today()
+
+
+def test_portfolio_scenario_starts_from_opening_cash(app):
+    days = [TODAY - timedelta(days=n) for n in range(1, 40)]
+    market_data.set_provider(StaticProvider({'VOO': {'regularMarketPrice': 400.0}}, {'VOO': {day: 400.0 for day in days}}))
+    portfolio = Portfolio(name='Seeded', cash_balance=Decimal('250000'))
+    db.session.add(portfolio)
+    db.session.commit()
+    # 160000 spent, more than the default 100000 the replay used to start from
+    execute_trade(apply_buy, portfolio.id, 'VOO', Decimal(400), Decimal(400))
+    Transaction.query.one().transaction_date = datetime.combine(TODAY - timedelta(days=20), datetime.min.time())
+    db.session.commit()
+
+    body = {'start_date': (TODAY - timedelta(days=30)).isoformat(), 'end_date': (TODAY - timedelta(days=1)).isoformat(),
+            'curves': False, 'scenarios': [{'name': 'as is', 'portfolio_id': portfolio.id}]}
+    result = app.test_client().post('/simulate', json=body).get_json()['scenarios'][0]
+    assert 'error' not in result
+    assert result['initial_cash'] == 250000
+    assert result['cash_balance'] == float(db.session.get(Portfolio, portfolio.id).cash_balance) == 90000
+
+    # An explicit initial_cash still wins
+    result = app.test_client().post('/simulate', json=dict(body, initial_cash=100000)).get_json()['scenarios'][0]
+    assert result['error'].startswith('Insufficient funds')
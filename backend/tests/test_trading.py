@@ -0,0 +1,47 @@
+"""Trades racing another worker on the same portfolio row are retried on the optimistic lock instead of
+overwriting its change, and give up with a 409 when the row never settles."""
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from aggregates import reconcile_aggregates
+from models import db, Portfolio, Transaction
+from trading import TradeError, apply_buy, execute_trade
+
+
+def concurrent_deposit(portfolio_id, amount):
+    # Another worker's committed change to the portfolio row, made behind the trade's back
+    with db.engine.begin() as connection:
+        connection.execute(text("UPDATE portfolios SET cash_balance = cash_balance + :amount, version = version + 1 "
+                                "WHERE id = :id"), {'amount': amount, 'id': portfolio_id})
+
+
+def test_lost_update_is_retried(app, portfolio):
+    attempts = []
+
+    def racing_buy(portfolio, *args):
+        attempts.append(portfolio.version)
+        if len(attempts) == 1:
+            concurrent_deposit(portfolio.id, 1000)
+        return apply_buy(portfolio, *args)
+
+    execute_trade(racing_buy, portfolio.id, 'AAPL', Decimal(5), Decimal(100))
+    assert len(attempts) == 2 and attempts[1] == attempts[0] + 1
+    db.session.expire_all()
+    assert db.session.get(Portfolio, portfolio.id).cash_balance == Decimal('10500')
+    assert Transaction.query.count() == 1
+    assert reconcile_aggregates(portfolio.id, fix=False) == []
+
+
+def test_endless_conflicts_end_in_409(app, portfolio, monkeypatch):
+    monkeypatch.setattr('trading.RETRY_BASE_DELAY', 0)
+
+    def always_racing_buy(portfolio, *args):
+        concurrent_deposit(portfolio.id, 0)
+        return apply_buy(portfolio, *args)
+
+    with pytest.raises(TradeError) as error:
+        execute_trade(always_racing_buy, portfolio.id, 'AAPL', Decimal(5), Decimal(100))
+    assert error.value.status == 409
+    assert Transaction.query.count() == 0
@@ -0,0 +1,52 @@
+"""Keyset pages of /transactions walk the whole log once, in order, also across rows sharing a timestamp."""
+from datetime import datetime
+from decimal import Decimal
+
+from models import db, Transaction
+
+
+def add_transactions(portfolio, dates):
+    for n, date in enumerate(dates):
+        db.session.add(Transaction(portfolio_id=portfolio.id, ticker='AAPL', transaction_type='buy',
+                                   quantity=Decimal(1), price=Decimal(100 + n), transaction_date=date))
+    db.session.commit()
+
+
+def test_cursor_pages_cover_every_row_once(app, portfolio):
+    # Several rows per timestamp, inserted out of date order
+    dates = [datetime(2024, 1, 1 + n % 4, 10) for n in range(23)]
+    add_transactions(portfolio, dates)
+    client = app.test_client()
+
+    seen, cursor = [], None
+    while True:
+        url = f'/transactions/{portfolio.id}?limit=5' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(url).get_json()
+        assert len(page['transactions']) <= 5
+        seen += page['transactions']
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert len(seen) == 23 and len({t['id'] for t in seen}) == 23
+    assert [(t['transaction_date'], t['id']) for t in seen] == sorted((t['transaction_date'], t['id']) for t in seen)
+    assert seen == client.get(f'/transactions/{portfolio.id}').get_json()
+
+
+def test_last_full_page_has_no_cursor(app, portfolio):
+    add_transactions(portfolio, [datetime(2024, 1, 1)] * 10)
+    client = app.test_client()
+    first = client.get(f'/transactions/{portfolio.id}?limit=5').get_json()
+    second = client.get(f'/transactions/{portfolio.id}?limit=5&cursor={first["next_cursor"]}').get_json()
+    assert len(second['transactions']) == 5 and second['next_cursor'] is None
+
+
+def test_filters_apply_to_pages(app, portfolio):
+    add_transactions(portfolio, [datetime(2024, 1, day) for day in range(1, 11)])
+    page = app.test_client().get(f'/transactions/{portfolio.id}?limit=3&start=2024-01-05&end=2024-01-06').get_json()
+    assert [t['transaction_date'][:10] for t in page['transactions']] == ['2024-01-05', '2024-01-06']
+    assert page['next_cursor'] is None
+
+
+def test_invalid_limit_is_rejected(app, portfolio):
+    assert app.test_client().get(f'/transactions/{portfolio.id}?limit=0').status_code == 400
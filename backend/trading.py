@@ -0,0 +1,227 @@
+import random
+import time
+from decimal import Decimal
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+
+import average_cost
+from models import db, Portfolio, Holding, Transaction
+from snapshots import record_snapshot
+from lots import LotError, default_lot_method, open_lot, close_lots
+from aggregates import holding_value, record_trade
+
+# Retry policy for trades that lost a race with a concurrent trade on the same portfolio
+RETRY_ATTEMPTS = 8
+RETRY_BASE_DELAY = 0.01  # seconds, doubled on every attempt plus jitter
+
+# Errors a concurrent trade can cause: stale version (lost update), duplicate holding insert, lock wait / deadlock
+RETRYABLE_ERRORS = (StaleDataError, IntegrityError, OperationalError)
+
+
+# Raised when an order is rejected (bad input, not enough cash / shares), message is safe to show to the user
+class TradeError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_order(data):
+    """Validate one order dict, returns (ticker, quantity, transaction_type)"""
+    ticker = (data.get('ticker') or '').upper()
+    quantity_str = data.get('quantity')
+    transaction_type = (data.get('transaction_type') or '').lower()
+
+    if not all([ticker, quantity_str, transaction_type]):
+        raise TradeError("Missing required fields: ticker, quantity, transaction_type")
+
+    # Validate quantity, make sure positive and numeric
+    try:
+        quantity = Decimal(str(quantity_str))
+        if not quantity.is_finite() or quantity <= 0:
+            raise ValueError()
+    except (ValueError, TypeError, ArithmeticError):
+        raise TradeError("Quantity must be a positive number")
+
+    # Make sure user only puts buy or sell as transaction type
+    if transaction_type not in ['buy', 'sell']:
+        raise TradeError("transaction_type must be 'buy' or 'sell'")
+
+    return ticker, quantity, transaction_type
+
+
+def execution_price(ticker, info):
+    """Price a trade may execute at from a quote info. Last-known quotes served while upstream is unavailable
+    (stale) are fine to display but never to trade at, they raise a 503 TradeError"""
+    if not info or not info.get('regularMarketPrice'):
+        raise TradeError(f"Invalid ticker symbol: {ticker}")
+    if info.get('stale'):
+        raise TradeError(f"Price for {ticker} is unavailable, please retry later", status=503)
+    return Decimal(str(info['regularMarketPrice']))
+
+
+def lock_portfolio(portfolio_id):
+    """Load a portfolio with SELECT ... FOR UPDATE, so trades on it are serialized until commit/rollback.
+    Databases without row locks (SQLite) still get protected by the version columns."""
+    return Portfolio.query.filter_by(id=portfolio_id).with_for_update().populate_existing().first()
+
+
+def run_with_retries(attempt, attempts=None, base_delay=None):
+    """Run attempt() (which does its own reads, writes and commit) and retry it with jittered
+    exponential backoff when it loses a race with another trade. TradeErrors are not retried,
+    running out of attempts raises a 409 TradeError so the client can resubmit."""
+    attempts = attempts or RETRY_ATTEMPTS
+    base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+    for number in range(1, attempts + 1):
+        try:
+            return attempt()
+        except RETRYABLE_ERRORS as e:
+            db.session.rollback()
+            if number == attempts:
+                raise TradeError(f"Portfolio is busy with other trades, please retry ({type(e).__name__})", status=409)
+            time.sleep(base_delay * (2 ** (number - 1)) * (0.5 + random.random()))
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def execute_trade(apply, portfolio_id, ticker, quantity, price, before_commit=None):
+    """Book one trade with apply (apply_buy / apply_sell) under the portfolio lock, keep today's snapshot current
+    and commit, re-running from scratch if a concurrent trade got in between. before_commit(portfolio, result)
+    runs inside the same DB transaction. Returns apply's response data, raises TradeError."""
+    def attempt():
+        portfolio = lock_portfolio(portfolio_id)
+        result, realized_pnl = apply(portfolio, ticker, quantity, price)
+
+        # Keep today's end-of-day snapshot current in the same DB transaction
+        record_snapshot(portfolio, datetime.now().date(), realized_pnl)
+        if before_commit is not None:
+            before_commit(portfolio, result)
+
+        db.session.commit()
+        return result
+
+    return run_with_retries(attempt)
+
+
+def find_holding(portfolio, ticker, holdings=None):
+    # holdings is an optional ticker -> Holding map preloaded by the caller (batch trades)
+    if holdings is not None:
+        return holdings.get(ticker)
+    return Holding.query.filter_by(portfolio_id=portfolio.id, ticker=ticker).first()
+
+
+def apply_buy(portfolio, ticker, quantity, price, holdings=None):
+    """Book a buy in the current DB transaction without committing, returns (response data, realized P&L)"""
+    total_cost = quantity * price
+    if portfolio.cash_balance < total_cost:
+        raise TradeError("Insufficient cash balance to complete the purchase")
+
+    portfolio.cash_balance -= total_cost
+
+    new_transaction = Transaction(
+        portfolio_id=portfolio.id,
+        ticker=ticker,
+        transaction_type='buy',
+        price=price,
+        quantity=quantity,
+        transaction_date=datetime.now()
+    )
+    db.session.add(new_transaction)
+    open_lot(portfolio, ticker, quantity, price, new_transaction)
+
+    holding = find_holding(portfolio, ticker, holdings)
+    value_before = holding_value(holding)
+    if holding:
+        new_total_quantity, new_total_value = average_cost.buy(holding.quantity, holding.quantity * holding.cost_basis,
+                                                               quantity, price)
+        holding.quantity = new_total_quantity
+        holding.cost_basis = new_total_value / new_total_quantity
+    else:
+        new_holding = Holding(
+            portfolio_id=portfolio.id,
+            ticker=ticker,
+            quantity=quantity,
+            cost_basis=price
+        )
+        db.session.add(new_holding)
+        if holdings is not None:
+            holdings[ticker] = new_holding
+    record_trade(portfolio, Decimal(0), holding_value(holding or new_holding) - value_before)
+
+    return {
+        "message": "Buy transaction successful",
+        "ticker": ticker,
+        "quantity": str(quantity),
+        "price": str(round(price, 4)),
+        "execution_price": str(round(price, 4)),  # Make it clear this is the execution price
+        "total_cost": str(round(quantity * price, 2)),
+        "new_cash_balance": str(round(portfolio.cash_balance, 4))
+    }, Decimal(0)
+
+
+def apply_sell(portfolio, ticker, quantity, price, holdings=None, lot_method=None, lot_ids=()):
+    """Book a sell in the current DB transaction without committing, returns (response data, realized P&L).
+    The sell's realized P&L is on the average cost basis, the one /pnl, the transaction log and the portfolio
+    totals use. The lots it closes (lot_method / lot_ids) carry their own tax lot P&L, reported separately as
+    lot_realized_pnl: the two differ whenever the lots were bought at different prices."""
+    holding = find_holding(portfolio, ticker, holdings)
+    if not holding:
+        raise TradeError(f"You do not own any shares of {ticker}")
+    if quantity > holding.quantity:
+        raise TradeError(f"Sell quantity ({quantity}) exceeds holding quantity ({int(holding.quantity)})")
+
+    portfolio.cash_balance += quantity * price
+    value_before = holding_value(holding)
+
+    # Calculate realized P&L
+    remaining_quantity, new_total_value, realized_pnl = average_cost.sell(holding.quantity, holding.cost_basis,
+                                                                          quantity, price)
+
+    new_transaction = Transaction(
+        portfolio_id=portfolio.id,
+        ticker=ticker,
+        transaction_type='sell',
+        price=price,
+        quantity=quantity,
+        realized_pnl=realized_pnl,
+        transaction_date=datetime.now()
+    )
+    db.session.add(new_transaction)
+    try:
+        lot_method = lot_method or default_lot_method()
+        closures = close_lots(portfolio, ticker, quantity, price, new_transaction, lot_method, lot_ids)
+    except LotError as e:
+        raise TradeError(str(e))
+
+    holding.quantity = remaining_quantity
+    if holding.quantity == 0:
+        db.session.delete(holding)
+        if holdings is not None:
+            holdings.pop(ticker, None)
+    else:
+        # Calculate updated cost basis based on average of all shares held
+        holding.cost_basis = new_total_value / holding.quantity
+    record_trade(portfolio, realized_pnl, (holding_value(holding) if holding.quantity else 0) - value_before)
+
+    return {
+        "message": "Sell transaction successful",
+        "ticker": ticker,
+        "quantity": str(quantity),
+        "price": str(round(price, 4)),
+        "execution_price": str(round(price, 4)),  # Make it clear this is the execution price
+        "total_proceeds": str(round(quantity * price, 2)),
+        "realized_pnl": str(round(realized_pnl, 2)),
+        "realized_pnl_basis": "average_cost",
+        "lot_method": lot_method,
+        "lot_realized_pnl": str(round(sum((closure.realized_pnl for closure in closures), Decimal(0)), 2)),
+        "lots": [{
+            "lot_id": closure.lot.id,
+            "quantity": str(closure.quantity),
+            "cost_per_share": str(round(closure.cost_per_share, 4)),
+            "realized_pnl": str(round(closure.realized_pnl, 2))
+        } for closure in closures],
+        "new_cash_balance": str(round(portfolio.cash_balance, 2))
+    }, realized_pnl
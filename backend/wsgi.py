@@ -0,0 +1,4 @@
+# WSGI entry point for production servers: gunicorn -c gunicorn.conf.py wsgi:app (run from the backend folder)
+from app import create_app
+
+app = create_app()
@@ -0,0 +1,56 @@
+import { useEffect, useRef } from "react";
+
+const STREAM_URL = "http://localhost:5001/stream/quotes";
+const RETRY_MIN_MS = 1000;
+const RETRY_MAX_MS = 30000;
+
+// Subscribes to the backend's Server-Sent Events quote stream instead of polling on a timer.
+// onQuotes receives { SYMBOL: { price, change, percent_change } } for the symbols whose price changed.
+// Held tickers and the market indices are always included, extra tickers can be watched as well.
+function useQuoteStream(onQuotes, tickers = []) {
+  const handlerRef = useRef(onQuotes);
+  handlerRef.current = onQuotes;
+
+  const tickerKey = tickers
+    .filter(Boolean)
+    .map((ticker) => ticker.toUpperCase())
+    .sort()
+    .join(",");
+
+  useEffect(() => {
+    const query = tickerKey ? `?tickers=${encodeURIComponent(tickerKey)}` : "";
+    let source = null;
+    let retryTimer = null;
+    let delay = RETRY_MIN_MS;
+    let stopped = false;
+
+    const connect = () => {
+      source = new EventSource(`${STREAM_URL}${query}`);
+      source.addEventListener("open", () => {
+        delay = RETRY_MIN_MS;
+      });
+      source.addEventListener("quotes", (event) => {
+        handlerRef.current(JSON.parse(event.data));
+      });
+      // EventSource only retries dropped connections by itself. An error response (503 when the server has
+      // too many open streams) closes it for good, so reconnect with exponential backoff and some jitter.
+      source.onerror = () => {
+        if (stopped || source.readyState !== EventSource.CLOSED) {
+          return;
+        }
+        source.close();
+        retryTimer = setTimeout(connect, delay + Math.random() * delay / 2);
+        delay = Math.min(delay * 2, RETRY_MAX_MS);
+      };
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      source.close();
+    };
+  }, [tickerKey]);
+}
+
+export default useQuoteStream;
@@ -12,6 +12,7 @@ import {
 } from "chart.js";
 import Tooltip from '@mui/material/Tooltip';
 import "./Home.css";
+import useQuoteStream from "../hooks/useQuoteStream";
 
 ChartJS.register(
   CategoryScale,
@@ -42,21 +43,16 @@ function Home() {
     fetchDailyHistory();
   }, [selectedDays]);
 
-  // Auto-refresh market indices every 4 seconds
-  useEffect(() => {
-    const interval = setInterval(() => {
+  // Refresh indices / portfolio only when the backend pushes a price change, instead of polling
+  useQuoteStream((quotes) => {
+    const symbols = Object.keys(quotes);
+    if (symbols.some((symbol) => symbol.startsWith("^"))) {
       fetchMarketIndices();
-    }, 4000);
-    return () => clearInterval(interval);
-  }, []);
-
-  // Auto-refresh portfolio data every 1 second for real-time updates
-  useEffect(() => {
-    const interval = setInterval(() => {
+    }
+    if (symbols.some((symbol) => !symbol.startsWith("^"))) {
       fetchPortfolioData();
-    }, 1000);
-    return () => clearInterval(interval);
-  }, []);
+    }
+  });
 
   const fetchMarketIndices = async () => {
     try {
@@ -72,35 +68,16 @@ function Home() {
 
   const fetchPortfolioData = async () => {
     try {
-      // Fetch portfolio data silently without loading state
-      const portfolioResponse = await fetch("http://localhost:5001/portfolio");
-      if (portfolioResponse.ok) {
-        const portfolioData = await portfolioResponse.json();
-        setPortfolio(portfolioData);
-      }
-
-      // Fetch P&L data 
-      const pnlResponse = await fetch("http://localhost:5001/pnl");
-      if (pnlResponse.ok) {
-        const pnlData = await pnlResponse.json();
-        setPnlData(pnlData);
-      }
-    } catch (err) {
-      console.log("Failed to fetch real-time portfolio data:", err.message);
-    }
-  };
-
-  const fetchSectorBreakdown = async () => {
-    try {
-      const response = await fetch(
-        "http://localhost:5001/portfolio/sector-breakdown"
-      );
+      // Portfolio, P&L and sectors come from one priced snapshot, fetched silently without loading state
+      const response = await fetch("http://localhost:5001/dashboard");
       if (response.ok) {
         const data = await response.json();
-        setSectorBreakdown(data);
+        setPortfolio(data.portfolio);
+        setPnlData(data.pnl);
+        setSectorBreakdown({ sectors: data.sectors });
       }
     } catch (err) {
-      console.log("Failed to fetch sector breakdown:", err.message);
+      console.log("Failed to fetch real-time portfolio data:", err.message);
     }
   };
 
@@ -123,25 +100,18 @@ function Home() {
     try {
       setLoading(true);
 
-      // Fetch portfolio data
-      const portfolioResponse = await fetch("http://localhost:5001/portfolio");
-      if (!portfolioResponse.ok) {
+      // Fetch portfolio, P&L and sector breakdown in one request
+      const response = await fetch("http://localhost:5001/dashboard");
+      if (!response.ok) {
         throw new Error("Failed to fetch portfolio");
       }
-      const portfolioData = await portfolioResponse.json();
-      setPortfolio(portfolioData);
-
-      // Fetch P&L data
-      const pnlResponse = await fetch("http://localhost:5001/pnl");
-      if (!pnlResponse.ok) {
-        throw new Error("Failed to fetch P&L data");
-      }
-      const pnlData = await pnlResponse.json();
-      setPnlData(pnlData);
+      const data = await response.json();
+      setPortfolio(data.portfolio);
+      setPnlData(data.pnl);
+      setSectorBreakdown({ sectors: data.sectors });
 
-      // Fetch market indices and sector breakdown
+      // Fetch market indices
       await fetchMarketIndices();
-      await fetchSectorBreakdown();
     } catch (err) {
       setError(err.message);
     } finally {
@@ -12,6 +12,7 @@ import {
 import Tooltip from '@mui/material/Tooltip';
 import { Line } from "react-chartjs-2";
 import "./ProfitLoss.css";
+import useQuoteStream from "../hooks/useQuoteStream";
 
 ChartJS.register(
   CategoryScale,
@@ -28,6 +29,7 @@ function ProfitLoss() {
   const [pnlData, setPnlData] = useState(null);
   const [historyData, setHistoryData] = useState(null);
   const [dailyHistoryData, setDailyHistoryData] = useState(null);
+  const [analytics, setAnalytics] = useState(null);
   const [selectedDays, setSelectedDays] = useState(30);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -40,14 +42,15 @@ function ProfitLoss() {
 
   useEffect(() => {
     fetchDailyHistory();
+    fetchAnalytics();
   }, [selectedDays]);
 
-  useEffect(() => {
-    const interval = setInterval(() => {
+  // Refresh portfolio and P&L when the backend pushes a price change for a held ticker
+  useQuoteStream((quotes) => {
+    if (Object.keys(quotes).some((symbol) => !symbol.startsWith("^"))) {
       fetchPortfolioData();
-    }, 1000);
-    return () => clearInterval(interval);
-  }, []);
+    }
+  });
 
   const fetchPortfolioData = async () => {
     try {
@@ -84,6 +87,26 @@ function ProfitLoss() {
     }
   };
 
+  // Risk / performance metrics over the same window, cached by the backend until the next trade
+  const fetchAnalytics = async () => {
+    try {
+      const response = await fetch(
+        `http://localhost:5001/portfolio/analytics?days=${selectedDays}`
+      );
+      if (response.ok) {
+        const data = await response.json();
+        setAnalytics(data.metrics);
+      }
+    } catch (err) {
+      console.log("Failed to fetch portfolio analytics:", err.message);
+    }
+  };
+
+  const formatRatio = (value, asPercentage = false) => {
+    if (value === null || value === undefined) return "N/A";
+    return asPercentage ? formatPercentage(value * 100) : value.toFixed(2);
+  };
+
   const fetchData = async () => {
     try {
       setLoading(true);
@@ -467,6 +490,41 @@ function ProfitLoss() {
         </div>
       </div>
 
+      {/* Risk & Performance Analytics */}
+      {analytics && (
+        <div className="breakdown-section">
+          <h3>Risk & Performance ({selectedDays} Days)</h3>
+          <div className="breakdown-grid">
+            <div className="breakdown-item">
+              <span className="breakdown-label">Time-Weighted Return:</span>
+              <span className={`breakdown-value ${getPnlColor(analytics.time_weighted_return || 0)}`}>
+                {formatRatio(analytics.time_weighted_return, true)}
+              </span>
+            </div>
+            <div className="breakdown-item">
+              <span className="breakdown-label">Annualized Volatility:</span>
+              <span className="breakdown-value">{formatRatio(analytics.annualized_volatility, true)}</span>
+            </div>
+            <div className="breakdown-item">
+              <span className="breakdown-label">Sharpe Ratio:</span>
+              <span className="breakdown-value">{formatRatio(analytics.sharpe_ratio)}</span>
+            </div>
+            <div className="breakdown-item">
+              <span className="breakdown-label">Max Drawdown:</span>
+              <span className="breakdown-value negative">{formatRatio(analytics.max_drawdown, true)}</span>
+            </div>
+            <div className="breakdown-item">
+              <span className="breakdown-label">Beta vs S&P 500:</span>
+              <span className="breakdown-value">{formatRatio(analytics.beta)}</span>
+            </div>
+            <div className="breakdown-item">
+              <span className="breakdown-label">Correlation vs S&P 500:</span>
+              <span className="breakdown-value">{formatRatio(analytics.correlation)}</span>
+            </div>
+          </div>
+        </div>
+      )}
+
       {/* Holdings Table */}
       {portfolio?.holdings && portfolio.holdings.length > 0 ? (
         <div className="holdings-section">
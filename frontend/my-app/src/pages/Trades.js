@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from "react";
 import "./Trades.css";
+import useQuoteStream from "../hooks/useQuoteStream";
 
 function Trades() {
   const [portfolio, setPortfolio] = useState(null);
@@ -11,6 +12,7 @@ function Trades() {
   const [searchResult, setSearchResult] = useState(null);
   const [searchError, setSearchError] = useState(null);
   const [searchLoading, setSearchLoading] = useState(false);
+  const [symbolSuggestions, setSymbolSuggestions] = useState([]);
   
   // Trade section state
   const [tradeTicker, setTradeTicker] = useState("");
@@ -40,73 +42,56 @@ function Trades() {
     fetchPortfolio();
   }, []);
 
-  // Auto-refresh prices every second
-  useEffect(() => {
-    const refreshInterval = setInterval(() => {
-      // Only refresh search result price if there's an active search
-      if (searchResult && searchResult.ticker) {
-        refreshSearchQuote(searchResult.ticker);
-      }
-      
-      // Only refresh trade quote price if there's an active trade ticker
-      if (tradeQuote && tradeTicker) {
-        refreshTradeQuote(tradeTicker);
-      }
+  // Live prices pushed by the backend instead of polling every second
+  useQuoteStream((quotes) => {
+    // Only refresh search result price if there's an active search
+    if (searchResult && searchResult.ticker && quotes[searchResult.ticker]) {
+      refreshSearchQuote(searchResult.ticker);
+    }
 
-      // Refresh portfolio holdings prices without full reload
-      if (portfolio && portfolio.holdings && portfolio.holdings.length > 0) {
-        refreshPortfolioHoldingsPrices();
-      }
-    }, 1000);
+    // Only refresh trade quote price if there's an active trade ticker
+    if (tradeQuote && tradeTicker && quotes[tradeTicker.toUpperCase()]) {
+      refreshTradeQuote(tradeTicker);
+    }
 
-    // Cleanup interval on component unmount
-    return () => clearInterval(refreshInterval);
-  }, [searchResult, tradeQuote, tradeTicker, portfolio]);
+    // Refresh portfolio holdings prices without full reload
+    if (portfolio && portfolio.holdings && portfolio.holdings.length > 0) {
+      refreshPortfolioHoldingsPrices(quotes);
+    }
+  }, [searchResult && searchResult.ticker, tradeQuote && tradeTicker]);
 
-  // Function to refresh only the current prices of portfolio holdings
-  const refreshPortfolioHoldingsPrices = async () => {
+  // Function to refresh only the current prices of portfolio holdings from streamed quotes
+  const refreshPortfolioHoldingsPrices = (quotes) => {
     if (!portfolio || !portfolio.holdings) return;
 
-    try {
-      const updatedHoldings = await Promise.all(
-        portfolio.holdings.map(async (holding) => {
-          try {
-            const response = await fetch(`http://localhost:5001/quote/${holding.ticker}`);
-            if (response.ok) {
-              const quoteData = await response.json();
-              const newCurrentPrice = quoteData.price;
-              const newMarketValue = holding.quantity * newCurrentPrice;
-              const newUnrealizedPnl = newMarketValue - (holding.quantity * holding.cost_basis);
-              
-              return {
-                ...holding,
-                current_price: newCurrentPrice,
-                market_value: newMarketValue,
-                unrealized_pnl: newUnrealizedPnl
-              };
-            }
-            return holding; // Return unchanged if API call fails
-          } catch (err) {
-            console.log(`Failed to refresh price for ${holding.ticker}:`, err.message);
-            return holding; // Return unchanged if error
-          }
-        })
-      );
-
-      // Calculate new total value
-      const newCashBalance = portfolio.cash_balance;
-      const newTotalHoldingsValue = updatedHoldings.reduce((sum, holding) => sum + holding.market_value, 0);
-      const newTotalValue = newCashBalance + newTotalHoldingsValue;
-
-      // Update portfolio state with new prices
-      setPortfolio(prev => ({
-        ...prev,
-        holdings: updatedHoldings,
-        total_value: newTotalValue
-      }));
-    } catch (err) {
-      console.log("Failed to refresh portfolio prices:", err.message);
-    }
+    const updatedHoldings = portfolio.holdings.map((holding) => {
+      const quote = quotes[holding.ticker];
+      if (!quote) {
+        return holding; // Price did not change
+      }
+      const newCurrentPrice = quote.price;
+      const newMarketValue = holding.quantity * newCurrentPrice;
+      const newUnrealizedPnl = newMarketValue - (holding.quantity * holding.cost_basis);
+
+      return {
+        ...holding,
+        current_price: newCurrentPrice,
+        market_value: newMarketValue,
+        unrealized_pnl: newUnrealizedPnl
+      };
+    });
+
+    // Calculate new total value
+    const newCashBalance = portfolio.cash_balance;
+    const newTotalHoldingsValue = updatedHoldings.reduce((sum, holding) => sum + holding.market_value, 0);
+    const newTotalValue = newCashBalance + newTotalHoldingsValue;
+
+    // Update portfolio state with new prices
+    setPortfolio(prev => ({
+      ...prev,
+      holdings: updatedHoldings,
+      total_value: newTotalValue
+    }));
   };
 
   // Function to refresh search quote without changing loading state
@@ -264,6 +249,28 @@ function Trades() {
     return () => clearTimeout(timeoutId);
   }, [tradeTicker]); 
 
+  // Autocomplete from the backend's local symbol directory, no market data lookups while typing
+  useEffect(() => {
+    if (!searchTicker.trim()) {
+      setSymbolSuggestions([]);
+      return;
+    }
+
+    const timeoutId = setTimeout(async () => {
+      try {
+        const response = await fetch(`http://localhost:5001/symbols?q=${encodeURIComponent(searchTicker)}&limit=8`);
+        if (response.ok) {
+          const data = await response.json();
+          setSymbolSuggestions(data.symbols);
+        }
+      } catch (err) {
+        console.log("Failed to fetch symbol suggestions:", err.message);
+      }
+    }, 150);
+
+    return () => clearTimeout(timeoutId);
+  }, [searchTicker]);
+
   const executeTrade = async (transactionType) => {
     if (!tradeTicker.trim() || !tradeQuantity.trim()) {
       setTradeError("Please enter both ticker and quantity");
@@ -513,12 +520,20 @@ function Trades() {
               onChange={(e) => setSearchTicker(e.target.value.toUpperCase())}
               placeholder="Enter ticker symbol (e.g., AAPL, GOOGL, MSFT)"
               className="search-input"
+              list="symbol-suggestions"
               onKeyDown={(e) => {
                 if (e.key === 'Enter') {
                   searchStock();
                 }
               }}
             />
+            <datalist id="symbol-suggestions">
+              {symbolSuggestions.map((symbol) => (
+                <option key={symbol.symbol} value={symbol.symbol}>
+                  {symbol.name}
+                </option>
+              ))}
+            </datalist>
             <div className="search-buttons">
               <button
                 onClick={searchStock}